@@ -0,0 +1,113 @@
+"""
+Engine benchmark: many small concurrent beat downloads, thread per download
+against the asyncio engine.
+
+    python benchmarks/bench_async.py --jobs 300 --size 256 --rate 128
+
+Each engine runs in its own process against the local server (redirect +
+throttled media, like Beatstars), so CPU time, peak RSS and thread counts
+are its own. Add --json for machine-readable output.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import server
+
+MARKER = "BENCH-RESULT "
+
+
+def _audio(path, tags):
+    # The beat after the tag reserved in front of it
+    with open(path, "rb") as f:
+        f.seek(tags.audio_offset(path))
+        return f.read()
+
+
+def child(args):
+    # Runs inside the measured process
+    os.environ["EMERGENCY_BEAT_CACHE"] = tempfile.mkdtemp()
+    os.environ["EMERGENCY_BEAT_STORE"] = "0"
+    os.environ["EMERGENCY_BEAT_LIBRARY"] = "0"
+    from src.core import aio, beatstars, tags, transport
+    from src.core.batch import Job, run_batch, run_batch_async
+
+    beatstars.STREAM_URL = (f"{args.url}/stream/{{song_id}}?size={args.size * 1024}"
+                            f"&rate={args.rate * 1024}")
+    jobs = [Job("beatstars", f"bench{i}") for i in range(args.jobs)]
+    peak_threads = [threading.active_count()]
+
+    def on_result(result):
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    with tempfile.TemporaryDirectory() as out:
+        wall, cpu = time.perf_counter(), time.process_time()
+        if args.engine == "async":
+            aio.configure(host_concurrency=args.jobs)
+            results = run_batch_async(jobs, concurrency=args.jobs, output_dir=out, on_result=on_result)
+        else:
+            transport.configure(pool_maxsize=args.jobs)
+            results = run_batch(jobs, workers=args.jobs, output_dir=out, on_result=on_result)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        ok = sum(1 for r in results if r.ok)
+        valid = all(_audio(r.path, tags) == server.payload(args.size * 1024) for r in results if r.ok)
+
+    print(MARKER + json.dumps({
+        "engine": args.engine, "jobs": args.jobs, "ok": ok, "valid": valid,
+        "seconds": wall, "cpu_seconds": cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_threads": peak_threads[0],
+    }), flush=True)
+
+
+def run_engine(engine, url, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--engine", engine, "--url", url,
+           "--jobs", str(args.jobs), "--size", str(args.size), "--rate", str(args.rate)]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError(f"{engine} run produced no result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=300, help="concurrent beat downloads")
+    parser.add_argument("--size", type=int, default=256, help="beat size in KB")
+    parser.add_argument("--rate", type=int, default=128, help="per-connection cap in KB/s (0: none)")
+    parser.add_argument("--engines", nargs="+", default=["threads", "async"])
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Same deterministic payloads as the server process
+        server.payload(args.size * 1024)
+        return child(args)
+
+    srv = server.start()
+    results = [run_engine(engine, server.base_url(srv), args) for engine in args.engines]
+    srv.shutdown()
+
+    if args.json:
+        print(json.dumps({"size_kb": args.size, "rate_kb": args.rate, "results": results}))
+        return
+    for r in results:
+        print(f"{r['engine']:>8}: {r['ok']}/{r['jobs']} ok in {r['seconds']:6.2f}s  "
+              f"CPU {r['cpu_seconds']:5.2f}s  peak RSS {r['peak_rss_mb']:6.1f} MB  "
+              f"threads {r['peak_threads']}" + ("" if r["valid"] else "  CORRUPTED"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Download benchmark suite: Beatstars downloads at several concurrencies and
+file sizes against the local stand-in server.
+
+    python benchmarks/bench_download.py --concurrency 1 8 32 --sizes 256 4096 \\
+        --jobs 64 --latency 20 --rate 0 --out results.json [--compare old.json]
+
+Every beat goes through the same code as the threaded batch engine
+(beatstars.download_beat): the /stream?id=...&return=audio redirect, then
+the CDN file with Range support. --latency delays every response, --rate
+caps every connection. Each (concurrency, size) cell runs in its own
+process, so its CPU time and peak RSS are its own, and reports throughput,
+p50/p99 job latency and the p50 of each download phase.
+
+The results are JSON (--out FILE, or --json for stdout) tagged with the
+commit they were measured on. --compare OLD prints the change per cell and
+exits with status 1 when throughput dropped or p99 latency grew by more
+than --tolerance percent.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import server
+
+MARKER = "BENCH-RESULT "
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def child(args):
+    # Runs inside the measured process
+    os.environ["EMERGENCY_BEAT_CACHE"] = tempfile.mkdtemp()
+    os.environ["EMERGENCY_BEAT_STORE"] = "0"
+    from src.core import beatstars, metrics, segmented, tags, transport
+
+    size = args.size * 1024
+    beatstars.STREAM_URL = (f"{args.url}/stream?id={{song_id}}&return=audio&size={size}"
+                            f"&rate={args.rate * 1024}&latency={args.latency}")
+    transport.configure(pool_maxsize=args.concurrency * segmented.CONNECTIONS)
+    expected = server.payload(size)
+    latencies = []
+
+    def download(i):
+        start = time.perf_counter()
+        try:
+            path = beatstars.download_beat(f"{args.concurrency}x{args.size}-{i}", f"beat{i}", out)
+        except Exception:
+            return False
+        latencies.append(time.perf_counter() - start)
+        with open(path, "rb") as f:
+            f.seek(tags.audio_offset(path))  # after the tag reserved in front of the beat
+            return f.read() == expected
+
+    with tempfile.TemporaryDirectory() as out:
+        wall, cpu = time.perf_counter(), time.process_time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(download, range(args.jobs)))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    phases = metrics.snapshot()["phases"]
+    ok = len(latencies)
+    print(MARKER + json.dumps({
+        "concurrency": args.concurrency, "size_kb": args.size, "jobs": args.jobs,
+        "ok": ok, "valid": all(outcomes),
+        "seconds": wall,
+        "throughput_mbps": ok * size / wall / (1024 * 1024),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "phases_p50_ms": {name: p["p50"] * 1000 for name, p in phases.items()},
+    }), flush=True)
+
+
+def run_cell(url, concurrency, size, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--url", url,
+           "--concurrency", str(concurrency), "--sizes", str(size), "--jobs", str(args.jobs),
+           "--rate", str(args.rate), "--latency", str(args.latency)]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError(f"cell {concurrency}x{size}KB produced no result")
+
+
+def commit():
+    """Commit the tree is at, with '-dirty' if it has local changes"""
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return head + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, tolerance):
+    """Print the change of every cell found in both runs; returns the regressed cells"""
+    before = {(r["concurrency"], r["size_kb"]): r for r in old["results"]}
+    regressions = []
+    print(f"compared with {old.get('commit') or 'unknown commit'}:")
+    for r in new["results"]:
+        base = before.get((r["concurrency"], r["size_kb"]))
+        if base is None:
+            continue
+        throughput = (r["throughput_mbps"] / base["throughput_mbps"] - 1) * 100 if base["throughput_mbps"] else 0.0
+        p99 = (r["p99_ms"] / base["p99_ms"] - 1) * 100 if base["p99_ms"] else 0.0
+        regressed = throughput < -tolerance or p99 > tolerance
+        if regressed:
+            regressions.append(r)
+        print(f"  {r['concurrency']:>4} x {r['size_kb']:>6} KB: throughput {throughput:+6.1f}%  "
+              f"p99 {p99:+6.1f}%" + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="downloads in flight")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 4096], help="beat sizes in KB")
+    parser.add_argument("--jobs", type=int, default=64, help="beats per cell")
+    parser.add_argument("--latency", type=float, default=20, help="server latency per response in ms")
+    parser.add_argument("--rate", type=int, default=0, help="per-connection cap in KB/s (0: none)")
+    parser.add_argument("--runs", type=int, default=1, help="runs per cell (the median throughput is kept)")
+    parser.add_argument("--out", metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=15,
+                        help="percent change in throughput or p99 reported as a regression")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.concurrency, args.size = args.concurrency[0], args.sizes[0]
+        return child(args)
+
+    srv = server.start()
+    results = []
+    for size in args.sizes:
+        for concurrency in args.concurrency:
+            runs = [run_cell(server.base_url(srv), concurrency, size, args) for _ in range(args.runs)]
+            results.append(sorted(runs, key=lambda r: r["throughput_mbps"])[(len(runs) - 1) // 2])
+    srv.shutdown()
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"jobs": args.jobs, "latency_ms": args.latency, "rate_kb": args.rate, "runs": args.runs},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for r in results:
+            phases = ", ".join(f"{name} {ms:.0f}" for name, ms in r["phases_p50_ms"].items())
+            print(f"{r['concurrency']:>4} x {r['size_kb']:>6} KB: {r['ok']}/{r['jobs']} ok "
+                  f"{r['throughput_mbps']:8.1f} MB/s  p50 {r['p50_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms  "
+                  f"CPU {r['cpu_seconds']:5.2f}s  RSS {r['peak_rss_mb']:6.1f} MB"
+                  + ("" if r["valid"] else "  CORRUPTED"))
+            print(f"{'':>19}phase p50 (ms): {phases}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        if compare(old, report, args.tolerance):
+            return 1
+    return 0 if all(r["ok"] == r["jobs"] and r["valid"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Library benchmark: scanning a folder of downloads into the library index,
+rescanning it unchanged, and searching it, with a time budget per query.
+
+    python benchmarks/bench_library.py --tracks 100000 --runs 3 [--budget 50]
+
+The tracks are small files with generated "artist - title" names in a
+temporary folder, indexed into a temporary library. Prints the time of
+each step; add --json for machine-readable output. Exits with status 1
+when a search or lookup takes longer than --budget milliseconds.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import library
+
+WORDS = ("dark trap drill lofi piano guitar night city rain summer drake travis future "
+         "melodic hard bounce type beat vibe sad love gold smoke wave storm ghost").split()
+QUERIES = ("dark trap", "drake type beat", "lo", "melodic piano night", "zzz nothing")
+
+
+def make_tracks(directory, count, seed=1):
+    rng = random.Random(seed)
+    for i in range(count):
+        folder = os.path.join(directory, f"{i % 100:02d}")
+        if i < 100:
+            os.makedirs(folder)
+        name = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+        with open(os.path.join(folder, f"{name} {i}.mp3"), "wb") as f:
+            f.write(os.urandom(64))
+
+
+def timed(function, runs=1):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100000, help="files in the library")
+    parser.add_argument("--runs", type=int, default=3, help="runs per query (the best is kept)")
+    parser.add_argument("--budget", type=float, default=50, help="milliseconds allowed per query")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench-library-")
+    try:
+        music = os.path.join(root, "music")
+        make_tracks(music, args.tracks)
+        index = library.Library(os.path.join(root, "index"))
+        steps = []
+        for name in ("scan", "rescan"):
+            seconds, counts = timed(lambda: index.scan(music))
+            steps.append({"step": name, "seconds": seconds, "read": counts[0], "ok": True})
+        for query in QUERIES:
+            seconds, found = timed(lambda: index.search(query), args.runs)
+            steps.append({"step": f"search {query!r}", "seconds": seconds, "found": len(found),
+                          "ok": seconds * 1000 <= args.budget})
+        index.add(os.path.join(music, "00", os.listdir(os.path.join(music, "00"))[0]),
+                  library.YOUTUBE, "dQw4w9WgXcQ")
+        seconds, found = timed(lambda: index.find(library.YOUTUBE, "dQw4w9WgXcQ"), args.runs)
+        steps.append({"step": "already have it", "seconds": seconds, "found": int(found is not None),
+                      "ok": seconds * 1000 <= args.budget})
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"tracks": args.tracks, "runs": args.runs, "budget_ms": args.budget,
+                          "results": steps}))
+    else:
+        for s in steps:
+            detail = f"{s['read']} files read" if "read" in s else f"{s['found']} found"
+            print(f"{s['step']:>30}: {s['seconds'] * 1000:9.1f} ms, {detail}"
+                  + ("" if s["ok"] else f"  OVER BUDGET ({args.budget:.0f} ms)"))
+    return 0 if all(s["ok"] for s in steps) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
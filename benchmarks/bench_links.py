@@ -0,0 +1,89 @@
+"""
+Link ingestion benchmark: links.extract over a large paste and a browser
+bookmarks export, with a time budget.
+
+    python benchmarks/bench_links.py --links 50000 --runs 3 [--budget 500]
+
+Prints the time and links per second for each input; add --json for
+machine-readable output. Exits with status 1 when an input takes longer
+than --budget milliseconds.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import links
+
+
+def make_links(count, duplicates=0.2, seed=1):
+    rng = random.Random(seed)
+    urls = []
+    for i in range(count):
+        if urls and rng.random() < duplicates:
+            urls.append(rng.choice(urls))
+        elif i % 2:
+            video = "%011d" % i
+            urls.append(rng.choice([f"https://www.youtube.com/watch?v={video}&t=42s",
+                                    f"https://youtu.be/{video}?si=share",
+                                    f"https://m.youtube.com/watch?feature=share&v={video}"]))
+        else:
+            urls.append(f"https://producer{i % 97}.beatstars.com/beat/dark-type-beat-{10000000 + i}")
+    return urls
+
+
+def paste(urls):
+    return "\n".join(f"check this {url} out" if i % 3 else url for i, url in enumerate(urls))
+
+
+def bookmarks(urls):
+    # Netscape bookmark format, as exported by every browser
+    lines = ["<!DOCTYPE NETSCAPE-Bookmark-file-1>", "<DL><p>"]
+    lines += [f'<DT><A HREF="{url.replace("&", "&amp;")}" ADD_DATE="1700000000">Beat {i}</A>'
+              for i, url in enumerate(urls)]
+    return "\n".join(lines + ["</DL><p>"])
+
+
+def measure(extract, text, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        found = extract(text)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--links", type=int, default=50000, help="links in each input")
+    parser.add_argument("--runs", type=int, default=3, help="runs per input (the best is kept)")
+    parser.add_argument("--budget", type=float, default=500, help="milliseconds allowed per input")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    urls = make_links(args.links)
+    inputs = {"paste": (paste(urls), True), "bookmarks": (bookmarks(urls), False)}
+    results = []
+    for name, (text, bare_ids) in inputs.items():
+        seconds, found = measure(lambda text: links.extract(text, bare_ids), text, args.runs)
+        results.append({"input": name, "links": args.links, "found": found, "seconds": seconds,
+                        "links_per_second": args.links / seconds, "mb": len(text) / (1024 * 1024),
+                        "ok": seconds * 1000 <= args.budget})
+
+    if args.json:
+        print(json.dumps({"runs": args.runs, "budget_ms": args.budget, "results": results}))
+    else:
+        for r in results:
+            print(f"{r['input']:>10}: {r['seconds'] * 1000:7.1f} ms for {r['links']} links "
+                  f"({r['mb']:.1f} MB), {r['links_per_second']:10,.0f} links/s, {r['found']} distinct"
+                  + ("" if r["ok"] else f"  OVER BUDGET ({args.budget:.0f} ms)"))
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
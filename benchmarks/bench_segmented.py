@@ -0,0 +1,76 @@
+"""
+Segmented download benchmark: throughput against the number of connections.
+
+    python benchmarks/bench_segmented.py --size 64 --rate 8 --connections 1 2 4 8
+
+The local server caps every connection at --rate MB/s, like a CDN throttling
+single streams, so the speedup shows how well segments are spread and stolen.
+Add --json for machine-readable output.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import server
+from src.core import transport
+from src.core.segmented import SegmentedDownload
+from src.core.writer import StreamWriter
+
+
+def download(url, path, size, connections):
+    def fetch(start, end):
+        return transport.get(url, stream=True, headers={"Range": f"bytes={start}-{end - 1}"})
+
+    with StreamWriter(path, size) as writer:
+        if connections > 1:
+            SegmentedDownload(writer, fetch, connections=connections).run()
+        else:
+            with transport.get(url, stream=True) as r:
+                writer.write_response(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="file size in MB")
+    parser.add_argument("--rate", type=float, default=8, help="per-connection cap in MB/s (0: none)")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    srv = server.start()
+    url = f"{server.base_url(srv)}/file/{size}?rate={int(args.rate * 1024 * 1024)}"
+    server.payload(size)
+    transport.configure(pool_maxsize=max(args.connections))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.bin")
+        for connections in args.connections:
+            started = time.perf_counter()
+            download(url, path, size, connections)
+            elapsed = time.perf_counter() - started
+            with open(path, "rb") as f:
+                assert f.read() == server.payload(size), "corrupted download"
+            os.remove(path)
+            results.append({"connections": connections, "seconds": elapsed,
+                            "mb_per_s": size / elapsed / (1024 * 1024)})
+    srv.shutdown()
+
+    baseline = results[0]["mb_per_s"]
+    for r in results:
+        r["speedup"] = r["mb_per_s"] / baseline
+    if args.json:
+        print(json.dumps({"size_bytes": size, "rate": args.rate, "results": results}))
+        return
+    for r in results:
+        print(f"{r['connections']:>3} connections: {r['mb_per_s']:8.1f} MB/s  x{r['speedup']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Startup benchmark: cold start of the common entry points, with a budget.
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget batch=400] [--json]
+
+Each scenario runs in a fresh interpreter with `-X importtime`. The median
+wall time of several runs is compared with its budget, and the modules it
+imported are checked against the ones it must not load (PyQt5 in headless
+runs; requests, asyncio and pytubefix before the window is shown). Exits
+with status 1 when a scenario is over budget or loads a forbidden module,
+so scripts and CI can enforce it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+# Shows the main window offscreen and exits as soon as it has been painted
+GUI_SCRIPT = """
+import sys
+sys.argv = ["main.py"]
+sys.path.insert(0, {root!r})
+import main
+from PyQt5.QtWidgets import QApplication
+from src.ui.app import EmergencyBeatApp
+app = QApplication(sys.argv)
+window = EmergencyBeatApp()
+window.show()
+app.processEvents()
+"""
+
+# What a one-beat batch imports before its first request
+BEATSTARS_SCRIPT = """
+import sys
+sys.argv = ["main.py", "--batch", {jobs!r}]
+sys.path.insert(0, {root!r})
+import main
+from src.core import batch, beatstars, retry, segmented, store, streams, transcode, transport
+"""
+
+# scenario -> (budget in ms, modules it must not import)
+SCENARIOS = {
+    "help": (150, ("PyQt5", "requests", "asyncio", "pytubefix")),
+    "batch": (400, ("PyQt5", "pytubefix", "asyncio")),
+    "beatstars": (400, ("PyQt5", "pytubefix", "asyncio")),
+    "gui": (600, ("requests", "asyncio", "pytubefix")),
+}
+
+
+def command(scenario, jobs_file):
+    if scenario == "help":
+        return [MAIN, "--help"]
+    if scenario == "batch":
+        return [MAIN, "--batch", jobs_file]
+    if scenario == "beatstars":
+        return ["-c", BEATSTARS_SCRIPT.format(root=ROOT, jobs=jobs_file)]
+    return ["-c", GUI_SCRIPT.format(root=ROOT)]
+
+
+def parse_importtime(stderr):
+    """
+    Return {module: (cumulative microseconds, nesting depth)} from
+    -X importtime output; depth 0 is an import made by the script itself
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            us = int(cumulative)
+        except ValueError:
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (us, depth)
+    return modules
+
+
+def run(scenario, jobs_file, runs):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONDONTWRITEBYTECODE="1")
+    cmd = [sys.executable, "-X", "importtime"] + command(scenario, jobs_file)
+    times = []
+    modules = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        done = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+        times.append((time.perf_counter() - start) * 1000)
+        if done.returncode != 0:
+            raise RuntimeError(f"{scenario} failed:\n{done.stderr[-2000:]}")
+        modules = parse_importtime(done.stderr)
+    roots = [(name, us) for name, (us, depth) in modules.items() if depth == 0]
+    top = sorted(roots, key=lambda item: -item[1])[:5]
+    return {
+        "scenario": scenario,
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "modules": len(modules),
+        "import_ms": sum(us for _, us in roots) / 1000,
+        "top_imports": [(name, us / 1000) for name, us in top],
+        "loaded": sorted(modules),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per scenario (median is kept)")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--budget", action="append", default=[], metavar="SCENARIO=MS",
+                        help="override a scenario's budget in milliseconds")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (budget, _) in SCENARIOS.items()}
+    for value in args.budget:
+        name, _, ms = value.partition("=")
+        budgets[name] = float(ms)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("# no jobs: measures startup only\n")
+        jobs_file = f.name
+    try:
+        results = [run(name, jobs_file, args.runs) for name in args.scenarios]
+    finally:
+        os.remove(jobs_file)
+
+    failed = False
+    for r in results:
+        forbidden = SCENARIOS[r["scenario"]][1]
+        r["budget_ms"] = budgets[r["scenario"]]
+        r["forbidden_loaded"] = [m for m in forbidden if m in r["loaded"]]
+        r["ok"] = r["median_ms"] <= r["budget_ms"] and not r["forbidden_loaded"]
+        failed = failed or not r["ok"]
+
+    if args.json:
+        for r in results:
+            del r["loaded"]
+        print(json.dumps({"runs": args.runs, "results": results}))
+    else:
+        for r in results:
+            top = ", ".join(f"{name} {ms:.0f}ms" for name, ms in r["top_imports"])
+            status = "ok" if r["ok"] else "OVER BUDGET" if not r["forbidden_loaded"] else \
+                "loads " + ", ".join(r["forbidden_loaded"])
+            print(f"{r['scenario']:>10}: {r['median_ms']:6.0f} ms (budget {r['budget_ms']:.0f})  "
+                  f"{r['modules']} modules, imports {r['import_ms']:.0f} ms  [{status}]")
+            print(f"{'':>12}top: {top}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
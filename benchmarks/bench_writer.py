@@ -0,0 +1,83 @@
+"""
+Streaming writer benchmark: the old 1 KB iter_content loop against StreamWriter.
+
+    python benchmarks/bench_writer.py --size 256 --runs 3
+
+Prints MB/s and CPU seconds per GB for both; add --json for machine-readable output.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import server
+from src.core import transport
+from src.core.writer import StreamWriter
+
+
+def legacy_save(url, path):
+    # The loop the Beatstars downloader used before StreamWriter
+    r = transport.get(url, stream=True)
+    with open(path, 'wb') as f:
+        for data in r.iter_content(1024):
+            f.write(data)
+    r.close()
+
+
+def writer_save(url, path):
+    with transport.get(url, stream=True) as r:
+        with StreamWriter(path, int(r.headers.get('content-length', 0))) as writer:
+            writer.write_response(r)
+
+
+def measure(save, url, path, size, runs):
+    best = None
+    for _ in range(runs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        save(url, path)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        os.remove(path)
+        result = {
+            "mb_per_s": size / wall / 1e6,
+            "cpu_s_per_gb": cpu / (size / 1e9),
+        }
+        if best is None or result["mb_per_s"] > best["mb_per_s"]:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MB")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    srv = server.start()
+    url = f"{server.base_url(srv)}/file/{size}"
+    server.payload(size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.bin")
+        results = {
+            "size_bytes": size,
+            "legacy": measure(legacy_save, url, path, size, args.runs),
+            "stream_writer": measure(writer_save, url, path, size, args.runs),
+        }
+    srv.shutdown()
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name in ("legacy", "stream_writer"):
+        r = results[name]
+        print(f"{name:>14}: {r['mb_per_s']:8.1f} MB/s  {r['cpu_s_per_gb']:6.2f} CPU s/GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Local stand-in HTTP server for benchmarks.
+Serves deterministic random payloads: GET /file/<size> returns <size> bytes.
+GET /stream?id=<id>&return=audio&size=<size> (the Beatstars stream endpoint,
+also /stream/<id>?size=<size>) answers with a 302 to /file/<size>, like the
+redirect to the CDN. Supports Range requests (with ETag/If-Range) and
+optional query parameters, passed on through the redirect:
+    rate=<bytes/s>   throttle each connection to this bandwidth
+    latency=<ms>     wait this long before answering (each request)
+"""
+import sys
+import time
+import random
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WRITE_CHUNK = 64 * 1024
+
+MPEG_FRAME = b"\xff\xfb\x90\x64"
+
+_payloads = {}
+_payloads_lock = threading.Lock()
+
+
+def payload(size):
+    """
+    Return (and memoize) a random payload of `size` bytes, the same in every
+    process. It starts like an MP3 frame so beats keep the tag reserved for them.
+    """
+    with _payloads_lock:
+        if size not in _payloads:
+            _payloads[size] = (MPEG_FRAME + random.Random(size).randbytes(size))[:size]
+        return _payloads[size]
+
+
+def parse_range(value, size):
+    """Parse a single 'bytes=start-end' header into (start, end inclusive)"""
+    try:
+        unit, spec = value.split("=", 1)
+        start, end = spec.split("-", 1)
+        if unit.strip() != "bytes" or "," in spec:
+            return None
+        if not start:
+            return max(0, size - int(end)), size - 1
+        return int(start), min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        latency = float(self.query.get("latency", 0))
+        if latency:
+            time.sleep(latency / 1000)
+        if url.path.startswith("/file/"):
+            self.send_file(payload(int(url.path[len("/file/"):])))
+        elif url.path == "/stream" or url.path.startswith("/stream/"):
+            self.send_redirect(url)
+        else:
+            self.send_error(404)
+
+    def send_redirect(self, url):
+        size = self.query.get("size", str(1024 * 1024))
+        passed = [f"{key}={self.query[key]}" for key in ("rate", "latency") if key in self.query]
+        location = f"/file/{size}"
+        if passed:
+            location += "?" + "&".join(passed)
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_file(self, data):
+        size = len(data)
+        etag = f'"{size}"'
+        start, end = 0, size - 1
+        ranged = self.headers.get("Range")
+        if ranged and self.headers.get("If-Range", etag) == etag:
+            parsed = parse_range(ranged, size)
+            if parsed is None or parsed[0] >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = parsed
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.write_body(memoryview(data)[start:end + 1])
+
+    def write_body(self, body):
+        rate = float(self.query.get("rate", 0))
+        try:
+            if not rate:
+                self.wfile.write(body)
+                return
+            # Per-connection bandwidth cap
+            started = time.monotonic()
+            for offset in range(0, len(body), WRITE_CHUNK):
+                self.wfile.write(body[offset:offset + WRITE_CHUNK])
+                ahead = (offset + WRITE_CHUNK) / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients close segments early when work is stolen from them
+            self.close_connection = True
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # hundreds of clients connect at once
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected, not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+def start(port=0):
+    """Start the server in a daemon thread and return it"""
+    server = Server(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_port}"
@@ -5,23 +5,280 @@ Main application entry point
 import sys
 import os
 import ssl
-from PyQt5.QtWidgets import QApplication
+import time
+import logging
+import argparse
 
 # Add the parent directory to path so we can import our modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import our modules
-from src.utils.pytube_fixes import apply_pytube_fix
-from src.ui.app import EmergencyBeatApp
+from src.core.ratelimit import parse_rate
 
 # Configure SSL
 ssl._create_default_https_context = ssl._create_unverified_context
 
-if __name__ == "__main__":
-    # Apply the Pytube fixes before using the library
-    apply_pytube_fix()
-    
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Emergency Beat Downloader")
+    parser.add_argument("--batch", metavar="JOBS_FILE",
+                        help="run headless: download every job listed in JOBS_FILE "
+                             "(one Beatstars ID/URL or YouTube video/playlist/channel URL per line, "
+                             "optional name after it)")
+    parser.add_argument("--links", metavar="FILE", action="append", default=[],
+                        help="run headless: download every Beatstars/YouTube link found in FILE "
+                             "(pasted text, or bookmarks/history exported as HTML; '-' reads stdin); "
+                             "can be repeated and combined with --batch")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of concurrent downloads in batch mode (default: 4)")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="batch download engine: a thread per download, or one asyncio "
+                             "event loop for hundreds of concurrent small downloads (default: threads)")
+    parser.add_argument("--output", metavar="DIR",
+                        help="directory for batch downloads (default: current directory)")
+    parser.add_argument("--progress", action="store_true",
+                        help="print per-job progress updates in batch mode")
+    parser.add_argument("--host-connections", type=int, metavar="N",
+                        help="requests in flight per host with --engine async (default: 64)")
+    parser.add_argument("--limit", metavar="RATE",
+                        help="total download bandwidth, e.g. 500k or 2M bytes per second, "
+                             "shared fairly between running downloads (default: unlimited)")
+    parser.add_argument("--host-limit", metavar="HOST=RATE", action="append", default=[],
+                        help="bandwidth cap for one host and its subdomains, e.g. "
+                             "beatstars.com=1M (repeatable)")
+    parser.add_argument("--resolve-workers", type=int, metavar="N",
+                        help="concurrent metadata lookups when expanding a playlist or channel (default: 8)")
+    parser.add_argument("--connections", type=int,
+                        help="parallel connections per large download (default: 4, 1 disables segmenting)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not reuse or keep downloads in the local download store")
+    parser.add_argument("--store-size", type=int, metavar="MB",
+                        help="maximum size of the download store (default: 2048)")
+    parser.add_argument("--store-hardlink", action="store_true",
+                        help="hardlink files from the store instead of copying them")
+    parser.add_argument("--pool-size", type=int,
+                        help="keep-alive connections kept per host (default: max(16, workers))")
+    parser.add_argument("--retries", type=int, metavar="N",
+                        help="attempts per download for transient failures (default: 4)")
+    parser.add_argument("--format", choices=["mp3", "m4a", "opus", "ogg", "flac", "wav"],
+                        help="convert YouTube audio to this format with ffmpeg while downloading (default: mp3)")
+    parser.add_argument("--bitrate", metavar="RATE",
+                        help="bitrate of the converted audio, e.g. 192k or 320k (default: 192k)")
+    parser.add_argument("--no-transcode", action="store_true",
+                        help="save the YouTube audio stream as is (.webm/.m4a)")
+    parser.add_argument("--encoders", type=int, metavar="N",
+                        help="ffmpeg processes running at once (default: number of CPUs)")
+    parser.add_argument("--prefer", metavar="FORMATS",
+                        help="YouTube audio formats in order of preference (default: opus,m4a)")
+    parser.add_argument("--abr", type=int, metavar="KBPS",
+                        help="pick the YouTube audio stream closest to this bitrate (default: highest)")
+    parser.add_argument("--max-abr", type=int, metavar="KBPS",
+                        help="never pick a YouTube audio stream above this bitrate")
+    parser.add_argument("--max-filesize", type=int, metavar="MB",
+                        help="never pick a YouTube stream larger than this")
+    parser.add_argument("--duplicates", choices=["keep", "link", "skip"],
+                        help="when a download is the same audio as an earlier one (e.g. a beat also "
+                             "uploaded to YouTube): keep both, replace it with a link to the earlier "
+                             "file, or delete it (default: keep; needs numpy and ffmpeg)")
+    parser.add_argument("--no-fingerprint", action="store_true",
+                        help="do not fingerprint downloads to detect duplicates")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="list the downloads in the library matching QUERY (words of the title, "
+                             "channel or file name, or a link) and exit")
+    parser.add_argument("--scan", metavar="DIR", action="append", default=[],
+                        help="add the audio files in DIR and its subfolders to the library "
+                             "(only new or changed files are read; repeatable)")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="do not download tracks that are already in the library")
+    parser.add_argument("--no-library", action="store_true",
+                        help="do not record downloads in the library")
+    parser.add_argument("--retag", action="store_true",
+                        help="write the title, artist, source URL and beat ID tags of every download in "
+                             "the library (MP3/M4A; edited in place, --workers files at a time) and exit")
+    parser.add_argument("--no-tags", action="store_true",
+                        help="do not tag downloaded files")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="append per-job phase timings, bytes and errors to PATH as JSON lines")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve counters and phase timings in the Prometheus text format "
+                             "at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--debug", action="store_true",
+                        help="log what each download is doing")
+    args = parser.parse_args(argv)
+    try:
+        args.limit = parse_rate(args.limit) if args.limit else None
+        args.host_limit = dict(_parse_host_limit(value) for value in args.host_limit)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def _parse_host_limit(value):
+    host, sep, rate = value.partition("=")
+    if not sep or not host:
+        raise ValueError(f"Invalid host limit: {value!r} (expected HOST=RATE)")
+    return host.strip(), parse_rate(rate)
+
+
+def setup_logging(debug):
+    # Warnings and errors only by default; --debug enables our own debug messages,
+    # not those of requests/urllib3
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    if debug:
+        logging.getLogger("src").setLevel(logging.DEBUG)
+
+
+def setup_metrics(args):
+    from src.core import metrics
+
+    metrics.configure(jsonl=args.metrics_file)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+
+def setup_fingerprint(args):
+    if not (args.duplicates or args.no_fingerprint):
+        return
+    from src.core import fingerprint
+    fingerprint.configure(enabled=False if args.no_fingerprint else None, action=args.duplicates)
+    if args.duplicates and not fingerprint.enabled():
+        logging.warning("numpy or ffmpeg not found: duplicates are not detected")
+
+
+def setup_library(args):
+    if not (args.skip_existing or args.no_library):
+        return
+    from src.core import library
+    library.configure(enabled=False if args.no_library else None, skip_existing=args.skip_existing or None)
+
+
+def setup_tags(args):
+    if args.no_tags:
+        from src.core import tags
+        tags.configure(enabled=False)
+
+
+def library_main(args):
+    # Headless like batch mode, without the download modules
+    from src.core import library
+
+    if library.get_library() is None:
+        logging.error("The library is disabled")
+        return 1
+    if args.scan:
+        start = time.monotonic()
+        changed, removed, unchanged = library.scan(args.scan)
+        print(f"Scanned in {time.monotonic() - start:.1f}s: {changed} new or changed, "
+              f"{removed} removed, {unchanged} unchanged")
+    if args.retag:
+        start = time.monotonic()
+        tagged, skipped, written = library.retag(workers=args.workers)
+        print(f"Tagged {tagged} files in {time.monotonic() - start:.1f}s "
+              f"({written / (1024 * 1024):.1f} MB written), {skipped} skipped")
+    if args.search is not None:
+        for entry in library.get_library().search(args.search):
+            print(library.format_entry(entry))
+    return 0
+
+
+def batch_main(args):
+    # Headless mode: only the Qt-free core is imported
+    from src.core import links, metrics, ratelimit, retry, segmented, store, streams, transcode, transport
+    from src.core.batch import (load_jobs, link_jobs, expand_jobs, run_batch, run_batch_async,
+                                format_result, format_progress, summarize)
+    from src.core.progress import BUS
+
+    setup_metrics(args)
+    setup_fingerprint(args)
+    setup_library(args)
+    setup_tags(args)
+    retry.configure(attempts=args.retries)
+    ratelimit.configure(limit=args.limit, host_limits=args.host_limit)
+    segmented.configure(connections=args.connections)
+    transcode.configure(format=args.format, bitrate=args.bitrate,
+                        enabled=False if args.no_transcode else None, processes=args.encoders)
+    store.configure(enabled=False if args.no_store else None,
+                    max_bytes=args.store_size * 1024 * 1024 if args.store_size else None,
+                    hardlink=args.store_hardlink or None)
+    streams.configure(prefer=args.prefer.split(",") if args.prefer else None,
+                      target_abr=args.abr, max_abr=args.max_abr,
+                      max_filesize=args.max_filesize * 1024 * 1024 if args.max_filesize else None)
+    transport.configure(pool_maxsize=args.pool_size or max(transport.POOL_MAXSIZE,
+                                                           args.workers * segmented.CONNECTIONS))
+    jobs = load_jobs(args.batch) if args.batch else []
+    if args.links:
+        found = {}
+        for path in args.links:
+            for link in links.extract(sys.stdin.read()) if path == "-" else links.read(path):
+                found.setdefault(link.key, link)
+        print(f"{len(found)} distinct links found in {', '.join(args.links)}", flush=True)
+        jobs += link_jobs(found.values())
+    if any(job.source == "youtube" for job in jobs):
+        # pytubefix itself is only imported (and fixed) by the first YouTube job
+        if not args.no_transcode and not transcode.enabled():
+            logging.warning("ffmpeg not found: YouTube audio is saved unconverted (.webm/.m4a)")
+
+    # Playlist and channel jobs expand into video jobs while the batch runs
+    jobs_by_id = {}
+
+    def expanded():
+        for job in expand_jobs(jobs, workers=args.resolve_workers):
+            jobs_by_id[job.id] = job
+            yield job
+
+    if args.progress:
+        # Same coalesced stream the GUI subscribes to
+        BUS.subscribe(lambda event: print(format_progress(jobs_by_id[event.job_id], event), flush=True))
+
+    start = time.monotonic()
+    on_result = lambda result: print(format_result(result), flush=True)
+    if args.engine == "async":
+        from src.core import aio
+        aio.configure(host_concurrency=args.host_connections)
+        results = run_batch_async(expanded(), concurrency=args.workers, output_dir=args.output,
+                                  on_result=on_result)
+    else:
+        results = run_batch(expanded(), workers=args.workers, output_dir=args.output,
+                            on_result=on_result)
+    print(summarize(results, time.monotonic() - start))
+    if args.engine == "async":
+        from src.core import aio
+        print(aio.format_stats())
+    else:
+        print(transport.format_stats())
+    print(retry.format_stats())
+    print(ratelimit.format_stats())
+    print(metrics.format_stats())
+    if any(job.source == "beatstars" for job in jobs):
+        from src.core.beatstars import format_resolve_stats
+        print(format_resolve_stats())
+    return 0 if all(result.ok for result in results) else 1
+
+
+def gui_main(args):
+    from PyQt5.QtWidgets import QApplication
+    from src.core import ratelimit
+    from src.ui.app import EmergencyBeatApp
+
+    # Bandwidth limits start from the command line and can be changed in the window
+    ratelimit.configure(limit=args.limit, host_limits=args.host_limit)
+    setup_metrics(args)
+    setup_fingerprint(args)
+    setup_library(args)
+    setup_tags(args)
+
     app = QApplication(sys.argv)
     window = EmergencyBeatApp()
     window.show()
-    sys.exit(app.exec_())
+    # The download modules (requests, asyncio, pytubefix) load once the window is up
+    window.preload()
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    setup_logging(args.debug)
+    if args.search is not None or args.scan or args.retag:
+        sys.exit(library_main(args))
+    if args.batch or args.links:
+        sys.exit(batch_main(args))
+    sys.exit(gui_main(args))
@@ -0,0 +1,408 @@
+"""
+asyncio download engine.
+A small HTTP/1.1 client on asyncio streams (keep-alive pools, chunked and
+Content-Length bodies, TLS) so hundreds of transfers can be in flight on a
+single thread instead of one OS thread per download. Requests to the same
+host are bounded by a per-host semaphore and go through the same circuit
+breakers as src.core.transport. LoopThread runs one shared event loop for
+callers that are not async themselves (the Qt UI).
+"""
+import ssl
+import asyncio
+import logging
+import weakref
+import threading
+import http.client
+from urllib.parse import urlsplit, urljoin
+
+from requests.structures import CaseInsensitiveDict
+
+from src.core import ratelimit, retry
+
+log = logging.getLogger(__name__)
+
+HOST_CONCURRENCY = 64   # in-flight requests per host
+IDLE_PER_HOST = 64      # keep-alive connections kept per host
+CONNECT_TIMEOUT = 15.0
+READ_TIMEOUT = 30.0
+READ_CHUNK = 64 * 1024
+WRITE_BUFFER = 1024 * 1024  # bytes of a body handed to the disk at once
+MAX_HEADER_BYTES = 64 * 1024
+USER_AGENT = "Mozilla/5.0"
+
+
+def configure(host_concurrency=None):
+    global HOST_CONCURRENCY
+    if host_concurrency:
+        HOST_CONCURRENCY = host_concurrency
+
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncResponse:
+    """
+    Response of AsyncClient.request with the attributes StreamWriter.begin()
+    reads from a requests.Response (status_code, headers, url). The body must
+    be consumed with read()/iter_chunks() or the response closed, which also
+    frees its slot of the host semaphore.
+    """
+
+    def __init__(self, client, conn, method, url, status, reason, headers, slot):
+        self.client = client
+        self.url = url
+        self.host = urlsplit(url).hostname
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self._conn = conn
+        self._slot = slot
+        self._keep_alive = headers.get("Connection", "").lower() != "close"
+        self._chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+        self._remaining = None  # Content-Length bytes left, None if unknown
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            self._remaining = 0
+        elif not self._chunked and headers.get("Content-Length") is not None:
+            self._remaining = int(headers["Content-Length"])
+        elif not self._chunked:
+            self._keep_alive = False  # body ends when the connection closes
+        self._chunk_left = 0
+        self._eof = self._remaining == 0
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    async def _read(self, n):
+        return await asyncio.wait_for(self._conn.reader.read(n), READ_TIMEOUT)
+
+    async def _readline(self):
+        return await asyncio.wait_for(self._conn.reader.readline(), READ_TIMEOUT)
+
+    async def _next_chunk(self, size):
+        if self._chunked:
+            if not self._chunk_left:
+                line = await self._readline()
+                if not line:
+                    raise http.client.IncompleteRead(b"")
+                self._chunk_left = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                if not self._chunk_left:
+                    # Last chunk: skip trailers up to the empty line
+                    while (await self._readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b""
+            data = await self._read(min(size, self._chunk_left))
+            if not data:
+                raise http.client.IncompleteRead(b"", self._chunk_left)
+            self._chunk_left -= len(data)
+            if not self._chunk_left:
+                await self._readline()  # CRLF after the chunk data
+            return data
+        if self._remaining is None:
+            return await self._read(size)
+        data = await self._read(min(size, self._remaining))
+        if not data:
+            raise http.client.IncompleteRead(b"", self._remaining)
+        self._remaining -= len(data)
+        return data
+
+    async def iter_chunks(self, size=READ_CHUNK):
+        """
+        Yield the body in chunks of at most `size` bytes, each charged to the
+        bandwidth limits of the host
+        """
+        try:
+            while not self._eof:
+                data = await self._next_chunk(ratelimit.chunk_size(self.host, size))
+                if not data:
+                    self._eof = True
+                    break
+                if self._remaining == 0:
+                    self._eof = True
+                yield data
+                await ratelimit.throttle_async(len(data), self.host)
+        except BaseException:
+            self.close()
+            raise
+        self.release()
+
+    async def read(self):
+        return b"".join([data async for data in self.iter_chunks()])
+
+    def release(self):
+        """Hand the connection back to the pool (body fully read) or close it"""
+        if self._conn is None:
+            return
+        if self._eof and self._keep_alive:
+            self.client._put_idle(self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+        self._slot.release()
+
+    def close(self):
+        """Release the response; a connection with unread body data is dropped"""
+        if self._conn is None:
+            return
+        if not self._eof:
+            self._keep_alive = False
+        self.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class AsyncClient:
+    """Keep-alive HTTP/1.1 client with a concurrency limit per host"""
+
+    def __init__(self, host_concurrency=None, verify=True):
+        self.host_concurrency = host_concurrency or HOST_CONCURRENCY
+        self._ssl = ssl.create_default_context()
+        if not verify:
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+        self._idle = {}
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        return self._semaphores[host]
+
+    def _put_idle(self, conn):
+        idle = self._idle.setdefault(conn.key, [])
+        if len(idle) < IDLE_PER_HOST and not conn.reader.at_eof():
+            idle.append(conn)
+        else:
+            conn.close()
+
+    async def _connect(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if not conn.reader.at_eof():
+                _count("hits")
+                return conn, True
+            conn.close()
+        _count("misses")
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._ssl if scheme == "https" else None,
+                                    limit=MAX_HEADER_BYTES),
+            CONNECT_TIMEOUT)
+        return _Connection(key, reader, writer), False
+
+    async def request(self, method, url, headers=None):
+        """Send a request and return the AsyncResponse once its headers are in"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        host = parts.hostname
+        port = parts.port or (443 if scheme == "https" else 80)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        # Bodies are written as they arrive, never decoded: ask for identity
+        request_headers = CaseInsensitiveDict({"Host": parts.netloc, "User-Agent": USER_AGENT})
+        request_headers.update(headers or {})
+        request_headers["Accept-Encoding"] = "identity"
+        lines = [f"{method} {target} HTTP/1.1"]
+        lines += [f"{name}: {value}" for name, value in request_headers.items()]
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        breaker = retry.breaker(host)
+        breaker.before()
+        slot = self._semaphore(host)
+        try:
+            await slot.acquire()
+        except BaseException:
+            breaker.release()
+            raise
+        try:
+            while True:
+                conn, reused = await self._connect((scheme, host, port))
+                try:
+                    conn.writer.write(payload)
+                    await conn.writer.drain()
+                    head = await asyncio.wait_for(conn.reader.readuntil(b"\r\n\r\n"), READ_TIMEOUT)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    conn.close()
+                    if reused:
+                        # The server closed the idle keep-alive connection: try a new one
+                        continue
+                    raise ConnectionError(f"Connection to {host} failed: {e}") from e
+                except BaseException:
+                    conn.close()
+                    raise
+            status, reason, response_headers = _parse_head(head)
+        except BaseException as e:
+            slot.release()
+            if isinstance(e, Exception):
+                retry.record(host, error=e)
+            else:
+                breaker.release()
+            raise
+        retry.record(host, status=status, headers=response_headers)
+        return AsyncResponse(self, conn, method, url, status, reason, response_headers, slot)
+
+    async def get(self, url, headers=None, allow_redirects=True, max_redirects=10):
+        response = await self.request("GET", url, headers)
+        while allow_redirects and response.status_code in (301, 302, 303, 307, 308) and max_redirects:
+            location = response.headers.get("Location")
+            if not location:
+                break
+            await response.read()
+            url = urljoin(url, location)
+            response = await self.request("GET", url, headers)
+            max_redirects -= 1
+        return response
+
+    async def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+
+def _parse_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        _, status, *reason = lines[0].split(" ", 2)
+        status = int(status)
+    except ValueError:
+        raise http.client.BadStatusLine(lines[0])
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip()] = value.strip()
+    return status, reason[0] if reason else "", headers
+
+
+async def call(operation, policy=None, description="request"):
+    """Async counterpart of retry.call: await `operation()` with retries"""
+    policy = policy or retry.DEFAULT_POLICY
+    policy.budget.deposit()
+    attempt = 1
+    while True:
+        try:
+            return await operation()
+        except Exception as e:
+            await asyncio.sleep(retry.retry_delay(e, attempt, policy, description))
+            attempt += 1
+
+
+async def to_thread(func, *args):
+    """
+    asyncio.to_thread whose cancellation waits for the thread to return, so
+    a stopped job no longer runs anything once its task is done (threads
+    see the stop through progress.BUS.cancel)
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        if not future.cancelled():
+            future.exception()  # JobCancelled, usually: retrieved, not logged
+        raise
+
+
+async def write_body(response, writer):
+    """
+    Copy the body of an AsyncResponse into a StreamWriter and return its
+    length. Chunks are gathered into WRITE_BUFFER bytes and written in a
+    worker thread (with the writer's progress reports and sidecar saves),
+    so the event loop never waits for the disk.
+    """
+    n = 0
+    pending = bytearray()
+    async for data in response.iter_chunks():
+        pending += data
+        n += len(data)
+        if len(pending) >= WRITE_BUFFER:
+            data, pending = pending, bytearray()
+            await to_thread(writer.write, data)
+    if pending:
+        await to_thread(writer.write, pending)
+    return n
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def client():
+    """The shared AsyncClient of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = AsyncClient()
+    return _clients[loop]
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def format_stats():
+    s = stats()
+    made = s["hits"] + s["misses"]
+    rate = 100.0 * s["hits"] / made if made else 0.0
+    return f"async connection reuse: {s['hits']}/{made} ({rate:.0f}%)"
+
+
+class LoopThread:
+    """
+    One event loop in a daemon thread, shared by synchronous callers.
+    submit() schedules a coroutine on it and returns a
+    concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="aio-loop", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def loop_thread():
+    """The shared LoopThread, started on first use"""
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = LoopThread()
+        return _loop_thread
@@ -0,0 +1,325 @@
+"""
+Headless batch runner.
+Runs many Beatstars/YouTube jobs concurrently through a bounded worker pool.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core import links, metrics, playlist, retry
+from src.core.errors import DownloadError
+from src.core.progress import new_job_id
+
+log = logging.getLogger(__name__)
+
+BEATSTARS = "beatstars"
+YOUTUBE = "youtube"
+
+
+class Job:
+    """A single download request parsed from a jobs file"""
+
+    def __init__(self, source, target, name=None):
+        self.source = source
+        self.target = target
+        self.name = name
+        self.id = new_job_id(source)  # progress bus key
+        self.error = None  # known failure, e.g. a video that could not be listed
+
+    def __repr__(self):
+        return f"Job({self.source}, {self.target!r})"
+
+
+class JobResult:
+    """
+    Outcome of a job: the saved path on success, otherwise the error message
+    and the typed DownloadError class it was classified as
+    """
+
+    def __init__(self, job, path=None, error=None, elapsed=0.0, error_type=None):
+        self.job = job
+        self.path = path
+        self.error = error
+        self.elapsed = elapsed
+        self.error_type = error_type
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def detect_source(target):
+    """Return the source a target (URL or bare ID) belongs to"""
+    link = links.classify(target)
+    if link is not None:
+        return BEATSTARS if link.kind == links.BEAT else YOUTUBE
+    if "youtube" in target or "youtu.be" in target:
+        return YOUTUBE
+    return BEATSTARS
+
+
+def parse_jobs(lines):
+    """
+    Parse jobs from text lines.
+    Each line is `<beatstars id/url | youtube url> [output name]`; YouTube
+    playlist and channel URLs are expanded by expand_jobs (the name is ignored).
+    Blank lines and lines starting with '#' are ignored.
+    """
+    jobs = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split(None, 1)
+        target = parts[0]
+        name = parts[1].strip() if len(parts) > 1 else None
+        jobs.append(Job(detect_source(target), target, name))
+    return jobs
+
+
+def load_jobs(path):
+    with open(path, encoding="utf-8") as f:
+        return parse_jobs(f)
+
+
+def link_jobs(found):
+    """
+    One job per link found by links.extract/links.read: beats by ID,
+    videos, playlists and channels by canonical URL
+    """
+    return [Job(BEATSTARS, link.id) if link.kind == links.BEAT else Job(YOUTUBE, link.url)
+            for link in found]
+
+
+def expand_jobs(jobs, workers=None):
+    """
+    Yield the jobs with every playlist/channel job replaced by one job per
+    video, as soon as each video's metadata is resolved.
+    """
+    for job in jobs:
+        if job.source != YOUTUBE or not playlist.is_collection(job.target):
+            yield job
+            continue
+        log.debug("Expanding %s", job.target)
+        try:
+            for video_id, meta, error in playlist.expand(job.target, workers):
+                video_job = Job(YOUTUBE, playlist.video_url(video_id))
+                if error is not None and not error.retryable:
+                    # Private, removed...: no point in trying to download it
+                    video_job.error = error
+                yield video_job
+        except Exception as e:
+            job.error = retry.classify(e)
+            yield job
+
+
+def run_job(job, output_dir=None):
+    """Run a single job and return its JobResult; never raises"""
+    with metrics.job(job.id, job.source, job.target) as record:
+        result = _run_job(job, output_dir)
+        if not result.ok:
+            record.fail(result.error_type or DownloadError)
+        return result
+
+
+def _run_job(job, output_dir):
+    start = time.monotonic()
+    try:
+        if job.error is not None:
+            raise job.error
+        existing = _existing(job)
+        if existing:
+            return JobResult(job, path=existing, elapsed=time.monotonic() - start)
+        meta = {}
+        if job.source == YOUTUBE:
+            from src.core import youtube
+            path = _rename(job, youtube.download_audio(job.target, output_dir, info=meta.update,
+                                                       job_id=job.id))
+        else:
+            from src.core import beatstars
+            with metrics.phase(metrics.EXTRACT):
+                song_id = beatstars.extract_id(job.target)
+            path = beatstars.download_beat(song_id, job.name or song_id, output_dir, job_id=job.id)
+        return JobResult(job, path=_finish(job, path, meta), elapsed=time.monotonic() - start)
+    except DownloadError as e:
+        return JobResult(job, error=str(e), elapsed=time.monotonic() - start,
+                         error_type=type(retry.classify(e)))
+    except Exception as e:
+        return JobResult(job, error=f"Unexpected error: {str(e)}", elapsed=time.monotonic() - start,
+                         error_type=type(retry.classify(e)))
+
+
+def _existing(job):
+    # With --skip-existing, a track already in the library is not downloaded again
+    from src.core import library
+    if not library.SKIP_EXISTING:
+        return None
+    path = library.have(job.target)
+    if path:
+        log.info("Already in the library: %s (%s)", job.target, path)
+        metrics.note(existing=True)
+    return path
+
+
+def _finish(job, path, meta):
+    # Fingerprinting and the library record of a saved file; neither raises
+    from src.core import fingerprint, library
+    path = fingerprint.process(path, fingerprint.track_key(job.target))
+    library.record(path, job.target, meta)
+    return path
+
+
+def _rename(job, path):
+    # Same renaming as the GUI does after a YouTube download
+    if not job.name:
+        return path
+    new_path = os.path.join(os.path.dirname(path), job.name + os.path.splitext(path)[1])
+    with metrics.phase(metrics.FINALIZE):
+        os.replace(path, new_path)
+    return new_path
+
+
+async def run_job_async(job, output_dir=None, info=None):
+    """
+    run_job on the asyncio engine; never raises. `info` receives the
+    video_info dict of YouTube jobs.
+    """
+    with metrics.job(job.id, job.source, job.target) as record:
+        result = await _run_job_async(job, output_dir, info)
+        if not result.ok:
+            record.fail(result.error_type or DownloadError)
+        return result
+
+
+async def _run_job_async(job, output_dir, info):
+    start = time.monotonic()
+    try:
+        if job.error is not None:
+            raise job.error
+        existing = _existing(job)
+        if existing:
+            return JobResult(job, path=existing, elapsed=time.monotonic() - start)
+        meta = {}
+
+        def on_info(details):
+            meta.update(details)
+            if info:
+                info(details)
+
+        if job.source == YOUTUBE:
+            from src.core import youtube
+            path = _rename(job, await youtube.download_audio_async(job.target, output_dir, info=on_info,
+                                                                        job_id=job.id))
+        else:
+            from src.core import beatstars
+            with metrics.phase(metrics.EXTRACT):
+                song_id = beatstars.extract_id(job.target)
+            path = await beatstars.download_beat_async(song_id, job.name or song_id, output_dir, job_id=job.id)
+        # Decoding, hashing and the index updates block: keep them off the loop
+        from src.core import aio
+        path = await aio.to_thread(_finish, job, path, meta)
+        return JobResult(job, path=path, elapsed=time.monotonic() - start)
+    except DownloadError as e:
+        return JobResult(job, error=str(e), elapsed=time.monotonic() - start,
+                         error_type=type(retry.classify(e)))
+    except Exception as e:
+        return JobResult(job, error=f"Unexpected error: {str(e)}", elapsed=time.monotonic() - start,
+                         error_type=type(retry.classify(e)))
+
+
+def run_batch_async(jobs, concurrency=100, output_dir=None, on_result=None):
+    """
+    run_batch on the asyncio engine: up to `concurrency` jobs in flight on
+    one event loop thread. Same arguments and result as run_batch.
+    """
+    import asyncio
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    return asyncio.run(_run_batch_async(jobs, concurrency, output_dir, on_result))
+
+
+async def _run_batch_async(jobs, concurrency, output_dir, on_result):
+    import asyncio
+
+    slots = asyncio.Semaphore(max(1, concurrency))
+    results = []
+    tasks = []
+
+    async def run(index, job):
+        try:
+            results[index] = await run_job_async(job, output_dir)
+        finally:
+            slots.release()
+        if on_result:
+            on_result(results[index])
+
+    jobs = iter(jobs)
+    while True:
+        # Generators (playlist expansion) may block: advance them off the loop
+        job = await asyncio.to_thread(next, jobs, None)
+        if job is None:
+            break
+        await slots.acquire()
+        results.append(None)
+        tasks.append(asyncio.create_task(run(len(results) - 1, job)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def run_batch(jobs, workers=4, output_dir=None, on_result=None):
+    """
+    Run jobs through a pool of `workers` threads.
+    `jobs` may be a generator (e.g. expand_jobs): each job starts as soon as
+    it is produced. `on_result` is called with each JobResult as soon as it
+    completes, from the worker thread that ran it.
+    Returns the results in job order.
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    lock = threading.Lock()
+
+    def run(index, job):
+        result = run_job(job, output_dir)
+        with lock:
+            results[index] = result
+        if on_result:
+            on_result(result)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for job in jobs:
+            with lock:
+                results.append(None)
+                index = len(results) - 1
+            pool.submit(run, index, job)
+    return results
+
+
+def format_result(result):
+    if result.ok:
+        return f"[OK] {result.job.target} -> {result.path} ({result.elapsed:.1f}s)"
+    if result.error_type and result.error_type is not DownloadError:
+        return f"[FAILED] {result.job.target}: {result.error} ({result.error_type.__name__})"
+    return f"[FAILED] {result.job.target}: {result.error}"
+
+
+def format_progress(job, event):
+    rate = event.rate / (1024 * 1024)
+    if event.total:
+        size = f"{event.downloaded / (1024 * 1024):.1f}/{event.total / (1024 * 1024):.1f} MB"
+    else:
+        size = f"{event.downloaded / (1024 * 1024):.1f} MB"
+    return f"  {job.target}: {event.percent}% {size} {rate:.2f} MB/s"
+
+
+def summarize(results, elapsed):
+    ok = sum(1 for r in results if r.ok)
+    failed = len(results) - ok
+    size = sum(os.path.getsize(r.path) for r in results if r.ok and os.path.exists(r.path))
+    rate = size / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    return (f"{len(results)} jobs: {ok} succeeded, {failed} failed "
+            f"in {elapsed:.1f}s ({size / (1024 * 1024):.1f} MB, {rate:.2f} MB/s)")
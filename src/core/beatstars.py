@@ -0,0 +1,454 @@
+"""
+Beatstars download logic, usable without Qt.
+Both the GUI thread and the batch runner call into this module.
+"""
+import os
+import time
+import logging
+import threading
+from urllib.parse import urljoin, urlsplit
+
+from src.core import links, metrics, ratelimit, retry, segmented, tags, transport
+from src.core.cache import TTLCache
+from src.core.errors import DownloadError, error_for_status
+from src.core.progress import BUS, new_job_id
+from src.core.store import get_store
+from src.core.writer import StreamWriter
+
+log = logging.getLogger(__name__)
+
+STREAM_URL = "https://main.v2.beatstars.com/stream?id={song_id}&return=audio"
+
+# Headers used to resolve the stream URL (simulate a browser navigation)
+RESOLVE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': 'audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.beatstars.com/',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'same-origin',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache',
+}
+
+# Headers used to download the media from the CDN
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': 'audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.beatstars.com/',
+    'Origin': 'https://www.beatstars.com',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-site',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache',
+}
+
+FORMAT_TYPE = "mp3"  # MP3 is the only available format
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Resolved CDN URLs are signed and eventually expire, keep them for 30 minutes
+RESOLVE_TTL = 30 * 60
+RESOLVE_CACHE = TTLCache("resolved_urls", ttl=RESOLVE_TTL, max_entries=4096)
+
+# Cache statistics: time saved is the resolve duration recorded with the entry
+_stats_lock = threading.Lock()
+RESOLVE_STATS = {"hits": 0, "misses": 0, "seconds_saved": 0.0}
+
+
+def extract_id(input_text):
+    """Extract the beat ID from a Beatstars URL, or return the input unchanged"""
+    return links.beat_id(input_text) or input_text
+
+
+def resolve(url):
+    """
+    Return the real media URL behind the stream URL.
+    Only the redirect itself is requested: the Location header is read and
+    the media body is never opened.
+    """
+    with transport.get(url, headers=RESOLVE_HEADERS, stream=True, allow_redirects=False) as r:
+        if r.status_code in REDIRECT_CODES and r.headers.get("Location"):
+            # Drain the (tiny) redirect body so the connection goes back to the pool
+            r.content
+            return urljoin(url, r.headers["Location"])
+        r.raise_for_status()
+        # No redirect: the stream URL serves the media directly
+        return url
+
+
+def resolve_beat(song_id, refresh=False):
+    """
+    Resolve the media URL of a beat, using the resolved URL cache.
+    Returns (url, from_cache).
+    """
+    cached = None if refresh else _cached_resolution(song_id)
+    if cached:
+        return cached, True
+
+    start = time.monotonic()
+    url = resolve(STREAM_URL.format(song_id=song_id))
+    _save_resolution(song_id, url, time.monotonic() - start)
+    return url, False
+
+
+def _cached_resolution(song_id):
+    cached = RESOLVE_CACHE.get(song_id)
+    if not cached:
+        return None
+    with _stats_lock:
+        RESOLVE_STATS["hits"] += 1
+        RESOLVE_STATS["seconds_saved"] += cached["seconds"]
+    log.debug("Resolved URL from cache (saved %.3fs)", cached["seconds"])
+    return cached["url"]
+
+
+def _save_resolution(song_id, url, seconds):
+    RESOLVE_CACHE.set(song_id, {"url": url, "seconds": seconds})
+    with _stats_lock:
+        RESOLVE_STATS["misses"] += 1
+
+
+async def resolve_async(client, url):
+    """resolve() on the asyncio engine"""
+    async with await client.request("GET", url, RESOLVE_HEADERS) as r:
+        if r.status_code in REDIRECT_CODES and r.headers.get("Location"):
+            await r.read()
+            return urljoin(url, r.headers["Location"])
+        if r.status_code >= 400:
+            raise error_for_status(r.status_code, f"{r.status_code} {r.reason} for url: {url}",
+                                   host=urlsplit(url).hostname)
+        return url
+
+
+async def resolve_beat_async(client, song_id, refresh=False):
+    """resolve_beat() on the asyncio engine, sharing its cache"""
+    cached = None if refresh else _cached_resolution(song_id)
+    if cached:
+        return cached, True
+
+    start = time.monotonic()
+    url = await resolve_async(client, STREAM_URL.format(song_id=song_id))
+    _save_resolution(song_id, url, time.monotonic() - start)
+    return url, False
+
+
+def resolve_stats():
+    with _stats_lock:
+        return dict(RESOLVE_STATS)
+
+
+def format_resolve_stats():
+    stats = resolve_stats()
+    return (f"resolve cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['seconds_saved']:.2f}s saved")
+
+
+def output_name(name, default="beat"):
+    """Return the output filename with the format extension appended"""
+    if not name:
+        return f"{default}.{FORMAT_TYPE}"
+    if not name.lower().endswith(f'.{FORMAT_TYPE}'):
+        return f"{name}.{FORMAT_TYPE}"
+    return name
+
+
+def beat_tags(song_id, name):
+    """Tags of a downloaded beat; its title is the file name"""
+    return tags.for_source("beatstars", song_id, title=os.path.splitext(os.path.basename(name))[0])
+
+
+def beat_header(song_id, name):
+    """StreamWriter header of a beat: its tag, unless the CDN serves something other than MP3"""
+    return lambda response: tags.header(name, beat_tags(song_id, name),
+                                        response.headers.get("Content-Type", ""))
+
+
+def download_beat(song_id, name=None, output_dir=None, job_id=None):
+    """
+    Download a beat and return the absolute path of the saved file.
+    Progress is published on the progress bus under `job_id`.
+    Raises DownloadError with a user-facing message on failure.
+    """
+    job_id = job_id or new_job_id("beatstars")
+    try:
+        # Transient failures are retried; each attempt resumes from the .part file
+        with ratelimit.job(job_id):
+            return retry.call(lambda: _download_beat(song_id, name, output_dir, job_id),
+                              description=f"Beat {song_id}")
+    finally:
+        BUS.finish(job_id)
+
+
+class BeatDownload:
+    """
+    The steps of one beat download, shared by the threaded and the asyncio
+    engines: prepare() (output name, store lookup) and finish() (commit,
+    tags, store update) block on the disk and SQLite; the resolve and the
+    transfer in between are fetch() or fetch_async().
+    """
+
+    def __init__(self, song_id, name, output_dir, job_id):
+        self.song_id = song_id
+        self.job_id = job_id
+        self.name = output_name(name)
+        if output_dir:
+            self.name = os.path.join(output_dir, self.name)
+        self.store = None
+        self.store_key = f"beatstars:{song_id}"
+        self.writer = None
+
+    @property
+    def path(self):
+        return os.path.abspath(self.name)
+
+    def report(self, value):
+        BUS.report(self.job_id, percent=value)
+
+    # Progress callback: 70-100% while saving the file
+    def on_chunk(self, downloaded, total_size):
+        percent = min(int(70 + 30 * (downloaded / total_size)), 100) if total_size > 0 else None
+        BUS.report(self.job_id, percent=percent, downloaded=downloaded, total=total_size)
+
+    def prepare(self):
+        """Validate the beat; returns True if the store already served it"""
+        if not self.song_id:
+            raise DownloadError("Please enter a valid Beat ID")
+
+        log.debug("Beat %s -> %s", self.song_id, self.name)
+
+        # Already downloaded: copy it from the store
+        self.store = get_store()
+        if self.store:
+            method = self.store.materialize(self.store_key, self.name)
+            if method:
+                log.debug("Served from the download store (%s)", method)
+                metrics.note(store=method)
+                # The stored copy carries the title of the name it was first saved under
+                tags.update(self.name, beat_tags(self.song_id, self.name))
+                self.report(100)
+                return True
+
+        # It seems the API has changed, use 'audio' instead of specific format type
+        # This will make the server determine the appropriate format
+        self.report(10)
+        return False
+
+    def resolved(self, real_url, from_cache):
+        metrics.note(resolve_cached=from_cache)
+        log.debug("Resolved %s to %s", self.song_id, real_url)
+        self.report(30)
+
+    def open_writer(self):
+        """
+        Open the .part writer, continuing a previous download of the same
+        beat if there is one, and return the headers of the CDN request.
+        The tag goes in front of the audio with room to edit it later.
+        """
+        self.writer = StreamWriter(self.name, progress=self.on_chunk, key=self.store_key,
+                                   header=beat_header(self.song_id, self.name))
+        try:
+            self.writer.open()
+        except Exception as e:
+            raise DownloadError(f"Error downloading file: {str(e)}") from e
+        headers = dict(DOWNLOAD_HEADERS)
+        headers.update(self.writer.range_headers())
+        if self.writer.written:
+            log.debug("Resuming download at byte %d", self.writer.written)
+        return headers
+
+    def check(self, r, real_url):
+        """Raise the typed error of a CDN response that carries no audio"""
+        if r.status_code not in (200, 206):
+            raise error_for_status(r.status_code, f"Error: Received status code {r.status_code}. The beat may be protected or not available for download.",
+                                   host=urlsplit(real_url).hostname,
+                                   retry_after=retry.parse_retry_after(r.headers.get("Retry-After")))
+
+    def fetch(self, real_url, from_cache):
+        """Download from the CDN, over several connections for large files"""
+        headers = self.open_writer()
+        writer = self.writer
+        try:
+            with metrics.phase(metrics.TRANSFER):
+                try:
+                    try:
+                        with metrics.phase(metrics.TTFB):
+                            r = transport.get(real_url, stream=True, headers=headers)
+                    except Exception:
+                        if not from_cache:
+                            raise
+                        r = None
+                    log.debug("GET %s: HTTP %s", real_url, r.status_code if r is not None else None)
+
+                    if from_cache and (r is None or r.status_code not in (200, 206)):
+                        # The cached signed URL is stale, resolve it again
+                        log.debug("Cached URL rejected, resolving again")
+                        if r is not None:
+                            r.close()
+                        with metrics.phase(metrics.RESOLVE):
+                            real_url, _ = resolve_beat(self.song_id, refresh=True)
+                        r = transport.get(real_url, stream=True, headers=headers)
+                        log.debug("GET %s: HTTP %s", real_url, r.status_code)
+                except Exception as e:
+                    raise DownloadError(f"Error downloading file: {str(e)}") from e
+
+                with r:
+                    if r.status_code not in (200, 206) and log.isEnabledFor(logging.DEBUG):
+                        log.debug("Bad response: HTTP %d, headers %s, body %r",
+                                  r.status_code, dict(r.headers), r.text[:500])
+                    self.check(r, real_url)
+                    self.report(50)
+
+                    try:
+                        writer.begin(r)
+                        remaining = writer.total - writer.resume_offset
+                        if writer.total and segmented.should_split(remaining, r.headers.get("Accept-Ranges") == "bytes"):
+                            log.debug("Downloading %d bytes over %d connections", remaining, segmented.CONNECTIONS)
+                            range_headers = dict(DOWNLOAD_HEADERS)
+                            if writer.validator:
+                                range_headers["If-Range"] = writer.validator
+
+                            def fetch(start, end):
+                                headers = dict(range_headers, Range=f"bytes={start}-{end - 1}")
+                                return transport.get(real_url, stream=True, headers=headers)
+
+                            segmented.SegmentedDownload(writer, fetch, first_response=r).run()
+                        else:
+                            writer.write_response(r)
+                    except Exception as e:
+                        raise DownloadError(f"Error downloading file: {str(e)}") from e
+        except BaseException:
+            # Keeps the partial file and its sidecar for the next attempt
+            writer.abort()
+            raise
+
+    async def fetch_async(self, client, real_url, from_cache):
+        """
+        fetch() on the event loop through `client`. Large files are handed
+        to fetch() in a thread for its segmented transfer.
+        """
+        from src.core import aio
+
+        headers = self.open_writer()
+        writer = self.writer
+        try:
+            with metrics.phase(metrics.TRANSFER):
+                try:
+                    try:
+                        with metrics.phase(metrics.TTFB):
+                            r = await client.request("GET", real_url, headers)
+                    except Exception:
+                        if not from_cache:
+                            raise
+                        r = None
+                    if from_cache and (r is None or r.status_code not in (200, 206)):
+                        # The cached signed URL is stale, resolve it again
+                        log.debug("Cached URL rejected, resolving again")
+                        if r is not None:
+                            r.close()
+                        with metrics.phase(metrics.RESOLVE):
+                            real_url, _ = await resolve_beat_async(client, self.song_id, refresh=True)
+                        r = await client.request("GET", real_url, headers)
+                except Exception as e:
+                    raise DownloadError(f"Error downloading file: {str(e)}") from e
+
+                async with r:
+                    self.check(r, real_url)
+                    split = segmented.should_split(int(r.headers.get("Content-Length") or 0),
+                                                   r.headers.get("Accept-Ranges") == "bytes")
+                    if not split:
+                        self.report(50)
+                        try:
+                            writer.begin(r)
+                            await aio.write_body(r, writer)
+                        except Exception as e:
+                            raise DownloadError(f"Error downloading file: {str(e)}") from e
+        except BaseException:
+            # Keeps the partial file and its sidecar for the next attempt
+            writer.abort()
+            raise
+
+        if split:
+            # Nothing was written: the threaded transfer continues from the same .part file
+            writer.abort()
+            await aio.to_thread(self.fetch, real_url, False)
+
+    def finish(self):
+        """Move the file into place, settle its tag and add it to the store"""
+        try:
+            self.writer.commit()
+        except Exception as e:
+            raise DownloadError(f"Error downloading file: {str(e)}") from e
+        tags.settle(self.name, beat_tags(self.song_id, self.name))
+
+        if self.store:
+            try:
+                with metrics.phase(metrics.STORE):
+                    self.store.add(self.name, self.store_key)
+            except Exception as e:
+                log.warning("Could not add %s to the store: %s", self.store_key, e)
+
+        self.report(100)
+        return self.path
+
+
+def _download_beat(song_id, name, output_dir, job_id):
+    job = BeatDownload(song_id, name, output_dir, job_id)
+    if job.prepare():
+        return job.path
+
+    # Get real URL
+    try:
+        with metrics.phase(metrics.RESOLVE):
+            real_url, from_cache = resolve_beat(song_id)
+    except Exception as e:
+        log.debug("Failed to resolve URL: %s", e)
+        raise DownloadError(f"Error resolving URL: {str(e)}") from e
+    job.resolved(real_url, from_cache)
+
+    job.fetch(real_url, from_cache)
+    return job.finish()
+
+
+async def download_beat_async(song_id, name=None, output_dir=None, job_id=None, client=None):
+    """
+    download_beat on the asyncio engine: the resolve and the transfer run on
+    the event loop through `client` (default: the aio.AsyncClient of the
+    running loop), so hundreds of beats can be in flight on one thread.
+    The disk work of BeatDownload runs in worker threads.
+    """
+    # The asyncio engine is only imported by the code that uses it
+    from src.core import aio
+
+    job_id = job_id or new_job_id("beatstars")
+    client = client or aio.client()
+    try:
+        with ratelimit.job(job_id):
+            return await aio.call(lambda: _download_beat_async(client, song_id, name, output_dir, job_id),
+                                  description=f"Beat {song_id}")
+    finally:
+        BUS.finish(job_id)
+
+
+async def _download_beat_async(client, song_id, name, output_dir, job_id):
+    from src.core import aio
+
+    job = BeatDownload(song_id, name, output_dir, job_id)
+    if await aio.to_thread(job.prepare):
+        return job.path
+
+    try:
+        with metrics.phase(metrics.RESOLVE):
+            real_url, from_cache = await resolve_beat_async(client, song_id)
+    except Exception as e:
+        log.debug("Failed to resolve URL: %s", e)
+        raise DownloadError(f"Error resolving URL: {str(e)}") from e
+    job.resolved(real_url, from_cache)
+
+    await job.fetch_async(client, real_url, from_cache)
+    return await aio.to_thread(job.finish)
@@ -0,0 +1,161 @@
+"""
+Small persistent key/value caches with TTL and LRU eviction.
+Entries live in memory and are saved to a JSON file in the user cache
+directory so they survive restarts: at most every SAVE_INTERVAL seconds and
+at exit, merged with the entries other processes saved meanwhile.
+"""
+import atexit
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+SAVE_INTERVAL = 5.0  # seconds between writes of a changed cache
+
+
+def cache_dir(*parts):
+    """Return (and create) a directory under the application cache folder"""
+    base = os.environ.get("EMERGENCY_BEAT_CACHE")
+    if not base:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(xdg, "emergency-beat")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class TTLCache:
+    """
+    Thread-safe mapping of string keys to JSON-serializable values.
+    Entries expire after `ttl` seconds (overridable per entry) and the least
+    recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, name, ttl, max_entries=1024, persist=True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = os.path.join(cache_dir(), f"{name}.json") if persist else None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time, in snapshot order
+        self._entries = None  # key -> [expires_at, value], loaded lazily
+        self._dirty = False
+        self._deleted = set()  # keys not to take back from the file
+        self._cleared = False
+        self._saved_at = time.monotonic()
+        if self.path:
+            atexit.register(self.flush)
+
+    def _read(self):
+        # Unexpired entries of the file, oldest first
+        entries = OrderedDict()
+        if not self.path or not os.path.exists(self.path):
+            return entries
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for key, (expires_at, value) in data.items():
+                if expires_at > now:
+                    entries[key] = [expires_at, value]
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        return entries
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+
+    def _changed(self):
+        # Called with the lock held; True when the caller should flush()
+        self._dirty = True
+        now = time.monotonic()
+        if now - self._saved_at < SAVE_INTERVAL:
+            return False
+        self._saved_at = now
+        return True
+
+    def flush(self):
+        """
+        Write pending changes, merged with what other processes saved since:
+        their entries are kept unless deleted here, and the later expiry wins
+        """
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = OrderedDict(self._entries)
+                deleted, cleared = self._deleted, self._cleared
+                self._dirty, self._deleted, self._cleared = False, set(), False
+                self._saved_at = time.monotonic()
+            merged = OrderedDict()
+            on_disk = OrderedDict() if cleared else self._read()
+            # Entries only on disk count as less recently used than ours
+            for key, entry in on_disk.items():
+                if key not in entries and key not in deleted:
+                    merged[key] = entry
+            for key, entry in entries.items():
+                other = on_disk.get(key)
+                merged[key] = other if other is not None and other[0] > entry[0] else entry
+            while len(merged) > self.max_entries:
+                merged.popitem(last=False)
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(merged, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                log.warning("Could not write cache %s: %s", self.path, e)
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._load()
+            self._entries[key] = [time.time() + (self.ttl if ttl is None else ttl), value]
+            self._entries.move_to_end(key)
+            self._deleted.discard(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            save = self._changed()
+        if save:
+            self.flush()
+
+    def delete(self, key):
+        with self._lock:
+            self._load()
+            if self._entries.pop(key, None) is None:
+                return
+            self._deleted.add(key)
+            save = self._changed()
+        if save:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._deleted = set()
+            self._cleared = True
+            self._dirty = True
+        self.flush()
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
@@ -0,0 +1,58 @@
+# Exceptions shared by the Qt-free download core
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed; the message is user-facing"""
+
+    # Whether trying again later may succeed
+    retryable = False
+
+    def __init__(self, message, status=None, host=None, retry_after=None):
+        super().__init__(message)
+        self.status = status            # HTTP status, when the failure was a response
+        self.host = host
+        self.retry_after = retry_after  # seconds the server asked us to wait
+
+
+class TransientError(DownloadError):
+    """Server errors, timeouts and dropped connections"""
+    retryable = True
+
+
+class ThrottledError(TransientError):
+    """The host is rate limiting us (HTTP 429)"""
+
+
+class CircuitOpenError(ThrottledError):
+    """Requests to the host are paused after repeated failures"""
+
+
+class ForbiddenError(DownloadError):
+    """HTTP 403: protected content or an expired signed URL"""
+
+
+class NotFoundError(DownloadError):
+    """HTTP 404/410"""
+
+
+class UnavailableError(DownloadError):
+    """The video exists but cannot be downloaded (private, removed, age-restricted...)"""
+
+
+class JobCancelled(DownloadError):
+    """The job was paused or cancelled (raised in the threads doing its work)"""
+
+
+def error_for_status(status, message, host=None, retry_after=None):
+    """Return the DownloadError subclass instance matching an HTTP status"""
+    if status == 429:
+        cls = ThrottledError
+    elif status >= 500 or status == 408:
+        cls = TransientError
+    elif status == 403:
+        cls = ForbiddenError
+    elif status in (404, 410):
+        cls = NotFoundError
+    else:
+        cls = DownloadError
+    return cls(message, status=status, host=host, retry_after=retry_after)
@@ -0,0 +1,337 @@
+"""
+Audio fingerprints to find the same track downloaded from different sources.
+A finished download is decoded by ffmpeg to low-rate mono PCM and analyzed
+with NumPy over all frames at once (framed FFT of the whole signal):
+
+- the fingerprint: one 32-bit word per frame, the signs of the band energy
+  differences between neighbouring bands and consecutive frames. Two
+  encodings of the same audio differ in few bits (the bit error rate).
+- the lookup hashes: pairs of spectral peaks (frequency, frequency, time
+  between them) packed into an integer. They do not depend on where the
+  track starts and survive re-encoding.
+
+The index (SQLite) keeps each track's fingerprint and its hashes in a
+B-tree, so a lookup is a few hundred index probes whatever the library
+size. Tracks sharing many hashes at a consistent time offset are then
+compared bit by bit at that offset.
+
+NumPy and ffmpeg are optional: without them downloads are not fingerprinted.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+import subprocess
+
+from src.core import links, metrics, transcode
+from src.core.cache import cache_dir
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RATE = 5512
+FRAME = 2048         # samples per frame (0.37s)
+HOP = 512            # samples between frames (93ms)
+BANDS = 33           # 32 band differences -> 32 bits per frame
+LOW_HZ, HIGH_HZ = 300, 2000
+MAX_SECONDS = 90     # audio fingerprinted from the start of each file
+PEAK_FRAMES = 24     # a peak is the loudest bin within +-2.2s...
+PEAK_BINS = 32       # ...and +-86Hz
+PEAK_LEVEL = 2.0     # and this far (log power) above the median
+FAN_OUT = 3          # following peaks each peak is paired with
+MAX_DT = 40          # frames between the two peaks of a pair (3.7s)
+MIN_VOTES = 12       # hashes shared at one offset before comparing bits
+MIN_OVERLAP = 64     # frames two fingerprints must share to be compared
+MAX_BER = 0.35       # bit error rate under which two tracks are the same
+
+ENABLED = True   # fingerprint downloads when NumPy and ffmpeg are available
+ACTION = "keep"  # what to do with a duplicate: keep, link or skip
+ACTIONS = ("keep", "link", "skip")
+
+_numpy = None
+_window = None
+_band_bins = None
+
+
+class Fingerprint:
+    """The analysis of one track: bit fingerprint and peak-pair hashes"""
+
+    def __init__(self, prints, hashes, times):
+        self.prints = prints  # uint32 per frame
+        self.hashes = hashes  # peak-pair hashes...
+        self.times = times    # ...and the frame of their first peak
+
+
+class Match:
+    """An earlier download of the same audio"""
+
+    def __init__(self, key, path, ber, offset):
+        self.key = key
+        self.path = path
+        self.ber = ber
+        self.offset = offset  # frames into the earlier track where the new one starts
+
+    def __repr__(self):
+        return f"Match({self.key!r}, {self.path!r}, ber={self.ber:.3f})"
+
+
+def configure(enabled=None, action=None):
+    global ENABLED, ACTION
+    if enabled is not None:
+        ENABLED = enabled
+    if action:
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown duplicate action: {action}")
+        ACTION = action
+
+
+def load_numpy():
+    """The numpy module, or None when it is not installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def enabled():
+    """Whether downloads are fingerprinted (requested, NumPy and ffmpeg found)"""
+    return ENABLED and load_numpy() is not None and transcode.find_ffmpeg() is not None
+
+
+def track_key(target):
+    """Identity of a download target for the index, e.g. 'video:dQw4w9WgXcQ'"""
+    link = links.classify(target)
+    return f"{link.kind}:{link.id}" if link is not None else target
+
+
+def decode(path, seconds=MAX_SECONDS):
+    """The first `seconds` of an audio file as float32 mono samples at SAMPLE_RATE"""
+    np = load_numpy()
+    cmd = [transcode.find_ffmpeg(), "-v", "error", "-nostdin", "-i", path, "-t", str(seconds),
+           "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    done = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if done.returncode != 0:
+        raise ValueError(done.stderr.decode(errors="replace").strip() or "ffmpeg could not decode the file")
+    return np.frombuffer(done.stdout, dtype="<i2").astype(np.float32) / 32768
+
+
+def _tables():
+    global _window, _band_bins
+    np = load_numpy()
+    if _window is None:
+        _window = np.hanning(FRAME).astype(np.float32)
+        # Logarithmically spaced bands, as FFT bin indices
+        edges = np.geomspace(LOW_HZ, HIGH_HZ, BANDS + 1)
+        _band_bins = np.round(edges * FRAME / SAMPLE_RATE).astype(np.intp)
+    return _window, _band_bins
+
+
+def _max_filter(a, size, axis):
+    # Maximum over +-size along one axis
+    np = load_numpy()
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (size, size)
+    padded = np.pad(a, pad, constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * size + 1, axis=axis).max(axis=-1)
+
+
+def compute(samples):
+    """Fingerprint of float32 mono samples at SAMPLE_RATE"""
+    np = load_numpy()
+    window, bins = _tables()
+    if len(samples) < FRAME + HOP:
+        empty = np.zeros(0, dtype=np.uint32)
+        return Fingerprint(empty, empty.astype(np.int64), empty.astype(np.int64))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::HOP] * window
+    power = np.abs(np.fft.rfft(frames, axis=1))[:, bins[0]:bins[-1]] ** 2
+
+    # One bit per band pair: did the energy difference grow since the last frame
+    energy = np.add.reduceat(power, bins[:-1] - bins[0], axis=1)
+    bands = energy[:, :-1] - energy[:, 1:]
+    bits = (bands[1:] - bands[:-1]) > 0
+    prints = np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel()
+
+    # Peaks of the spectrogram, each paired with the next few ones
+    spectrum = np.log(power + 1e-10)
+    local_max = _max_filter(_max_filter(spectrum, PEAK_FRAMES, 0), PEAK_BINS, 1)
+    t, f = np.nonzero((spectrum == local_max) & (spectrum > np.median(spectrum) + PEAK_LEVEL))
+    hashes, times = [], []
+    for k in range(1, FAN_OUT + 1):
+        dt = t[k:] - t[:-k]
+        pair = (dt > 0) & (dt <= MAX_DT)
+        # Half-bin frequencies (5.4Hz) tolerate small shifts between encodings
+        hashes.append((((f[:-k] >> 1) << 16) | ((f[k:] >> 1) << 6) | dt)[pair])
+        times.append(t[:-k][pair])
+    return Fingerprint(prints, np.concatenate(hashes).astype(np.int64), np.concatenate(times).astype(np.int64))
+
+
+def fingerprint_file(path):
+    return compute(decode(path))
+
+
+def bit_error_rate(a, b, offset):
+    """Fraction of differing bits where `b`, shifted by `offset` frames, overlaps `a`"""
+    np = load_numpy()
+    start_a, start_b = max(0, offset), max(0, -offset)
+    n = min(len(a) - start_a, len(b) - start_b)
+    if n < MIN_OVERLAP:
+        return 1.0
+    diff = np.bitwise_xor(a[start_a:start_a + n], b[start_b:start_b + n])
+    return np.unpackbits(diff.view(np.uint8)).sum() / (n * 32)
+
+
+class Index:
+    """SQLite index of track fingerprints, looked up by peak-pair hashes"""
+
+    def __init__(self, root=None):
+        self.root = root or cache_dir("fingerprints")
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, "index.sqlite"),
+                                   check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS tracks ("
+                             "id INTEGER PRIMARY KEY, key TEXT UNIQUE, path TEXT, added REAL, prints BLOB)")
+            # Clustered by hash: a lookup reads only the matching rows
+            self._db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                             "hash INTEGER, track INTEGER, time INTEGER, "
+                             "PRIMARY KEY (hash, track, time)) WITHOUT ROWID")
+            self._db.execute("CREATE INDEX IF NOT EXISTS hashes_track ON hashes (track)")
+
+    def add(self, key, path, fingerprint):
+        """Index a track's fingerprint under `key` (replacing an earlier one)"""
+        with self._lock:
+            with self._db:
+                self._remove(key)
+                track = self._db.execute("INSERT INTO tracks (key, path, added, prints) VALUES (?, ?, ?, ?)",
+                                         (key, path, time.time(), fingerprint.prints.tobytes())).lastrowid
+                self._db.executemany("INSERT OR IGNORE INTO hashes VALUES (?, ?, ?)",
+                                     ((h, track, t) for h, t in zip(fingerprint.hashes.tolist(),
+                                                                    fingerprint.times.tolist())))
+
+    def remove(self, key):
+        with self._lock:
+            with self._db:
+                self._remove(key)
+
+    def _remove(self, key):
+        row = self._db.execute("SELECT id FROM tracks WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM hashes WHERE track = ?", row)
+            self._db.execute("DELETE FROM tracks WHERE id = ?", row)
+
+    def match(self, fingerprint, exclude=None):
+        """The closest indexed track to a fingerprint (not `exclude`), or None"""
+        np = load_numpy()
+        at = {}
+        for h, t in zip(fingerprint.hashes.tolist(), fingerprint.times.tolist()):
+            at.setdefault(h, []).append(t)
+        # Hashes shared with each track, by time offset between the two tracks
+        votes = {}
+        keys = list(at)
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute("SELECT hash, track, time FROM hashes WHERE hash IN (%s)"
+                                        % ",".join("?" * len(chunk)), chunk).fetchall()
+                for h, track, t in rows:
+                    for query_t in at[h]:
+                        candidate = (track, t - query_t)
+                        votes[candidate] = votes.get(candidate, 0) + 1
+        candidates = sorted((n, candidate) for candidate, n in votes.items() if n >= MIN_VOTES)
+        best = None
+        for _, (track, offset) in reversed(candidates[-5:]):
+            with self._lock:
+                row = self._db.execute("SELECT key, path, prints FROM tracks WHERE id = ?", (track,)).fetchone()
+            if row is None or row[0] == exclude:
+                continue
+            prints = np.frombuffer(row[2], dtype=np.uint32)
+            # The peaks only place the tracks within a frame of each other
+            ber = min(bit_error_rate(prints, fingerprint.prints, offset + d) for d in (-1, 0, 1))
+            if ber <= MAX_BER and (best is None or ber < best.ber):
+                best = Match(row[0], row[1], ber, offset)
+        return best
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = Index()
+        return _index
+
+
+def check(path, key):
+    """
+    Fingerprint a finished download and index it under `key`; returns the
+    Match of an earlier download of the same audio (under another key), or None
+    """
+    fingerprint = fingerprint_file(path)
+    index = get_index()
+    match = index.match(fingerprint, exclude=key)
+    if match is not None and (not os.path.exists(match.path) or os.path.samefile(path, match.path)):
+        # Deleted or moved since, or overwritten by this download (two
+        # downloads saved under one name): this download is the copy to keep
+        index.remove(match.key)
+        match = None
+    if match is None:
+        index.add(key, os.path.abspath(path), fingerprint)
+    return match
+
+
+def process(path, key):
+    """
+    The fingerprinting stage of a download: index `path`, and apply ACTION
+    when it duplicates an earlier download. Returns the path the download
+    ends up at (the earlier file when skipped). Never raises.
+    """
+    if not enabled():
+        return path
+    try:
+        with metrics.phase(metrics.FINGERPRINT):
+            match = check(path, key)
+    except Exception as e:
+        log.warning("Could not fingerprint %s: %s", path, e)
+        return path
+    if match is None:
+        return path
+    log.info("%s is the same audio as %s (%s, %.0f%% bits differ)",
+             path, match.path, match.key, match.ber * 100)
+    metrics.note(duplicate_of=match.key)
+    metrics.count("duplicates_total", action=ACTION)
+    if ACTION == "skip":
+        os.remove(path)
+        return match.path
+    if ACTION == "link":
+        return _link(path, match.path)
+    return path
+
+
+def _link(path, earlier):
+    # Same name as the download, the earlier file's format and data
+    target = os.path.splitext(path)[0] + os.path.splitext(earlier)[1]
+    tmp = target + ".link.tmp"
+    try:
+        try:
+            os.link(earlier, tmp)
+        except OSError:
+            os.symlink(os.path.abspath(earlier), tmp)
+        os.replace(tmp, target)
+    except OSError as e:
+        log.warning("Could not link %s to %s: %s", path, earlier, e)
+        return path
+    if target != path:
+        os.remove(path)
+    return target
@@ -0,0 +1,323 @@
+"""
+Download job queue.
+Jobs wait in a priority queue (higher priority first, then in the order they
+were added) and at most `concurrency` of them run at once on the shared
+asyncio loop thread. Jobs can be paused, resumed, cancelled and retried;
+a paused job keeps its .part file and resumes from it. A stopped job keeps
+its slot until the threads working for it (an ffmpeg feed, pytubefix) have
+seen the stop and returned, so a resumed job never runs twice.
+Playlist and channel jobs are listed in a background thread and add one job
+per video as each one is resolved.
+
+Listeners such as the GUI poll changes() instead of receiving a callback per
+update, so queueing thousands of jobs or hundreds of progress updates per
+second costs one refresh per poll.
+"""
+import heapq
+import itertools
+import threading
+
+from src.core import batch, playlist, retry
+from src.core.progress import BUS
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+LISTING = "listing"  # playlist/channel being expanded
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Priorities
+LOW = -1
+NORMAL = 0
+HIGH = 1
+
+CONCURRENCY = 4
+
+
+def _loop_thread():
+    # The asyncio engine loads with the first job, not when the window opens
+    from src.core import aio
+    return aio.loop_thread()
+
+
+class QueuedJob:
+    """A batch.Job with its place and state in the queue"""
+
+    def __init__(self, job, priority, output_dir, seq, row):
+        self.job = job
+        self.priority = priority
+        self.output_dir = output_dir
+        self.seq = seq
+        self.row = row  # index in JobQueue.entries
+        self.state = QUEUED
+        self.percent = 0
+        self.rate = 0.0  # bytes per second while running
+        self.title = None  # video title once known
+        self.info = None  # video_info dict of YouTube jobs
+        self.result = None  # batch.JobResult of the last run
+        self.listed = 0  # videos added by a playlist/channel job
+        self.stop_as = None  # PAUSED or CANCELLED while a running job stops
+        self.task = None
+
+    @property
+    def collection(self):
+        return self.job.source == batch.YOUTUBE and playlist.is_collection(self.job.target)
+
+    @property
+    def error(self):
+        return self.result.error if self.result else None
+
+    def __repr__(self):
+        return f"QueuedJob({self.job.target!r}, {self.state})"
+
+
+class JobQueue:
+    """
+    Priority queue of download jobs run `concurrency` at a time.
+    Every method is thread-safe; jobs run on aio.loop_thread().
+    """
+
+    def __init__(self, concurrency=None, output_dir=None):
+        self.concurrency = concurrency or CONCURRENCY
+        self.output_dir = output_dir
+        self.entries = []
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._by_job_id = {}
+        self._added = []
+        self._changed = set()
+        self._lock = threading.RLock()
+        BUS.subscribe(self._on_progress)
+
+    def close(self):
+        """Stop every job; the queue cannot be used afterwards"""
+        BUS.unsubscribe(self._on_progress)
+        self.cancel(self.entries)
+
+    # Adding jobs
+
+    def add(self, job, priority=NORMAL, output_dir=None):
+        return self.add_many([job], priority, output_dir)[0]
+
+    def add_many(self, jobs, priority=NORMAL, output_dir=None):
+        """Queue jobs and return their QueuedJob entries"""
+        output_dir = output_dir or self.output_dir
+        with self._lock:
+            added = []
+            for job in jobs:
+                entry = QueuedJob(job, priority, output_dir, next(self._seq), len(self.entries))
+                self.entries.append(entry)
+                self._by_job_id[job.id] = entry
+                added.append(entry)
+                if entry.collection:
+                    self._list(entry)
+                else:
+                    self._push(entry)
+            self._added.extend(added)
+            self._schedule()
+        return added
+
+    def _push(self, entry):
+        entry.state = QUEUED
+        heapq.heappush(self._heap, (-entry.priority, entry.seq, entry))
+
+    # Controls
+
+    def pause(self, entries):
+        """Keep queued jobs from starting and stop running ones (their .part is kept)"""
+        self._stop(entries, PAUSED, (QUEUED, RUNNING))
+
+    def cancel(self, entries):
+        self._stop(entries, CANCELLED, (QUEUED, RUNNING, PAUSED, LISTING))
+
+    def _stop(self, entries, state, states):
+        with self._lock:
+            for entry in entries:
+                if entry.state not in states or entry.stop_as:
+                    continue
+                if entry.state in (RUNNING, LISTING):
+                    # The job ends on its own thread, which then sets the state;
+                    # its slot is only freed once the threads doing its work returned
+                    entry.stop_as = state
+                    if entry.state == RUNNING:
+                        BUS.cancel(entry.job.id)
+                        _loop_thread().loop.call_soon_threadsafe(self._cancel_task, entry)
+                else:
+                    entry.state = state
+                self._changed.add(entry)
+
+    def resume(self, entries):
+        with self._lock:
+            for entry in entries:
+                if entry.state == PAUSED:
+                    self._push(entry)
+                    self._changed.add(entry)
+            self._schedule()
+
+    def retry(self, entries):
+        """Queue failed or cancelled jobs again"""
+        with self._lock:
+            for entry in entries:
+                if entry.state not in (FAILED, CANCELLED) or entry.stop_as:
+                    continue
+                entry.job.error = None
+                entry.result = None
+                entry.percent = 0
+                if entry.collection:
+                    self._list(entry)
+                else:
+                    self._push(entry)
+                self._changed.add(entry)
+            self._schedule()
+
+    def set_priority(self, entries, priority):
+        with self._lock:
+            for entry in entries:
+                if entry.priority == priority:
+                    continue
+                entry.priority = priority
+                if entry.state == QUEUED:
+                    # The old heap item is skipped when popped
+                    heapq.heappush(self._heap, (-priority, entry.seq, entry))
+                self._changed.add(entry)
+            self._schedule()
+
+    def set_concurrency(self, concurrency):
+        with self._lock:
+            self.concurrency = max(1, concurrency)
+            self._schedule()
+
+    # Running jobs
+
+    def _schedule(self):
+        while self._running < self.concurrency and self._heap:
+            priority, _, entry = heapq.heappop(self._heap)
+            if entry.state != QUEUED or -priority != entry.priority:
+                continue  # stale item: paused, cancelled or reprioritized
+            entry.state = RUNNING
+            entry.stop_as = None
+            entry.task = None
+            self._running += 1
+            self._changed.add(entry)
+            future = _loop_thread().submit(self._run(entry))
+            future.add_done_callback(lambda future, entry=entry: self._finished(entry, future))
+
+    async def _run(self, entry):
+        # Runs on the loop thread like _cancel_task: a job stopped before it
+        # started sees stop_as here, one stopped later has its task cancelled
+        import asyncio
+
+        if entry.stop_as:
+            return None
+        entry.task = asyncio.current_task()
+        try:
+            return await batch.run_job_async(entry.job, entry.output_dir,
+                                             info=lambda info: self._on_info(entry, info))
+        except asyncio.CancelledError:
+            return None
+
+    @staticmethod
+    def _cancel_task(entry):
+        if entry.task is not None:
+            entry.task.cancel()
+
+    def _finished(self, entry, future):
+        with self._lock:
+            self._running -= 1
+            entry.task = None
+            entry.rate = 0.0
+            try:
+                result = future.result()
+            except Exception as e:
+                result = batch.JobResult(entry.job, error=f"Unexpected error: {str(e)}",
+                                         error_type=type(retry.classify(e)))
+            BUS.uncancel(entry.job.id)
+            if result is None or (entry.stop_as and not result.ok):
+                entry.state = entry.stop_as or CANCELLED
+            else:
+                entry.result = result
+                entry.state = DONE if result.ok else FAILED
+                if result.ok:
+                    entry.percent = 100
+            entry.stop_as = None
+            self._changed.add(entry)
+            self._schedule()
+
+    def _list(self, entry):
+        entry.state = LISTING
+        entry.stop_as = None
+        thread = threading.Thread(target=self._expand, args=(entry,),
+                                  name="playlist-listing", daemon=True)
+        thread.start()
+
+    def _expand(self, entry):
+        # Add each video as soon as it is resolved, like run_batch does
+        entry.listed = 0
+        error = None
+        try:
+            for job in batch.expand_jobs([entry.job]):
+                if entry.stop_as:
+                    break
+                if job is entry.job:
+                    error = job.error
+                    continue
+                self.add(job, entry.priority, entry.output_dir)
+                with self._lock:
+                    entry.listed += 1
+                    self._changed.add(entry)
+        except Exception as e:
+            error = retry.classify(e)
+        with self._lock:
+            if entry.stop_as:
+                entry.state = entry.stop_as
+            elif error is not None:
+                entry.result = batch.JobResult(entry.job, error=str(error), error_type=type(error))
+                entry.state = FAILED
+            else:
+                entry.percent = 100
+                entry.state = DONE
+            entry.stop_as = None
+            self._changed.add(entry)
+
+    def _on_progress(self, event):
+        with self._lock:
+            entry = self._by_job_id.get(event.job_id)
+            if entry is None or entry.state != RUNNING:
+                return
+            entry.percent = event.percent
+            entry.rate = event.rate
+            self._changed.add(entry)
+
+    def _on_info(self, entry, info):
+        with self._lock:
+            entry.info = info
+            entry.title = info.get("title")
+            self._changed.add(entry)
+
+    # Listeners
+
+    def changes(self):
+        """
+        Return (entries added, entries changed) since the previous call.
+        Entries in the first list are not repeated in the second.
+        """
+        with self._lock:
+            added, self._added = self._added, []
+            changed, self._changed = self._changed, set()
+        if added:
+            changed.difference_update(added)
+        return added, changed
+
+    def counts(self):
+        """Number of jobs in each state"""
+        with self._lock:
+            counts = dict.fromkeys((QUEUED, RUNNING, PAUSED, LISTING, DONE, FAILED, CANCELLED), 0)
+            for entry in self.entries:
+                counts[entry.state] += 1
+            return counts
@@ -0,0 +1,397 @@
+"""
+Library index of downloaded audio.
+Every finished download is recorded in an SQLite database with its source
+and ID, title, author, length, path, size and SHA-256, and folders of
+existing files are added by a scanner that only hashes files whose size or
+modification time changed. Titles, authors and file names are indexed with
+FTS5 for instant search, and "do I already have it" is a single lookup of
+the (source, ID) primary key.
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+from src.core import links
+from src.core.cache import cache_dir
+from src.core.store import file_digest
+
+log = logging.getLogger(__name__)
+
+BEATSTARS = "beatstars"
+YOUTUBE = "youtube"
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".webm", ".opus", ".ogg", ".flac", ".wav", ".aac")
+SEARCH_LIMIT = 200
+SCAN_COMMIT = 2000  # files indexed per transaction while scanning
+
+ENABLED = os.environ.get("EMERGENCY_BEAT_LIBRARY", "1") != "0"
+SKIP_EXISTING = False  # report jobs already in the library instead of downloading them
+
+_COLUMNS = ("tracks.path, tracks.title, tracks.author, tracks.length, tracks.size, tracks.digest, "
+            "(SELECT source || ':' || source_id FROM sources WHERE track = tracks.id LIMIT 1)")
+
+
+def configure(enabled=None, skip_existing=None):
+    global ENABLED, SKIP_EXISTING
+    if enabled is not None:
+        ENABLED = enabled
+    if skip_existing is not None:
+        SKIP_EXISTING = skip_existing
+
+
+def identify(target):
+    """(source, ID) of a download target (URL or beat ID), or None"""
+    link = links.classify(target)
+    if link is None and target.strip().isdigit():
+        return BEATSTARS, target.strip()  # short beat IDs are only recognized alone
+    if link is None or link.collection:
+        return None
+    return (BEATSTARS if link.kind == links.BEAT else YOUTUBE), link.id
+
+
+class Entry:
+    """A track of the library"""
+
+    def __init__(self, path, title, author, length, size, digest, key=None):
+        self.path = path
+        self.title = title
+        self.author = author
+        self.length = length
+        self.size = size
+        self.digest = digest
+        self.key = key  # "youtube:<video id>" or "beatstars:<beat id>", None for scanned files
+
+    def __repr__(self):
+        return f"Entry({self.path!r}, {self.title!r})"
+
+
+class Library:
+    """SQLite index of downloaded tracks with full-text search"""
+
+    def __init__(self, root=None):
+        self.root = root or cache_dir("library")
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, "library.sqlite"),
+                                   check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS tracks ("
+                             "id INTEGER PRIMARY KEY, path TEXT UNIQUE, name TEXT, title TEXT, "
+                             "author TEXT, length INTEGER, size INTEGER, mtime_ns INTEGER, "
+                             "digest TEXT, added REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS tracks_digest ON tracks (digest)")
+            # A track can come from several sources (the same beat on Beatstars and YouTube)
+            self._db.execute("CREATE TABLE IF NOT EXISTS sources ("
+                             "source TEXT, source_id TEXT, track INTEGER, "
+                             "PRIMARY KEY (source, source_id)) WITHOUT ROWID")
+            self._db.execute("CREATE INDEX IF NOT EXISTS sources_track ON sources (track)")
+            # External content table kept in sync by triggers; the prefix
+            # indexes make search-as-you-type queries cheap
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5("
+                             "title, author, name, content='tracks', content_rowid='id', "
+                             "prefix='2 3', tokenize='unicode61 remove_diacritics 2')")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN "
+                             "INSERT INTO tracks_fts (rowid, title, author, name) "
+                             "VALUES (new.id, new.title, new.author, new.name); END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN "
+                             "INSERT INTO tracks_fts (tracks_fts, rowid, title, author, name) "
+                             "VALUES ('delete', old.id, old.title, old.author, old.name); "
+                             "DELETE FROM sources WHERE track = old.id; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, author, name "
+                             "ON tracks BEGIN "
+                             "INSERT INTO tracks_fts (tracks_fts, rowid, title, author, name) "
+                             "VALUES ('delete', old.id, old.title, old.author, old.name); "
+                             "INSERT INTO tracks_fts (rowid, title, author, name) "
+                             "VALUES (new.id, new.title, new.author, new.name); END")
+
+    def add(self, path, source=None, source_id=None, info=None):
+        """
+        Record a downloaded file, from `source` when known. `info` is the
+        video_info dict of YouTube downloads (title, author, length).
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        info = info or {}
+        name = os.path.basename(path)
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, digest FROM tracks WHERE path = ?",
+                                   (path,)).fetchone()
+        # Only hash what changed since it was recorded
+        if row is not None and row[:2] == (st.st_size, st.st_mtime_ns):
+            digest = row[2]
+        else:
+            digest = file_digest(path)
+        with self._lock:
+            with self._db:
+                track = self._upsert(path, name, st, digest, info.get("title") or os.path.splitext(name)[0],
+                                     info.get("author"), info.get("length"), replace=bool(info))
+                if source and source_id:
+                    self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                                     (source, source_id, track))
+
+    def _upsert(self, path, name, st, digest, title, author, length, replace=True):
+        # Metadata from a download replaces the file-name title of a scanned file
+        self._db.execute(_upsert_sql(replace),
+                         (path, name, title, author, length, st.st_size, st.st_mtime_ns, digest, time.time()))
+        return self._db.execute("SELECT id FROM tracks WHERE path = ?", (path,)).fetchone()[0]
+
+    def find(self, source, source_id):
+        """Path of the track downloaded from (source, source_id), or None"""
+        with self._lock:
+            row = self._db.execute("SELECT tracks.id, tracks.path FROM sources "
+                                   "JOIN tracks ON tracks.id = sources.track "
+                                   "WHERE sources.source = ? AND sources.source_id = ?",
+                                   (source, source_id)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[1]):
+                # Deleted or moved behind our back
+                with self._db:
+                    self._db.execute("DELETE FROM tracks WHERE id = ?", (row[0],))
+                return None
+            return row[1]
+
+    def remove(self, path):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM tracks WHERE path = ?", (os.path.abspath(path),))
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Entries matching every word of `text` as a prefix (best matches
+        first), the entry of a pasted link, or the latest additions when
+        `text` is empty
+        """
+        link = identify(text) if "/" in text or text.strip().isdigit() else None
+        with self._lock:
+            if link is not None:
+                rows = self._db.execute("SELECT " + _COLUMNS + " FROM sources "
+                                        "JOIN tracks ON tracks.id = sources.track "
+                                        "WHERE sources.source = ? AND sources.source_id = ?", link).fetchall()
+            elif _match_query(text):
+                # Every match is ranked; FTS5 keeps only the best `limit` while doing it
+                rows = self._db.execute("SELECT " + _COLUMNS + " FROM ("
+                                        "SELECT rowid, rank FROM tracks_fts WHERE tracks_fts MATCH ? "
+                                        "ORDER BY rank LIMIT ?) AS found "
+                                        "JOIN tracks ON tracks.id = found.rowid ORDER BY found.rank",
+                                        (_match_query(text), limit)).fetchall()
+            else:
+                rows = self._db.execute("SELECT " + _COLUMNS + " FROM tracks ORDER BY id DESC LIMIT ?",
+                                        (limit,)).fetchall()
+        return [Entry(*row) for row in rows]
+
+    def downloads(self):
+        """Entries of every track recorded with its source"""
+        with self._lock:
+            rows = self._db.execute("SELECT " + _COLUMNS + " FROM tracks "
+                                    "WHERE EXISTS (SELECT 1 FROM sources WHERE track = tracks.id)").fetchall()
+        return [Entry(*row) for row in rows]
+
+    def restat(self, paths, workers=4):
+        """
+        Record the size, mtime and digest of files edited in place (e.g.
+        retagged); only the files that changed are hashed again
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        changed = []
+        with self._lock:
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                row = self._db.execute("SELECT size, mtime_ns FROM tracks WHERE path = ?", (path,)).fetchone()
+                if row is not None and row != (st.st_size, st.st_mtime_ns):
+                    changed.append((path, st))
+
+        def digest(item):
+            try:
+                return item[1].st_size, item[1].st_mtime_ns, file_digest(item[0]), item[0]
+            except OSError as e:
+                log.debug("Could not read %s: %s", item[0], e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library-hash") as pool:
+            rows = [row for row in pool.map(digest, changed) if row is not None]
+        with self._lock:
+            with self._db:
+                self._db.executemany("UPDATE tracks SET size = ?, mtime_ns = ?, digest = ? WHERE path = ?", rows)
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def scan(self, directory, recursive=True):
+        """
+        Index the audio files in `directory` and forget the ones that are
+        gone; files with the size and mtime already recorded are not read.
+        Returns the number of (new or changed, removed, unchanged) files.
+        """
+        directory = os.path.abspath(directory)
+        prefix = os.path.join(directory, "")
+        with self._lock:
+            # Range scan of the path index: the files recorded under `directory`
+            rows = self._db.execute("SELECT path, size, mtime_ns FROM tracks WHERE path >= ? AND path < ?",
+                                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1))).fetchall()
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in rows
+                 if recursive or os.path.dirname(path) == directory}
+        changed = []
+        seen = set()
+        for path, st in _audio_files(directory, recursive):
+            seen.add(path)
+            if known.get(path) != (st.st_size, st.st_mtime_ns):
+                changed.append((path, st))
+        gone = [path for path in known if path not in seen]
+
+        for start in range(0, len(changed), SCAN_COMMIT):
+            hashed = []
+            for path, st in changed[start:start + SCAN_COMMIT]:
+                try:
+                    hashed.append((path, st, file_digest(path)))
+                except OSError as e:
+                    log.debug("Could not read %s: %s", path, e)
+            now = time.time()
+            rows = [(path, os.path.basename(path), os.path.splitext(os.path.basename(path))[0], None, None,
+                     st.st_size, st.st_mtime_ns, digest, now) for path, st, digest in hashed]
+            with self._lock:
+                with self._db:
+                    self._db.executemany(_upsert_sql(replace=False), rows)
+        if gone:
+            with self._lock:
+                with self._db:
+                    self._db.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in gone])
+        return len(changed), len(gone), len(seen) - len(changed)
+
+
+def _audio_files(directory, recursive):
+    # (path, stat) of the audio files, skipping hidden folders and unfinished downloads
+    try:
+        entries = list(os.scandir(directory))
+    except OSError as e:
+        log.debug("Could not list %s: %s", directory, e)
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not entry.name.startswith("."):
+                    yield from _audio_files(entry.path, recursive)
+            elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                yield entry.path, entry.stat()
+        except OSError:
+            continue
+
+
+def _upsert_sql(replace):
+    update = "title = excluded.title, author = excluded.author, length = excluded.length, " if replace else ""
+    return ("INSERT INTO tracks (path, name, title, author, length, size, mtime_ns, digest, added) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET " + update +
+            "name = excluded.name, size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "digest = excluded.digest")
+
+
+def _match_query(text):
+    # Every word as a quoted prefix term: user input never reaches the FTS5 syntax
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """Return the shared library, or None when it is disabled"""
+    global _library
+    if not ENABLED:
+        return None
+    with _library_lock:
+        if _library is None:
+            _library = Library()
+        return _library
+
+
+def record(path, target=None, info=None):
+    """
+    Add a finished download of `target` (its URL or beat ID) to the
+    library. Never raises.
+    """
+    library = get_library()
+    if library is None or not path:
+        return
+    try:
+        source = identify(target) if target else None
+        library.add(path, *(source or (None, None)), info=info)
+    except Exception as e:
+        log.warning("Could not add %s to the library: %s", path, e)
+
+
+def have(target):
+    """Path of an earlier download of `target` still on disk, or None"""
+    library = get_library()
+    source = identify(target) if library is not None else None
+    if source is None:
+        return None
+    try:
+        return library.find(*source)
+    except sqlite3.Error as e:
+        log.warning("Library lookup failed: %s", e)
+        return None
+
+
+def scan(directories, recursive=True):
+    """Index the audio files of each directory; returns the totals"""
+    library = get_library()
+    totals = [0, 0, 0]
+    if library is None:
+        return totals
+    for directory in directories:
+        start = time.monotonic()
+        counts = library.scan(directory, recursive)
+        log.info("Scanned %s in %.1fs: %d new or changed, %d removed, %d unchanged",
+                 directory, time.monotonic() - start, *counts)
+        totals = [total + n for total, n in zip(totals, counts)]
+    return totals
+
+
+def scan_in_background(directories, recursive=True, done=None):
+    """scan() on a daemon thread; `done` receives the totals"""
+    def run():
+        try:
+            totals = scan(directories, recursive)
+        except Exception as e:
+            log.warning("Library scan failed: %s", e)
+            return
+        if done:
+            done(totals)
+
+    thread = threading.Thread(target=run, name="library-scan", daemon=True)
+    thread.start()
+    return thread
+
+
+def retag(workers=4):
+    """
+    Write the tags of every download in the library from its recorded
+    source, title and channel; returns tags.retag()'s totals
+    """
+    from src.core import tags
+    library = get_library()
+    if library is None:
+        return 0, 0, 0
+    entries = library.downloads()
+    totals = tags.retag(((entry.path, tags.for_source(*entry.key.split(":", 1), title=entry.title,
+                                                      artist=entry.author)) for entry in entries), workers)
+    library.restat((entry.path for entry in entries), workers)
+    return totals
+
+
+def format_length(seconds):
+    return f"{seconds // 60}:{seconds % 60:02d}" if seconds else ""
+
+
+def format_entry(entry):
+    """One tab-separated line per entry for the command line"""
+    return "\t".join((entry.path, entry.title or "", entry.author or "",
+                      format_length(entry.length), entry.key or ""))
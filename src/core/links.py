@@ -0,0 +1,154 @@
+"""
+Link classification and bulk ingestion.
+One precompiled pattern finds every Beatstars and YouTube reference in a
+piece of text: a single URL typed in the window, a pasted blob, a text file
+or a browser bookmarks/history export. Each match is classified (beat,
+video, playlist, channel), normalized to its canonical ID and deduplicated,
+in one pass over the text.
+"""
+import re
+
+BEAT = "beat"
+VIDEO = "video"
+PLAYLIST = "playlist"
+CHANNEL = "channel"
+
+# Characters that end a URL in text, HTML attributes and markdown
+_END = r'''(?=[\s"'<>)\]/?#&]|$)'''
+_QUERY = r'''[^\s"'<>#]*?'''  # other query parameters before the one we want
+
+# Every alternative starts with a literal (the host name, or the newline
+# before a bare ID) so the scan can skip ahead to the next candidate; the
+# lookbehinds only run after a host matched, rejecting "notyoutube.com".
+# Hosts are matched case-sensitively: IGNORECASE disables the fast scan and
+# browsers and share buttons write them in lowercase.
+LINK_PATTERN = re.compile(
+    # youtube.com, m./music./www. subdomains and youtube-nocookie.com
+    r'youtube(?<![\w-]youtube)(?:-nocookie)?\.com/(?:'
+    r'watch\?' + _QUERY + r'\bv=(?P<watch>[\w-]{11})(?![\w-])'
+    # Before the embed path: "videoseries" is 11 characters long too
+    r'|(?:playlist|embed/videoseries)\?' + _QUERY + r'\blist=(?P<list>[\w-]{10,})'
+    r'|(?:embed|v|shorts|live|e)/(?P<path>[\w-]{11})(?![\w-])'
+    r'|(?P<channel>@[\w.-]+|channel/UC[\w-]{22}|c/[\w.%-]+|user/[\w.%-]+)' + _END +
+    r')'
+    r'|youtu\.be/(?<![\w-]youtu\.be/)(?P<short>[\w-]{11})(?![\w-])'
+    # producer.beatstars.com/beat/name-12345678, beatstars.com/beat/12345678
+    r'|beatstars\.com/(?<![\w-]beatstars\.com/)(?:'
+    r'beat/(?:[^\s/?#"\'<>]*-)?(?P<beat>\d+)' + _END +
+    r'|stream\?' + _QUERY + r'\bid=(?P<stream>\d+))'
+    # A beat ID alone at the start of a line, as in jobs files
+    r'|\n[ \t]*(?P<bare>\d{6,})(?=[ \t\r\n]|$)')
+
+# The kind of link each named group captures
+_GROUP_KINDS = {
+    "watch": VIDEO, "path": VIDEO, "short": VIDEO,
+    "list": PLAYLIST, "channel": CHANNEL,
+    "beat": BEAT, "stream": BEAT, "bare": BEAT,
+}
+
+
+class Link:
+    """A classified reference: its kind and canonical ID"""
+
+    __slots__ = ("kind", "id")
+
+    def __init__(self, kind, id):
+        self.kind = kind
+        self.id = id
+
+    @property
+    def key(self):
+        # Channel handles and names are case-insensitive, IDs are not
+        return (self.kind, self.id.lower() if self.kind == CHANNEL else self.id)
+
+    @property
+    def url(self):
+        """Canonical URL (the bare ID for beats)"""
+        if self.kind == VIDEO:
+            return f"https://www.youtube.com/watch?v={self.id}"
+        if self.kind == PLAYLIST:
+            return f"https://www.youtube.com/playlist?list={self.id}"
+        if self.kind == CHANNEL:
+            return f"https://www.youtube.com/{self.id}"
+        return self.id
+
+    @property
+    def collection(self):
+        return self.kind in (PLAYLIST, CHANNEL)
+
+    def __eq__(self, other):
+        return isinstance(other, Link) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"Link({self.kind}, {self.id!r})"
+
+
+def _link(match):
+    group = match.lastgroup
+    return Link(_GROUP_KINDS[group], match.group(group))
+
+
+def _prepare(text):
+    # Bookmark exports and copied HTML escape the & between query parameters
+    if "&#" in text or "&amp;" in text:
+        text = text.replace("&amp;", "&").replace("&#38;", "&").replace("&#x26;", "&")
+    # The bare ID alternative starts at a newline, the first line included
+    return "\n" + text
+
+
+def iter_links(text, bare_ids=True):
+    """
+    Yield every link in `text` in order, duplicates included. With
+    `bare_ids`, a number of 6+ digits starting a line counts as a beat ID.
+    """
+    for match in LINK_PATTERN.finditer(_prepare(text)):
+        if match.lastgroup == "bare" and not bare_ids:
+            continue
+        yield _link(match)
+
+
+def extract(text, bare_ids=True):
+    """Every distinct link in `text`, in order of first appearance"""
+    found = {}
+    for match in LINK_PATTERN.finditer(_prepare(text)):
+        group = match.lastgroup
+        if group == "bare" and not bare_ids:
+            continue
+        kind, id = _GROUP_KINDS[group], match[group]
+        key = (kind, id.lower() if kind == CHANNEL else id)
+        if key not in found:
+            found[key] = Link(kind, id)
+    return list(found.values())
+
+
+def classify(text):
+    """The first link in `text` (a URL, a bare beat ID...), or None"""
+    for link in iter_links(text.strip()):
+        return link
+    return None
+
+
+def read(path):
+    """Every distinct link in a text or HTML file"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    # Numbers at the start of a line in HTML are page content, not beat IDs
+    html = path.lower().endswith((".html", ".htm")) or text.lstrip()[:1] == "<"
+    return extract(text, bare_ids=not html)
+
+
+def beat_id(text):
+    """Beat ID of a Beatstars URL or bare ID, or None"""
+    link = classify(text)
+    if link is None and text.strip().isdigit():
+        return text.strip()  # short IDs are only recognized alone
+    return link.id if link is not None and link.kind == BEAT else None
+
+
+def video_id(text):
+    """YouTube video ID of a watch/short/embed URL, or None"""
+    link = classify(text)
+    return link.id if link is not None and link.kind == VIDEO else None
@@ -0,0 +1,269 @@
+"""
+Per-job timings and counters.
+A job record follows each download through its phases (id extraction,
+resolve, time to first byte, transfer, rename/transcode, store,
+fingerprint) and counts the bytes it saves. Finished jobs are appended
+as JSON lines to the metrics file (if configured) and folded into totals
+that format_stats() summarizes and prometheus_text() exposes, optionally
+over HTTP.
+
+Recording is a clock read and a dict update per phase and per chunk, so it
+is always on; only the outputs are opt-in.
+"""
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Phases recorded by the downloaders
+EXTRACT = "extract"      # beat/video ID from the input
+RESOLVE = "resolve"      # CDN URL (Beatstars) or metadata and stream manifest (YouTube)
+TTFB = "ttfb"            # first media request until its response headers
+TRANSFER = "transfer"    # first media request until the last byte (includes ttfb)
+FINALIZE = "finalize"    # move into place, wait for ffmpeg, rename
+STORE = "store"          # copy into the download store
+FINGERPRINT = "fingerprint"  # decode and look up in the duplicate index
+
+PREFIX = "emergency_beat"
+SAMPLES = 1000  # durations kept per phase for the quantiles
+
+JSONL_PATH = None  # file finished jobs are appended to, None = off
+
+_current = contextvars.ContextVar("metrics_job", default=None)
+_lock = threading.Lock()
+_counters = {}   # (name, labels) -> value
+_phases = {}     # phase -> [count, seconds, recent durations]
+_jsonl = None
+_server = None
+
+
+class JobRecord:
+    """What one job spent its time on; updated from every thread it runs on"""
+
+    def __init__(self, job_id, source=None, target=None):
+        self.job_id = job_id
+        self.source = source
+        self.target = target
+        self.started = time.monotonic()
+        self.phases = {}  # phase -> seconds, summed over retries
+        self.bytes = 0
+        self.notes = {}
+        self.outcome = "ok"
+        self.error = None  # error class name
+
+    def fail(self, error_type):
+        self.outcome = "failed"
+        self.error = error_type.__name__
+
+    def as_dict(self, elapsed):
+        transfer = self.phases.get(TRANSFER)
+        data = {
+            "ts": round(time.time(), 3),
+            "job": self.job_id,
+            "source": self.source,
+            "target": self.target,
+            "outcome": self.outcome,
+            "error": self.error,
+            "elapsed": round(elapsed, 4),
+            "bytes": self.bytes,
+            "throughput": round(self.bytes / transfer) if transfer else None,
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+        }
+        data.update(self.notes)
+        return data
+
+
+def configure(jsonl=None):
+    """Append one JSON line per finished job to `jsonl`"""
+    global JSONL_PATH, _jsonl
+    if jsonl is None:
+        return
+    with _lock:
+        if _jsonl is not None:
+            _jsonl.close()
+        JSONL_PATH = jsonl
+        _jsonl = open(jsonl, "a", encoding="utf-8", buffering=1)
+
+
+@contextmanager
+def job(job_id, source=None, target=None):
+    """
+    Record the enclosed download (and the threads and tasks it copies the
+    context to) as one job; yields its JobRecord
+    """
+    record = JobRecord(job_id, source, target)
+    token = _current.set(record)
+    try:
+        yield record
+    except Exception as e:
+        if record.error is None:
+            record.fail(type(e))
+        raise
+    except BaseException:
+        # Cancelled (paused or stopped from the queue) or interrupted
+        record.outcome = "cancelled"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(record, time.monotonic() - record.started)
+
+
+def current():
+    """JobRecord of the running job, or None outside of one"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name, once=False):
+    """
+    Time the enclosed block as phase `name` of the current job. With
+    `once`, only the first completed block counts (e.g. the first of
+    several range requests).
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        _add_phase(name, time.monotonic() - start, once)
+
+
+def _add_phase(name, seconds, once=False):
+    record = _current.get()
+    with _lock:
+        if record is not None:
+            if once and name in record.phases:
+                return
+            record.phases[name] = record.phases.get(name, 0.0) + seconds
+        totals = _phases.get(name)
+        if totals is None:
+            totals = _phases[name] = [0, 0.0, deque(maxlen=SAMPLES)]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2].append(seconds)
+
+
+def add_bytes(n):
+    """Count `n` bytes saved by the current job (written to its file or encoder)"""
+    record = _current.get()
+    if record is not None:
+        # A lock-free += can lose updates between segment threads
+        with _lock:
+            record.bytes += n
+
+
+def note(**fields):
+    """Attach fields (e.g. a cache hit) to the current job's JSON line"""
+    record = _current.get()
+    if record is not None:
+        record.notes.update(fields)
+
+
+def count(name, value=1, **labels):
+    """Add `value` to the counter `name` with `labels`"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def count_error(error):
+    """Count a classified download failure (every attempt, retried or not)"""
+    count("errors_total", **{"class": type(error).__name__})
+
+
+def _finish(record, elapsed):
+    labels = {"source": record.source or "unknown"}
+    count("jobs_total", outcome=record.outcome, **labels)
+    count("bytes_total", record.bytes, **labels)
+    if record.error:
+        count("job_errors_total", **{"class": record.error})
+    if _jsonl is None:
+        return
+    import json
+    line = json.dumps(record.as_dict(elapsed))
+    with _lock:
+        if _jsonl is not None:
+            _jsonl.write(line + "\n")
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def snapshot():
+    """Counters and per-phase totals: {"counters": {...}, "phases": {...}}"""
+    with _lock:
+        counters = dict(_counters)
+        phases = {name: (n, seconds, list(recent)) for name, (n, seconds, recent) in _phases.items()}
+    return {
+        "counters": counters,
+        "phases": {name: {"count": n, "seconds": seconds,
+                          "p50": _quantile(recent, 0.5), "p99": _quantile(recent, 0.99)}
+                   for name, (n, seconds, recent) in phases.items()},
+    }
+
+
+def format_stats():
+    phases = snapshot()["phases"]
+    if not phases:
+        return "phases: no data"
+    order = [EXTRACT, RESOLVE, TTFB, TRANSFER, FINALIZE, STORE, FINGERPRINT]
+    names = sorted(phases, key=lambda name: order.index(name) if name in order else len(order))
+    return "phases: " + ", ".join(
+        f"{name} p50 {phases[name]['p50'] * 1000:.0f}ms p99 {phases[name]['p99'] * 1000:.0f}ms "
+        f"({phases[name]['count']})" for name in names)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+def prometheus_text():
+    """The counters and phase summaries in the Prometheus text format"""
+    data = snapshot()
+    lines = []
+    by_name = {}
+    for (name, labels), value in sorted(data["counters"].items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, samples in by_name.items():
+        lines.append(f"# TYPE {PREFIX}_{name} counter")
+        lines.extend(f"{PREFIX}_{name}{_labels(labels)} {value}" for labels, value in samples)
+    if data["phases"]:
+        name = f"{PREFIX}_phase_seconds"
+        lines.append(f"# TYPE {name} summary")
+        for phase_name, s in sorted(data["phases"].items()):
+            for q in ("0.5", "0.99"):
+                value = s["p50"] if q == "0.5" else s["p99"]
+                lines.append(f'{name}{{phase="{phase_name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{name}_sum{{phase="{phase_name}"}} {s["seconds"]:.6f}')
+            lines.append(f'{name}_count{{phase="{phase_name}"}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve prometheus_text() at http://host:port/metrics from a daemon thread"""
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are not worth a log line
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
@@ -0,0 +1,100 @@
+"""
+YouTube playlist and channel expansion.
+A playlist or channel URL is turned into video IDs page by page (pytubefix
+follows the continuation tokens 100 videos at a time), and the metadata of
+those videos is resolved by a bounded pool while the listing continues.
+Each video is handed on as soon as it is resolved, so downloads of a long
+playlist start after the first page instead of after the whole listing.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.core import links, retry
+
+RESOLVE_WORKERS = 8  # concurrent metadata lookups per playlist
+
+
+def is_playlist(url):
+    # A watch URL with a list= parameter is a single video played from a playlist
+    link = links.classify(url)
+    return link is not None and link.kind == links.PLAYLIST
+
+
+def is_channel(url):
+    link = links.classify(url)
+    return link is not None and link.kind == links.CHANNEL
+
+
+def is_collection(url):
+    """Whether a URL lists several videos (playlist or channel)"""
+    link = links.classify(url)
+    return link is not None and link.collection
+
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def expand(url, workers=None):
+    """Yield (video_id, metadata, error) for every video of a playlist/channel URL"""
+    return resolve(iter_video_ids(url), workers)
+
+
+def iter_video_ids(url):
+    """
+    Yield the video IDs of a playlist or channel in listing order, fetching
+    the next page only when the previous one has been consumed.
+    """
+    from src.core.youtube import YOUTUBE_HOST, extract_video_id
+    from src.utils.pytube_fixes import load_pytubefix
+
+    pytubefix = load_pytubefix()
+    listing = pytubefix.Channel(url) if is_channel(url) and not is_playlist(url) else pytubefix.Playlist(url)
+    urls = listing.url_generator()
+    seen = set()
+    while True:
+        # pytubefix does not use the shared transport, guard each page fetch
+        with retry.circuit(YOUTUBE_HOST):
+            try:
+                item = next(urls)
+            except StopIteration:
+                return
+        video_id = extract_video_id(item)
+        if video_id and video_id not in seen:
+            seen.add(video_id)
+            yield video_id
+
+
+def resolve(video_ids, workers=None):
+    """
+    Load the metadata (and stream manifest) of videos with a bounded pool.
+    Yields (video_id, metadata or None, error or None) in completion order;
+    at most 2 x `workers` IDs are taken from `video_ids` ahead of the results,
+    so an endless or slow listing is consumed as it goes.
+    """
+    from src.core.youtube import load_video
+
+    workers = workers or RESOLVE_WORKERS
+    ids = iter(video_ids)
+    pending = set()
+    done_listing = False
+
+    def load(video_id):
+        try:
+            meta, _, _ = load_video(video_id)
+            return video_id, meta, None
+        except Exception as e:
+            return video_id, None, retry.classify(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while not done_listing and len(pending) < 2 * workers:
+                try:
+                    pending.add(pool.submit(load, next(ids)))
+                except StopIteration:
+                    done_listing = True
+            if not pending:
+                return
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+
@@ -0,0 +1,143 @@
+"""
+Progress event bus.
+Downloaders report every chunk here; subscribers (Qt threads, the CLI)
+only receive coalesced updates, at most `hz` times per second per job and
+only when the percentage actually changed.
+
+Jobs are also cancelled here: once cancel() is called, the next report()
+of the job raises JobCancelled, which stops work running in threads (an
+encoder being fed, a threaded transfer) that asyncio cannot interrupt.
+"""
+import time
+import logging
+import itertools
+import threading
+
+from src.core.errors import JobCancelled
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HZ = 10
+
+_job_ids = itertools.count(1)
+
+
+def new_job_id(prefix="job"):
+    return f"{prefix}-{next(_job_ids)}"
+
+
+class ProgressEvent:
+    """Snapshot of a job's progress as delivered to subscribers"""
+
+    def __init__(self, job_id, percent, downloaded, total, rate, done=False):
+        self.job_id = job_id
+        self.percent = percent
+        self.downloaded = downloaded
+        self.total = total
+        self.rate = rate  # bytes per second
+        self.done = done
+
+    def __repr__(self):
+        return f"ProgressEvent({self.job_id}, {self.percent}%, {self.downloaded}/{self.total})"
+
+
+class _JobState:
+    def __init__(self):
+        self.percent = 0
+        self.downloaded = 0
+        self.total = 0
+        self.rate = 0.0
+        self.published_at = 0.0
+        self.published_percent = None
+        self.rate_at = time.monotonic()
+        self.rate_bytes = 0
+
+    def event(self, job_id, done=False):
+        return ProgressEvent(job_id, self.percent, self.downloaded, self.total, self.rate, done)
+
+
+class ProgressBus:
+    """Aggregates per-job progress and publishes coalesced events"""
+
+    def __init__(self, hz=DEFAULT_HZ):
+        self.interval = 1.0 / hz
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._subscribers = []
+        self._cancelled = set()
+
+    def subscribe(self, callback, job_id=None):
+        """Call `callback(event)` for updates of `job_id`, or of every job if None"""
+        with self._lock:
+            self._subscribers.append((callback, job_id))
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[0] != callback]
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = [cb for cb, job_id in self._subscribers
+                           if job_id is None or job_id == event.job_id]
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                log.warning("Progress subscriber error: %s", e)
+
+    def cancel(self, job_id):
+        """Make every later report() of the job raise JobCancelled"""
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def uncancel(self, job_id):
+        """Let the job run again (once its cancelled run has returned)"""
+        with self._lock:
+            self._cancelled.discard(job_id)
+
+    def report(self, job_id, percent=None, downloaded=None, total=None):
+        """
+        Record progress for a job; publishes only if the update is due.
+        Raises JobCancelled if the job was cancelled.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if job_id in self._cancelled:
+                raise JobCancelled("Download stopped")
+            state = self._jobs.get(job_id)
+            if state is None:
+                state = self._jobs[job_id] = _JobState()
+            if total is not None:
+                state.total = total
+            if downloaded is not None:
+                state.downloaded = downloaded
+                elapsed = now - state.rate_at
+                if elapsed >= self.interval:
+                    state.rate = (downloaded - state.rate_bytes) / elapsed
+                    state.rate_at, state.rate_bytes = now, downloaded
+            if percent is not None:
+                state.percent = percent
+            if state.percent == state.published_percent or now - state.published_at < self.interval:
+                return
+            state.published_at = now
+            state.published_percent = state.percent
+            event = state.event(job_id)
+        self._publish(event)
+
+    def finish(self, job_id):
+        """Publish the final state of a job unconditionally and forget it"""
+        with self._lock:
+            state = self._jobs.pop(job_id, None)
+            if state is None:
+                return
+            event = state.event(job_id, done=True)
+        self._publish(event)
+
+    def snapshot(self):
+        """Return the current state of every active job"""
+        with self._lock:
+            return [state.event(job_id) for job_id, state in self._jobs.items()]
+
+
+# Process-wide bus shared by every downloader
+BUS = ProgressBus()
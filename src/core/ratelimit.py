@@ -0,0 +1,306 @@
+"""
+Bandwidth limiting.
+Every chunk read from a response body is charged to token buckets: the
+global cap, the cap of the host it came from, and the job's share of each.
+A cap is split max-min fair between the jobs using it: a job that cannot use
+its equal share (slow server, nearly finished) leaves the rest to the
+others, so one large download cannot starve the rest and the cap is not
+left half used. Caps are in bytes per second and can be changed while
+downloads run.
+"""
+import re
+import time
+import collections
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LIMIT = 0          # global cap in bytes per second, 0 = unlimited
+HOST_LIMITS = {}   # host (or parent domain) -> cap in bytes per second
+
+BURST = 0.25                # seconds of traffic a bucket absorbs at once
+MIN_BURST = 64 * 1024
+MIN_SHARE = 16 * 1024       # smallest per-job rate handed out
+REBALANCE_INTERVAL = 0.5    # seconds between fair-share recomputations
+GROWTH = 1.5                # headroom over a job's measured rate when it is not capped by us
+IDLE_AFTER = 2.0            # a job that read nothing for this long loses its share
+CHUNK_SECONDS = 0.1         # read sizes under a cap: about this much traffic
+STATS_JOBS = 10000          # finished jobs kept for format_stats()
+
+RATE_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?$')
+
+_current_job = contextvars.ContextVar("ratelimit_job", default=None)
+
+
+@contextmanager
+def job(job_id):
+    """Charge the traffic of the enclosed code (and threads it copies the context to) to `job_id`"""
+    outer = _current_job.get() != job_id
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+        if outer:
+            _end_transfer(job_id)
+
+
+def parse_rate(value):
+    """Parse '500k', '2M' or '1.5MB/s' into bytes per second; '0' is unlimited"""
+    match = RATE_PATTERN.match(str(value).strip().lower())
+    if not match:
+        raise ValueError(f"Invalid rate: {value!r} (expected e.g. 500k or 2M)")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[unit])
+
+
+def format_rate(rate):
+    if rate >= 1024 * 1024:
+        return f"{rate / (1024 * 1024):.2f} MB/s"
+    return f"{rate / 1024:.0f} KB/s"
+
+
+class TokenBucket:
+    """
+    Token bucket that may go into debt: take() always charges the bytes and
+    returns how long the caller has to wait for the rate to hold.
+    Not locked, callers serialize access.
+    """
+
+    def __init__(self, rate, now=None):
+        self.rate = rate
+        self.tokens = self.capacity
+        self.stamp = time.monotonic() if now is None else now
+
+    @property
+    def capacity(self):
+        return max(self.rate * BURST, MIN_BURST)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate, now):
+        self._refill(now)
+        self.rate = rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def take(self, n, now):
+        self._refill(now)
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class _Share:
+    def __init__(self, rate, now):
+        self.bucket = TokenBucket(rate, now)
+        self.bytes = 0  # since the last rebalance
+        self.measured = None  # bytes per second over the last interval
+        self.seen = now
+        self.waiting_until = 0.0  # end of the last wait handed out
+
+
+class SharedLimit:
+    """A rate cap shared max-min fair by the jobs drawing from it"""
+
+    def __init__(self, rate, now=None):
+        now = time.monotonic() if now is None else now
+        self.rate = rate
+        self.bucket = TokenBucket(rate, now)
+        self.shares = {}
+        self.balanced_at = now
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, now=None):
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            self.rate = rate
+            self.bucket.set_rate(rate, now)
+            self._assign(now)
+
+    def take(self, job_id, n, now=None):
+        """Charge `n` bytes read by `job_id`; returns the seconds to wait"""
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            share = self.shares.get(job_id)
+            if share is None:
+                share = self.shares[job_id] = _Share(self.rate, now)
+                self._assign(now)
+            share.bytes += n
+            share.seen = now
+            if now - self.balanced_at >= REBALANCE_INTERVAL:
+                self._rebalance(now)
+            wait = max(self.bucket.take(n, now), share.bucket.take(n, now))
+            if wait > 0:
+                share.waiting_until = max(share.waiting_until, now + wait)
+            return wait
+
+    def chunk_rate(self):
+        """Rate of an equal share, to size reads by"""
+        return self.rate / max(1, len(self.shares))
+
+    def _rebalance(self, now):
+        elapsed = now - self.balanced_at
+        started = self.balanced_at
+        self.balanced_at = now
+        for job_id, share in list(self.shares.items()):
+            if now - max(share.seen, share.waiting_until) > IDLE_AFTER:
+                del self.shares[job_id]
+                continue
+            # A job that spent part of the interval waiting on us wanted more
+            # than it got: its demand is unknown, not what it managed to read
+            share.measured = None if share.waiting_until > started else share.bytes / elapsed
+            share.bytes = 0
+        self._assign(now)
+
+    def _assign(self, now):
+        # Water-filling: jobs using less than an equal share keep what they
+        # use (plus headroom to grow), the rest is split between the others.
+        # New jobs have no measurement yet and get an equal share.
+        unknown = float("inf")
+        order = sorted(self.shares.values(),
+                       key=lambda s: unknown if s.measured is None else s.measured)
+        remaining = self.rate
+        for i, share in enumerate(order):
+            fair = remaining / (len(order) - i)
+            rate = fair
+            if share.measured is not None:
+                rate = min(fair, max(share.measured * GROWTH, MIN_SHARE))
+            share.bucket.set_rate(max(rate, MIN_SHARE), now)
+            remaining = max(0, remaining - rate)
+
+
+_lock = threading.Lock()
+_global = None
+_hosts = {}
+_transfers = {}  # job id -> [bytes, first read, last read] while the job runs
+_rates = collections.deque(maxlen=STATS_JOBS)  # average rate of finished jobs
+
+
+def configure(limit=None, host_limits=None):
+    """Set the global cap and per-host caps (bytes per second, 0 = unlimited)"""
+    if limit is not None:
+        set_limit(limit)
+    for host, rate in (host_limits or {}).items():
+        set_host_limit(host, rate)
+
+
+def set_limit(rate):
+    """Change the global cap; takes effect on the next chunk of every download"""
+    global LIMIT, _global
+    with _lock:
+        LIMIT = max(0, int(rate or 0))
+        if not LIMIT:
+            _global = None
+        elif _global is None:
+            _global = SharedLimit(LIMIT)
+        else:
+            _global.set_rate(LIMIT)
+
+
+def set_host_limit(host, rate):
+    """Cap the traffic from `host` and its subdomains (0 removes the cap)"""
+    host = host.lower()
+    with _lock:
+        rate = max(0, int(rate or 0))
+        if not rate:
+            HOST_LIMITS.pop(host, None)
+            _hosts.pop(host, None)
+        else:
+            HOST_LIMITS[host] = rate
+            if host in _hosts:
+                _hosts[host].set_rate(rate)
+            else:
+                _hosts[host] = SharedLimit(rate)
+
+
+def _host_limit(host):
+    # www.beatstars.com matches a cap on beatstars.com
+    host = (host or "").lower()
+    while host:
+        limit = _hosts.get(host)
+        if limit is not None:
+            return limit
+        host = host.partition(".")[2]
+    return None
+
+
+def limits(host):
+    """The caps that apply to traffic from `host`"""
+    with _lock:
+        found = [_global] if _global is not None else []
+        if _hosts:
+            limit = _host_limit(host)
+            if limit is not None:
+                found.append(limit)
+        return found
+
+
+def chunk_size(host, default):
+    """Read size for `host`: smaller under a cap so throttling stays smooth"""
+    rates = [limit.chunk_rate() for limit in limits(host)]
+    if not rates:
+        return default
+    return max(16 * 1024, min(default, int(min(rates) * CHUNK_SECONDS)))
+
+
+def delay(n, host):
+    """Record `n` bytes read from `host` by the current job; returns seconds to wait"""
+    job_id = _current_job.get()
+    wait = 0.0
+    for limit in limits(host):
+        wait = max(wait, limit.take(job_id, n))
+    # A job's transfer lasts until its last wait is over
+    now = time.monotonic()
+    with _lock:
+        transfer = _transfers.get(job_id)
+        if transfer is None:
+            _transfers[job_id] = [n, now, now + wait]
+        else:
+            transfer[0] += n
+            transfer[2] = now + wait
+    return wait
+
+
+def throttle(n, host):
+    wait = delay(n, host)
+    if wait > 0:
+        time.sleep(wait)
+
+
+async def throttle_async(n, host):
+    import asyncio
+
+    wait = delay(n, host)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+def _end_transfer(job_id):
+    with _lock:
+        transfer = _transfers.pop(job_id, None)
+        if transfer is not None and transfer[2] > transfer[1]:
+            _rates.append(transfer[0] / (transfer[2] - transfer[1]))
+
+
+def stats():
+    """
+    Average throughput in bytes per second of every running job and of the
+    last STATS_JOBS finished ones that read data
+    """
+    with _lock:
+        return list(_rates) + [size / (last - first)
+                               for job_id, (size, first, last) in _transfers.items()
+                               if job_id is not None and last > first]
+
+
+def format_stats():
+    rates = sorted(stats())
+    if not rates:
+        return "per-job throughput: no data"
+    # Jain's index: 1.0 when every job got the same rate
+    fairness = sum(rates) ** 2 / (len(rates) * sum(r * r for r in rates))
+    limit = f", limit {format_rate(LIMIT)}" if LIMIT else ""
+    return (f"per-job throughput: {len(rates)} jobs, min {format_rate(rates[0])}, "
+            f"median {format_rate(rates[len(rates) // 2])}, max {format_rate(rates[-1])}, "
+            f"fairness {fairness:.2f}{limit}")
@@ -0,0 +1,324 @@
+"""
+Retries and per-host circuit breakers.
+Failures are classified into the typed errors of src.core.errors; only
+transient ones (timeouts, dropped connections, 5xx, 429) are retried, with
+exponential backoff and full jitter. A shared retry budget caps retries to
+a fraction of the work done, so an outage does not multiply the load, and
+a host that keeps failing gets its circuit opened: requests to it fail
+fast until a cool-down has passed and a single trial request succeeds.
+"""
+import sys
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+from src.core import metrics
+from src.core.errors import (DownloadError, TransientError, CircuitOpenError,
+                             UnavailableError, error_for_status)
+
+ATTEMPTS = 4          # tries per operation, including the first one
+BASE_DELAY = 0.5      # seconds before the first retry
+MAX_DELAY = 30.0      # cap on a single backoff or Retry-After wait
+BUDGET_RATIO = 0.2    # retries allowed per first attempt, on average
+BUDGET_MIN = 10       # retries available up front, so small batches can retry
+BUDGET_MAX = 100      # tokens saved up at most
+FAILURE_THRESHOLD = 5  # consecutive failures that open a host's circuit
+COOLDOWN = 30.0       # seconds a circuit stays open
+
+log = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats = {"retries": 0, "budget_exhausted": 0, "circuits_opened": 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(exc):
+    """
+    Return the typed DownloadError for any exception raised by a download.
+    A DownloadError raised `from` a lower-level exception is typed after its
+    cause but keeps its own (user-facing) message.
+    """
+    if isinstance(exc, DownloadError) and type(exc) is not DownloadError:
+        return exc
+    cause = exc
+    seen = set()
+    # `raise error from e` with error being e makes an exception its own cause
+    while cause is not None and id(cause) not in seen:
+        seen.add(id(cause))
+        typed = _classify_one(cause)
+        if typed is not None:
+            if cause is not exc:
+                typed = type(typed)(str(exc), status=typed.status, host=typed.host,
+                                    retry_after=typed.retry_after)
+            return typed
+        cause = cause.__cause__
+    if isinstance(exc, DownloadError):
+        return exc
+    return DownloadError(str(exc))
+
+
+def _classify_one(exc):
+    # Imported here rather than at startup: only failures need them
+    import socket
+    import http.client
+    import urllib.error
+    import requests
+
+    message = str(exc)
+    if isinstance(exc, DownloadError):
+        return exc if type(exc) is not DownloadError else None
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        r = exc.response
+        return error_for_status(r.status_code, message, retry_after=parse_retry_after(r.headers.get("Retry-After")))
+    if isinstance(exc, urllib.error.HTTPError):
+        return error_for_status(exc.code, message, retry_after=parse_retry_after(exc.headers.get("Retry-After")))
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError, urllib.error.URLError,
+                        socket.timeout, ConnectionError, http.client.IncompleteRead,
+                        requests.exceptions.ChunkedEncodingError)):
+        return TransientError(message)
+    if "pytubefix" not in sys.modules:
+        return None  # cannot be a pytubefix error
+    from pytubefix import exceptions as pytube_errors
+    if isinstance(exc, (pytube_errors.VideoUnavailable, pytube_errors.AgeRestrictedError,
+                        pytube_errors.LiveStreamError, pytube_errors.MembersOnly)):
+        return UnavailableError(message)
+    return None
+
+
+class RetryBudget:
+    """Token bucket shared by all operations: first attempts earn tokens, retries spend them"""
+
+    def __init__(self, ratio=BUDGET_RATIO, minimum=BUDGET_MIN, maximum=BUDGET_MAX):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.tokens = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.maximum)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Failure tracker of one host. After `threshold` consecutive transient
+    failures (or a 429 with Retry-After) the circuit opens and before()
+    raises CircuitOpenError until the cool-down ends; then one trial request
+    is let through and its outcome closes or reopens the circuit. Every
+    trial must end in success(), failure() or release().
+    """
+
+    def __init__(self, host, threshold=None, cooldown=None):
+        self.host = host
+        self.threshold = threshold or FAILURE_THRESHOLD
+        self.cooldown = cooldown or COOLDOWN
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.open_until > time.monotonic()
+
+    def before(self):
+        with self._lock:
+            if not self.open_until:
+                return
+            now = time.monotonic()
+            if now < self.open_until:
+                wait = self.open_until - now
+            elif self.trial:
+                # Someone else is making the trial request
+                wait = 1.0
+            else:
+                self.trial = True
+                return
+        raise CircuitOpenError(f"Too many failures from {self.host}, pausing requests for {wait:.0f}s",
+                               host=self.host, retry_after=wait)
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.trial = False
+
+    def release(self):
+        """End a trial request that gave no verdict (e.g. it was cancelled)"""
+        with self._lock:
+            self.trial = False
+
+    def failure(self, retry_after=None):
+        with self._lock:
+            self.failures += 1
+            reopen = self.trial or self.failures >= self.threshold or retry_after
+            self.trial = False
+            if reopen:
+                if not self.is_open:
+                    _count("circuits_opened")
+                # A Retry-After from the server replaces the default cool-down
+                wait = min(retry_after, MAX_DELAY) if retry_after else self.cooldown
+                self.open_until = time.monotonic() + wait
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+BUDGET = RetryBudget()
+
+
+def breaker(host):
+    """The shared circuit breaker of a host"""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def record(host, status=None, error=None, headers=None):
+    """Feed the outcome of one request to the host's breaker"""
+    if error is not None:
+        if classify(error).retryable:
+            breaker(host).failure()
+        else:
+            # The host answered (private video, 404...): it is up
+            breaker(host).success()
+        return
+    if status == 429:
+        breaker(host).failure(parse_retry_after((headers or {}).get("Retry-After")))
+    elif status >= 500:
+        breaker(host).failure()
+    else:
+        breaker(host).success()
+
+
+@contextmanager
+def circuit(host):
+    """Guard a block of requests to `host` that bypass src.core.transport"""
+    breaker(host).before()
+    try:
+        yield
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError):
+            record(host, error=e)
+        raise
+    except BaseException:
+        breaker(host).release()
+        raise
+    breaker(host).success()
+
+
+class RetryPolicy:
+    """How often and how long to retry an operation"""
+
+    def __init__(self, attempts=None, base_delay=None, max_delay=None, budget=None):
+        self.attempts = attempts or ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else MAX_DELAY
+        self.budget = budget or BUDGET
+
+    def delay(self, attempt, error):
+        """Seconds to wait before retry number `attempt` (1-based), or None to give up"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if error.retry_after is not None:
+            if error.retry_after > self.max_delay:
+                return None
+            return max(backoff, error.retry_after)
+        return backoff
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def configure(attempts=None, max_delay=None):
+    global DEFAULT_POLICY
+    DEFAULT_POLICY = RetryPolicy(attempts=attempts or DEFAULT_POLICY.attempts,
+                                 max_delay=max_delay if max_delay is not None else DEFAULT_POLICY.max_delay)
+
+
+def call(operation, policy=None, host=None, description="request"):
+    """
+    Run `operation()` until it succeeds or fails for good, and return its
+    result. Failures are raised as typed DownloadErrors. With `host`, the
+    operation is guarded by that host's circuit breaker (for requests that
+    do not go through src.core.transport, which records its own).
+    """
+    policy = policy or DEFAULT_POLICY
+    policy.budget.deposit()
+    attempt = 1
+    while True:
+        try:
+            if host:
+                with circuit(host):
+                    return operation()
+            return operation()
+        except Exception as e:
+            time.sleep(retry_delay(e, attempt, policy, description))
+            attempt += 1
+
+
+def retry_delay(exc, attempt, policy=None, description="request"):
+    """
+    One turn of the retry loop, shared by call() and aio.call(): classify
+    the failure of attempt number `attempt` and return the seconds to wait
+    before the next one, or raise it as a typed DownloadError when it is not
+    retried. Must be called from the `except` block handling `exc`.
+    """
+    policy = policy or DEFAULT_POLICY
+    error = classify(exc)
+    metrics.count_error(error)
+    if not error.retryable or attempt >= policy.attempts:
+        raise error from exc
+    delay = policy.delay(attempt, error)
+    if delay is None:
+        raise error from exc
+    if not policy.budget.withdraw():
+        _count("budget_exhausted")
+        raise error from exc
+    _count("retries")
+    log.debug("%s failed (%s), retry %d in %.1fs", description, error, attempt, delay)
+    return delay
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    with _breakers_lock:
+        result["open_circuits"] = sorted(host for host, b in _breakers.items() if b.is_open)
+    return result
+
+
+def format_stats():
+    s = stats()
+    text = (f"retries: {s['retries']} ({s['budget_exhausted']} refused by the budget), "
+            f"circuits opened: {s['circuits_opened']}")
+    if s["open_circuits"]:
+        text += f" (still open: {', '.join(s['open_circuits'])})"
+    return text
@@ -0,0 +1,195 @@
+"""
+Segmented multi-connection downloads.
+A file is split into byte ranges fetched in parallel over several
+connections and written at their offsets into the writer's preallocated
+.part file. Workers that run out of ranges steal the second half of the
+range with the longest estimated remaining time, so a slow connection
+never holds the whole download back.
+"""
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.errors import error_for_status
+from src.core.writer import MAX_CHUNK, iter_body, parse_content_range
+
+CONNECTIONS = 4                # parallel connections per download
+THRESHOLD = 8 * 1024 * 1024    # smaller downloads use a single connection
+MIN_SEGMENT = 1024 * 1024      # never split or steal below this size
+
+
+def configure(connections=None, threshold=None):
+    global CONNECTIONS, THRESHOLD
+    if connections:
+        CONNECTIONS = connections
+    if threshold is not None:
+        THRESHOLD = threshold
+
+
+def should_split(remaining, accept_ranges=True, connections=None):
+    """Whether a download of `remaining` bytes is worth segmenting"""
+    connections = connections or CONNECTIONS
+    return accept_ranges and connections > 1 and remaining >= max(THRESHOLD, 2 * MIN_SEGMENT)
+
+
+class Segment:
+    def __init__(self, start, end):
+        self.pos = start   # next byte to request/claim
+        self.done = start  # bytes before this are on disk
+        self.end = end     # exclusive, may shrink when another worker steals
+        self.active = False
+        self.started_at = 0.0
+        self.started_pos = start
+
+    @property
+    def remaining(self):
+        return max(0, self.end - self.pos)
+
+    def eta(self, now):
+        # Estimated seconds left at this segment's own rate
+        elapsed = now - self.started_at
+        rate = (self.pos - self.started_pos) / elapsed if elapsed > 0 else 0
+        return self.remaining / rate if rate > 0 else float("inf")
+
+
+class SegmentedDownload:
+    """
+    Fill the missing ranges of `writer` using `fetch(start, end)`, which must
+    return a streamed response for bytes [start, end). With `max_request`,
+    each request covers at most that many bytes (googlevideo throttles long
+    ranges). `first_response` is an already open response starting at the
+    first missing byte; it is used for the first segment.
+    """
+
+    def __init__(self, writer, fetch, connections=None, max_request=None, first_response=None):
+        self.writer = writer
+        self.fetch = fetch
+        self.connections = connections or CONNECTIONS
+        self.max_request = max_request
+        self.first_response = first_response
+        self.error = None
+        self._lock = threading.Lock()
+
+        ranges = writer.segments or [[writer.written, writer.total]]
+        self.segments = [Segment(start, end) for start, end in sorted(ranges) if end > start]
+        self._split_initial()
+        self._sync_state()
+
+    def _split_initial(self):
+        # Cut the largest ranges until there is one per connection
+        while len(self.segments) < self.connections:
+            largest = max(self.segments, key=lambda s: s.remaining, default=None)
+            if largest is None or largest.remaining < 2 * MIN_SEGMENT:
+                break
+            mid = largest.pos + largest.remaining // 2
+            self.segments.append(Segment(mid, largest.end))
+            largest.end = mid
+        self.segments.sort(key=lambda s: s.pos)
+
+    def _sync_state(self):
+        # Missing ranges, as recorded in the resume sidecar
+        self.writer.segments = [[s.done, s.end] for s in self.segments if s.done < s.end]
+
+    def _next_segment(self):
+        with self._lock:
+            if self.error:
+                return None
+            now = time.monotonic()
+            segment = next((s for s in self.segments if not s.active and s.remaining), None)
+            if segment is None:
+                # Steal half of the range that would take longest to finish
+                busy = [s for s in self.segments if s.active and s.remaining >= 2 * MIN_SEGMENT]
+                if not busy:
+                    return None
+                victim = max(busy, key=lambda s: s.eta(now))
+                mid = victim.pos + victim.remaining // 2
+                segment = Segment(mid, victim.end)
+                victim.end = mid
+                self.segments.append(segment)
+            segment.active = True
+            segment.started_at = now
+            segment.started_pos = segment.pos
+            return segment
+
+    def _open(self, segment, end):
+        response = None
+        with self._lock:
+            if self.first_response is not None and segment.pos == self.writer.resume_offset:
+                response, self.first_response = self.first_response, None
+        if response is None:
+            response = self.fetch(segment.pos, end)
+        if response.status_code == 206:
+            start, _ = parse_content_range(response.headers.get("Content-Range"))
+            if start != segment.pos:
+                response.close()
+                raise IOError(f"Server returned range starting at {start}, expected {segment.pos}")
+        elif response.status_code != 200:
+            response.close()
+            raise error_for_status(response.status_code, f"Range request failed with HTTP {response.status_code}")
+        elif segment.pos and not self.max_request:
+            # A plain 200 is only fine for range-by-query-parameter servers
+            response.close()
+            raise IOError("Server ignored the range request")
+        return response
+
+    def _fetch_segment(self, segment, view):
+        while True:
+            with self._lock:
+                if self.error or segment.pos >= segment.end:
+                    return
+                end = segment.end
+                if self.max_request:
+                    end = min(end, segment.pos + self.max_request)
+
+            with self._open(segment, end) as response:
+                for data in iter_body(response, view):
+                    with self._lock:
+                        if self.error:
+                            return
+                        # The end may have moved if another worker stole from us
+                        data = data[:max(0, min(end, segment.end) - segment.pos)]
+                        offset = segment.pos
+                        segment.pos += len(data)
+                    if data:
+                        self.writer.write_at(offset, data)
+                        with self._lock:
+                            segment.done += len(data)
+                            self._sync_state()
+                            self.writer.advance(len(data))
+                    if segment.pos >= min(end, segment.end):
+                        break
+                else:
+                    if segment.pos < end:
+                        raise IOError(f"Range ended early at byte {segment.pos}, expected {end}")
+
+    def _worker(self):
+        view = memoryview(bytearray(MAX_CHUNK))
+        try:
+            while True:
+                segment = self._next_segment()
+                if segment is None:
+                    return
+                try:
+                    self._fetch_segment(segment, view)
+                finally:
+                    with self._lock:
+                        segment.active = False
+        except Exception as e:
+            with self._lock:
+                self.error = self.error or e
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.connections) as pool:
+            for _ in range(self.connections):
+                # Workers charge their traffic to the caller's job (ratelimit.job)
+                pool.submit(contextvars.copy_context().run, self._worker)
+        if self.first_response is not None:
+            self.first_response.close()
+        if self.error:
+            raise self.error
+        with self._lock:
+            self._sync_state()
+            if self.writer.segments:
+                raise IOError("Segmented download finished with missing ranges")
+            self.writer.segments = None
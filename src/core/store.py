@@ -0,0 +1,198 @@
+"""
+Content-addressed download store.
+Finished downloads are kept under their SHA-256 and indexed by source
+identity ("beatstars:<id>", "youtube:<video id>:<itag>"), so a repeat
+request is served by cloning the stored file into the target path
+instead of downloading it again. The store is bounded in size and evicts
+the least recently used objects.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from src.core.cache import cache_dir
+
+log = logging.getLogger(__name__)
+
+MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+HASH_CHUNK = 1024 * 1024
+FICLONE = 0x40049409  # Linux reflink ioctl
+
+# Hardlinked targets share their data with the store: only enable this when
+# downloaded files are never modified in place
+HARDLINK = False
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
+
+
+def clone_file(src, dst, hardlink=False):
+    """Copy src to dst as cheaply as possible; returns the method used"""
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if hardlink:
+            try:
+                os.link(src, tmp)
+                os.replace(tmp, dst)
+                return "hardlink"
+            except OSError:
+                pass
+        if _reflink(src, tmp):
+            method = "reflink"
+        else:
+            shutil.copyfile(src, tmp)
+            method = "copy"
+        os.replace(tmp, dst)
+        return method
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class Store:
+    """Size-bounded store of downloaded files, keyed by source identity"""
+
+    def __init__(self, root=None, max_bytes=MAX_BYTES):
+        self.root = root or cache_dir("store")
+        self.objects = os.path.join(self.root, "objects")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.objects, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, "index.sqlite"),
+                                   check_same_thread=False, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects ("
+                             "digest TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                             "key TEXT PRIMARY KEY, digest TEXT, name TEXT)")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def lookup(self, key):
+        """Return (object path, original file name) for a key, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT digest, name FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            digest, name = row
+            path = self.object_path(digest)
+            if not os.path.exists(path):
+                # Removed behind our back
+                with self._db:
+                    self._db.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+                    self._db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                return None
+            with self._db:
+                self._db.execute("UPDATE objects SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            return path, name
+
+    def materialize(self, key, target):
+        """Clone the stored file for `key` to `target`; returns the method used or None"""
+        found = self.lookup(key)
+        if found is None:
+            return None
+        directory = os.path.dirname(os.path.abspath(target))
+        os.makedirs(directory, exist_ok=True)
+        try:
+            return clone_file(found[0], target, hardlink=HARDLINK)
+        except OSError as e:
+            # Evicted meanwhile or unreadable: the caller downloads instead
+            log.warning("Could not copy %s from the store: %s", key, e)
+            return None
+
+    def add(self, path, *keys):
+        """Store a finished download under one or more keys; returns its digest"""
+        digest = file_digest(path)
+        size = os.path.getsize(path)
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            clone_file(path, object_path)
+        with self._lock:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                                 (digest, size, time.time()))
+                for key in keys:
+                    self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                     (key, digest, os.path.basename(path)))
+            self._evict()
+        return digest
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT digest, size FROM objects ORDER BY last_used").fetchall()
+        with self._db:
+            for digest, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.object_path(digest))
+                except OSError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+                self._db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                total -= size
+
+    def size(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+ENABLED = os.environ.get("EMERGENCY_BEAT_STORE", "1") != "0"
+
+
+def configure(enabled=None, max_bytes=None, hardlink=None):
+    global ENABLED, MAX_BYTES, HARDLINK
+    if enabled is not None:
+        ENABLED = enabled
+    if max_bytes is not None:
+        MAX_BYTES = max_bytes
+        if _store:
+            _store.max_bytes = max_bytes
+    if hardlink is not None:
+        HARDLINK = hardlink
+
+
+def get_store():
+    """Return the shared store, or None when it is disabled"""
+    global _store
+    if not ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = Store(max_bytes=MAX_BYTES)
+        return _store
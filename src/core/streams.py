@@ -0,0 +1,107 @@
+"""
+Audio stream selection.
+Ranks the stream manifest of a video (see youtube.stream_manifest) once
+against a policy and returns the chosen stream with its alternates, instead
+of probing itags and re-filtering the stream list for every fallback.
+"""
+import re
+
+# Format names used in policies, by audio codec and (for manifests without
+# codecs) by mime type
+CODECS = {"opus": "opus", "mp4a": "m4a", "vorbis": "vorbis"}
+FORMATS = {"audio/webm": "opus", "audio/mp4": "m4a"}
+
+
+def bitrate(value):
+    """Leading number of an abr/resolution label: "160kbps" -> 160, "720p" -> 720"""
+    match = re.search(r"\d+", value or "")
+    return int(match.group(0)) if match else 0
+
+
+def stream_format(stream):
+    codec = stream.get("audio_codec")
+    if codec:
+        return CODECS.get(codec.split(".")[0], "other")
+    return FORMATS.get(stream["mime_type"].split(";")[0].strip(), "other")
+
+
+class StreamPolicy:
+    """
+    What makes a stream the best one for a download.
+
+    `prefer` lists audio formats in order of preference: a stream of the
+    first format that has one qualifying wins over any bitrate of the next,
+    and streams in other formats are only picked when none of these qualify.
+    Within a format, the stream closest to `target_abr` (kbps) wins, or the
+    highest bitrate when no target is set. `max_abr` and `max_filesize` (bytes) exclude streams
+    outright. Progressive (audio+video) streams are a last resort unless
+    `allow_progressive` is False.
+    """
+
+    def __init__(self, prefer=("opus", "m4a"), target_abr=None, max_abr=None,
+                 max_filesize=None, allow_progressive=True):
+        self.prefer = tuple(prefer)
+        self.target_abr = target_abr
+        self.max_abr = max_abr
+        self.max_filesize = max_filesize
+        self.allow_progressive = allow_progressive
+
+    def rank_key(self, stream):
+        """Sort key of a stream (lower is better), or None if it is excluded"""
+        audio_only = stream["audio"] and not stream["video"]
+        if not audio_only and not (stream["progressive"] and self.allow_progressive):
+            return None
+        if self.max_filesize and stream["filesize"] and stream["filesize"] > self.max_filesize:
+            return None
+
+        if not audio_only:
+            # Progressive fallback: best resolution, like the old last resort
+            return (1, 0, -bitrate(stream["resolution"]))
+
+        abr = bitrate(stream["abr"])
+        if self.max_abr and abr > self.max_abr:
+            return None
+        if self.target_abr:
+            # Closest to the target, the higher one on a tie
+            distance = (abs(abr - self.target_abr), -abr)
+        else:
+            distance = -abr
+        fmt = stream_format(stream)
+        rank = self.prefer.index(fmt) if fmt in self.prefer else len(self.prefer)
+        return (0, rank, distance)
+
+
+DEFAULT_POLICY = StreamPolicy()
+
+
+def configure(prefer=None, target_abr=None, max_abr=None, max_filesize=None, allow_progressive=None):
+    """Change the policy used when a download does not pass its own"""
+    global DEFAULT_POLICY
+    DEFAULT_POLICY = StreamPolicy(
+        prefer=prefer or DEFAULT_POLICY.prefer,
+        target_abr=target_abr if target_abr is not None else DEFAULT_POLICY.target_abr,
+        max_abr=max_abr if max_abr is not None else DEFAULT_POLICY.max_abr,
+        max_filesize=max_filesize if max_filesize is not None else DEFAULT_POLICY.max_filesize,
+        allow_progressive=(allow_progressive if allow_progressive is not None
+                           else DEFAULT_POLICY.allow_progressive),
+    )
+
+
+def rank(manifest, policy=None):
+    """All eligible streams of a manifest, best first"""
+    policy = policy or DEFAULT_POLICY
+    keyed = []
+    for index, stream in enumerate(manifest):
+        key = policy.rank_key(stream)
+        if key is not None:
+            keyed.append((key, index, stream))
+    keyed.sort(key=lambda item: item[:2])
+    return [stream for _, _, stream in keyed]
+
+
+def select(manifest, policy=None):
+    """Return (chosen stream, alternates in order), or (None, []) if nothing qualifies"""
+    ranked = rank(manifest, policy)
+    if not ranked:
+        return None, []
+    return ranked[0], ranked[1:]
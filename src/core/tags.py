@@ -0,0 +1,508 @@
+"""
+Metadata tags of downloaded files, edited without rewriting the audio.
+MP3 files carry an ID3v2 tag at the start of the file. Downloads reserve it
+while they stream (a tag followed by PADDING zero bytes), so later edits
+rewrite the tag in place. MP4/M4A tags live in the moov box: they are
+rewritten in place when the box (and the padding kept after the tags) has
+room, and otherwise the box moves to the end of the file and its old place
+becomes padding. The audio data never moves, so tagging a file costs a few
+kilobytes of I/O whatever its size. Only an MP3 without room for its tag
+(one that was not downloaded here) is copied once, with padding for next
+time.
+
+Tags are the title, artist, source URL and Beatstars ID of a download.
+"""
+import os
+import shutil
+import struct
+import logging
+
+log = logging.getLogger(__name__)
+
+PADDING = 4096  # bytes kept free after the tags for later edits
+ENABLED = True
+
+TITLE = "title"
+ARTIST = "artist"
+URL = "url"
+BEAT_ID = "beat_id"
+FIELDS = (TITLE, ARTIST, URL, BEAT_ID)
+
+MP3_EXTENSIONS = (".mp3",)
+MP4_EXTENSIONS = (".m4a", ".mp4", ".m4b")
+# Response types an MP3 may be served as (an empty one is not declared)
+MP3_TYPES = ("audio/mpeg", "audio/mp3", "audio/mpeg3", "application/octet-stream",
+             "binary/octet-stream", "")
+BEAT_URL = "https://www.beatstars.com/beat/{beat_id}"
+
+
+def configure(enabled=None, padding=None):
+    global ENABLED, PADDING
+    if enabled is not None:
+        ENABLED = enabled
+    if padding is not None:
+        PADDING = padding
+
+
+def supported(path):
+    return path.lower().endswith(MP3_EXTENSIONS + MP4_EXTENSIONS)
+
+
+def for_source(source, source_id, title=None, artist=None):
+    """Tag values of a download from "beatstars" or "youtube" (the batch source names)"""
+    if source == "beatstars":
+        return {TITLE: title, ARTIST: artist, URL: BEAT_URL.format(beat_id=source_id), BEAT_ID: source_id}
+    return {TITLE: title, ARTIST: artist, URL: f"https://www.youtube.com/watch?v={source_id}"}
+
+
+def header(path, values, content_type=None):
+    """
+    Padded tag a download of `path` starts with (empty when not tagged).
+    With the `content_type` of the response, payloads that are declared as
+    something other than MP3 (WAV, archives...) get none.
+    """
+    if not ENABLED or not path.lower().endswith(MP3_EXTENSIONS):
+        return b""
+    if content_type is not None and content_type.split(";")[0].strip().lower() not in MP3_TYPES:
+        return b""
+    return id3_tag(values)
+
+
+def settle(path, values):
+    """
+    Check a finished download that started with header(): a tag the payload
+    brought along is merged into ours, and ours is removed again (one copy of
+    the file) when the payload is not MPEG audio after all. Never raises.
+    """
+    if not ENABLED or not path.lower().endswith(MP3_EXTENSIONS):
+        return
+    try:
+        with open(path, "rb") as f:
+            header = _id3_header(f)
+            if header is None:
+                return
+            f.seek(header[2])
+            head = f.read(3)
+        if head == b"ID3":
+            try:
+                # Only our non-empty fields: the payload's own artist is kept
+                write(path, {field: value for field, value in values.items() if value})
+                return
+            except ValueError as e:
+                log.debug("Cannot merge the tags of %s (%s), removing ours", path, e)
+        elif len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+            return  # MPEG frame sync: audio right after our tag
+        _rewrite(path, b"", header[2])
+    except OSError as e:
+        log.debug("Could not check the tag of %s: %s", path, e)
+
+
+def update(path, values):
+    """write() for downloads: a no-op when tagging is off, never raises"""
+    if not ENABLED or not supported(path):
+        return
+    try:
+        write(path, values)
+    except (OSError, ValueError) as e:
+        log.debug("Could not tag %s: %s", path, e)
+
+
+def ffmpeg_metadata(values):
+    """-metadata options writing `values` with ffmpeg's own muxers"""
+    names = {TITLE: "title", ARTIST: "artist", URL: "comment"}
+    options = []
+    for field, name in names.items():
+        if values.get(field):
+            options += ["-metadata", f"{name}={values[field]}"]
+    return options
+
+
+def read(path):
+    """The tag values of a file (missing ones are absent)"""
+    with open(path, "rb") as f:
+        if path.lower().endswith(MP4_EXTENSIONS):
+            return _read_mp4(f)
+        return _read_id3(f)
+
+
+def audio_offset(path):
+    """Offset of the audio in an MP3 file: the size of its ID3v2 tag"""
+    with open(path, "rb") as f:
+        header = _id3_header(f)
+    return header[2] if header else 0
+
+
+def write(path, values):
+    """
+    Set the tags of `path`: fields in `values` replace the current ones
+    (a false value removes it), other tags are kept. Returns the number of
+    bytes written. Raises ValueError for unsupported files.
+    """
+    if os.stat(path).st_nlink > 1:
+        # e.g. hardlinked from the download store: editing it would change every copy
+        raise ValueError("Hardlinked files are not tagged in place")
+    if path.lower().endswith(MP3_EXTENSIONS):
+        return _write_id3(path, values)
+    if path.lower().endswith(MP4_EXTENSIONS):
+        return _write_mp4(path, values)
+    raise ValueError(f"Tags are not supported for {os.path.splitext(path)[1] or 'this'} files")
+
+
+def retag(items, workers=4):
+    """
+    Write the tags of many files in parallel; `items` yields (path, values).
+    Returns (files tagged, files skipped, bytes written).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(item):
+        path, values = item
+        try:
+            return write(path, values)
+        except (OSError, ValueError) as e:
+            log.debug("Not tagged: %s (%s)", path, e)
+            return None
+
+    tagged = skipped = written = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retag") as pool:
+        for result in pool.map(one, items):
+            if result is None:
+                skipped += 1
+            else:
+                tagged += 1
+                written += result
+    return tagged, skipped, written
+
+
+# ID3v2
+
+_ID3_TEXT = {TITLE: b"TIT2", ARTIST: b"TPE1"}
+_ID3_URL = b"WOAS"  # official audio source webpage
+_ID3_BEAT_ID = "BEATSTARS_ID"  # TXXX description
+
+
+def _synchsafe(n):
+    return bytes(((n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F))
+
+
+def _unsynchsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_header(f, offset=0):
+    # (version, flags, total tag length) of the tag at `offset` of `f`, or None
+    f.seek(offset)
+    head = f.read(10)
+    if len(head) < 10 or head[:3] != b"ID3" or head[3] not in (2, 3, 4):
+        return None
+    footer = 10 if head[3] == 4 and head[5] & 0x10 else 0
+    return head[3], head[5], 10 + _unsynchsafe(head[6:10]) + footer
+
+
+def _id3_frames(f, header, offset=0):
+    # [(frame id, data)] of a tag we can copy frame by frame, else [] (not rewritten)
+    version, flags, total = header
+    if version < 3 or flags & 0xC0:
+        return []  # ID3v2.2, or an unsynchronised tag / extended header
+    f.seek(offset + 10)
+    body = f.read(total - 10)
+    frames = []
+    pos = 0
+    while pos + 10 <= len(body) and body[pos:pos + 1] != b"\0":
+        frame_id = body[pos:pos + 4]
+        size = _unsynchsafe(body[pos + 4:pos + 8]) if version == 4 else struct.unpack(">I", body[pos + 4:pos + 8])[0]
+        if body[pos + 8:pos + 10] == b"\0\0":
+            frames.append((frame_id, body[pos + 10:pos + 10 + size]))
+        pos += 10 + size
+    return frames
+
+
+def _id3_text(data):
+    # Text of a text frame body: encoding byte, then the string
+    encoding, raw = data[:1], data[1:]
+    codec = {b"\0": "latin-1", b"\1": "utf-16", b"\2": "utf-16-be"}.get(encoding, "utf-8")
+    return raw.decode(codec, errors="replace").rstrip("\0")
+
+
+def _id3_encode(text, version):
+    # UTF-8 only exists in ID3v2.4; v2.3 tags get UTF-16 with a BOM
+    return b"\3" + text.encode() if version == 4 else b"\1" + text.encode("utf-16")
+
+
+def _is_beat_id(frame_id, data):
+    return frame_id == b"TXXX" and _id3_text(data).split("\0")[0] == _ID3_BEAT_ID
+
+
+def _id3_body(frames, values, version):
+    # Frames of the new tag: the kept ones, then ours
+    replaced = {_ID3_TEXT[field] for field in _ID3_TEXT if field in values}
+    if URL in values:
+        replaced.add(_ID3_URL)
+    kept = [(frame_id, data) for frame_id, data in frames
+            if frame_id not in replaced and not (BEAT_ID in values and _is_beat_id(frame_id, data))]
+    for field, frame_id in _ID3_TEXT.items():
+        if values.get(field):
+            kept.append((frame_id, _id3_encode(str(values[field]), version)))
+    if values.get(URL):
+        kept.append((_ID3_URL, values[URL].encode("latin-1", errors="replace")))
+    if values.get(BEAT_ID):
+        kept.append((b"TXXX", _id3_encode(f"{_ID3_BEAT_ID}\0{values[BEAT_ID]}", version)))
+    size = _synchsafe if version == 4 else (lambda n: struct.pack(">I", n))
+    return b"".join(frame_id + size(len(data)) + b"\0\0" + data for frame_id, data in kept)
+
+
+def _id3_tag(body, total, version=4):
+    # A tag of exactly `total` bytes: header, frames, zero padding
+    return b"ID3" + bytes((version, 0, 0)) + _synchsafe(total - 10) + body + bytes(total - 10 - len(body))
+
+
+def id3_tag(values, padding=None):
+    """A new ID3v2.4 tag holding `values`, followed by `padding` free bytes"""
+    body = _id3_body([], values, 4)
+    return _id3_tag(body, 10 + len(body) + (PADDING if padding is None else padding))
+
+
+def _read_id3(f):
+    header = _id3_header(f)
+    values = {}
+    for frame_id, data in _id3_frames(f, header) if header else []:
+        for field, text_id in _ID3_TEXT.items():
+            if frame_id == text_id:
+                values[field] = _id3_text(data)
+        if frame_id == _ID3_URL:
+            values[URL] = data.decode("latin-1").rstrip("\0")
+        elif _is_beat_id(frame_id, data):
+            values[BEAT_ID] = _id3_text(data).split("\0", 1)[1]
+    return values
+
+
+def _copyable(header):
+    if header[0] < 3 or header[1] & 0xC0:
+        # Its frames cannot be copied one by one: rewriting it would lose them
+        raise ValueError("ID3v2.2, unsynchronised or extended-header tags are not rewritten")
+
+
+def _write_id3(path, values):
+    with open(path, "r+b") as f:
+        header = _id3_header(f)
+        if header is not None:
+            _copyable(header)
+            frames = _id3_frames(f, header)
+            stacked = _id3_header(f, header[2])
+            if stacked is not None:
+                # Our download tag in front of the one the payload brought
+                # along: one tag in the payload's version covering both
+                _copyable(stacked)
+                frames = _id3_frames(f, stacked, header[2]) + frames
+                header = (stacked[0], 0, header[2] + stacked[2])
+            version = header[0]
+            body = _id3_body(frames, values, version)
+            if 10 + len(body) <= header[2]:
+                # Fits in the current tag and its padding: only the tag is written
+                tag = _id3_tag(body, header[2], version)
+                f.seek(0)
+                if f.read(len(tag)) == tag:
+                    return 0
+                f.seek(0)
+                f.write(tag)
+                return len(tag)
+        else:
+            body = _id3_body([], values, 4)
+    # No room before the audio: copy the file once behind a padded tag
+    start = header[2] if header else 0
+    version = header[0] if header else 4
+    _rewrite(path, _id3_tag(body, 10 + len(body) + PADDING, version), start)
+    log.debug("Rewrote %s to make room for its tags", path)
+    return os.path.getsize(path)
+
+
+def _rewrite(path, prefix, start):
+    # Replace the first `start` bytes of the file with `prefix` (copies the rest)
+    tmp = path + ".tag.tmp"
+    try:
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            dst.write(prefix)
+            src.seek(start)
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        shutil.copystat(path, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# MP4
+
+_MP4_TEXT = {TITLE: b"\xa9nam", ARTIST: b"\xa9ART"}
+_MP4_FREEFORM = {URL: "SOURCE_URL", BEAT_ID: "BEATSTARS_ID"}
+_MP4_MEAN = "com.apple.iTunes"
+_MP4_HDLR = b"\0" * 8 + b"mdirappl" + b"\0" * 9
+
+
+def _atom(kind, payload):
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def _children(data, start=0, end=None):
+    # (type, start, payload start, end) of the boxes in data[start:end]
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError("Malformed MP4 box")
+        yield kind, pos, pos + header, pos + size
+        pos += size
+
+
+def _top_level(f):
+    # Top-level boxes of the file, read header by header
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    boxes = []
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        size, kind = struct.unpack(">I4s", head[:8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", head[8:16])[0]
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header:
+            raise ValueError("Malformed MP4 box")
+        boxes.append((kind, pos, header, size))
+        pos += size
+    return boxes, file_size
+
+
+def _ilst_items(moov):
+    # Items of moov/udta/meta/ilst as (key, raw item box)
+    for kind, _, payload, end in _children(moov, 8):
+        if kind != b"udta":
+            continue
+        for kind, _, meta_payload, meta_end in _children(moov, payload, end):
+            if kind != b"meta":
+                continue
+            for kind, _, ilst_payload, ilst_end in _children(moov, meta_payload + 4, meta_end):
+                if kind == b"ilst":
+                    return [(item_kind, moov[start:item_end], moov[item_payload:item_end])
+                            for item_kind, start, item_payload, item_end in _children(moov, ilst_payload, ilst_end)]
+    return []
+
+
+def _item_value(kind, payload):
+    # (freeform name or item key, text value) of an ilst item
+    name = None
+    value = None
+    for child, _, start, end in _children(payload):
+        if child == b"name":
+            name = payload[start + 4:end].decode(errors="replace")
+        elif child == b"data" and value is None:
+            value = payload[start + 8:end].decode(errors="replace")
+    return (name if kind == b"----" else kind), value
+
+
+def _read_mp4(f):
+    boxes, _ = _top_level(f)
+    moov = next(((start, size) for kind, start, _, size in boxes if kind == b"moov"), None)
+    if moov is None:
+        return {}
+    f.seek(moov[0])
+    values = {}
+    for kind, _, payload in _ilst_items(f.read(moov[1])):
+        key, value = _item_value(kind, payload)
+        for field, item in _MP4_TEXT.items():
+            if key == item:
+                values[field] = value
+        for field, name in _MP4_FREEFORM.items():
+            if key == name:
+                values[field] = value
+    return values
+
+
+def _build_moov(moov, values, padding):
+    # moov with a new udta/meta/ilst; the other boxes are copied as they are
+    replaced = {_MP4_TEXT[field] for field in _MP4_TEXT if field in values}
+    replaced |= {_MP4_FREEFORM[field] for field in _MP4_FREEFORM if field in values}
+    items = [raw for kind, raw, payload in _ilst_items(moov)
+             if _item_value(kind, payload)[0] not in replaced]
+    data = lambda text: _atom(b"data", struct.pack(">II", 1, 0) + str(text).encode())
+    for field, key in _MP4_TEXT.items():
+        if values.get(field):
+            items.append(_atom(key, data(values[field])))
+    for field, name in _MP4_FREEFORM.items():
+        if values.get(field):
+            items.append(_atom(b"----", _atom(b"mean", b"\0" * 4 + _MP4_MEAN.encode())
+                               + _atom(b"name", b"\0" * 4 + name.encode()) + data(values[field])))
+
+    meta_children = [_atom(b"hdlr", _MP4_HDLR)]
+    udta_children = []
+    moov_children = []
+    for kind, start, payload, end in _children(moov, 8):
+        if kind != b"udta":
+            moov_children.append(moov[start:end])
+            continue
+        for child, child_start, child_payload, child_end in _children(moov, payload, end):
+            if child != b"meta":
+                udta_children.append(moov[child_start:child_end])
+                continue
+            meta_children = [moov[s:e] for k, s, _, e in _children(moov, child_payload + 4, child_end)
+                             if k not in (b"ilst", b"free")] or meta_children
+    meta_children.append(_atom(b"ilst", b"".join(items)))
+    if padding:
+        meta_children.append(_atom(b"free", bytes(padding - 8)))
+    udta_children.append(_atom(b"meta", b"\0" * 4 + b"".join(meta_children)))
+    return _atom(b"moov", b"".join(moov_children) + _atom(b"udta", b"".join(udta_children)))
+
+
+def _write_mp4(path, values):
+    with open(path, "r+b") as f:
+        boxes, file_size = _top_level(f)
+        if any(kind == b"moof" for kind, _, _, _ in boxes):
+            raise ValueError("Fragmented MP4 files are not supported")
+        index = next((i for i, box in enumerate(boxes) if box[0] == b"moov"), None)
+        if index is None:
+            raise ValueError("No moov box: not an MP4 file")
+        _, start, header, size = boxes[index]
+        if header != 8:
+            raise ValueError("64-bit moov boxes are not supported")
+        f.seek(start)
+        moov = f.read(size)
+
+        # Room in place: the moov box and the free boxes right after it
+        room = size
+        for kind, _, _, free_size in boxes[index + 1:]:
+            if kind != b"free":
+                break
+            room += free_size
+        needed = len(_build_moov(moov, values, 0))
+        if needed == room or needed + 8 <= room:
+            new = _build_moov(moov, values, room - needed)
+            if new == moov:
+                return 0
+            f.seek(start)
+            f.write(new)
+            return len(new)
+
+        new = _build_moov(moov, values, PADDING)
+        if start + room == file_size:
+            # Last in the file: it simply grows
+            f.seek(start)
+            f.write(new)
+            f.truncate()
+            return len(new)
+        # Move it to the end; the chunk offsets stay valid since the media does not move
+        f.seek(file_size)
+        f.write(new)
+        f.seek(start + 4)
+        f.write(b"free")
+        return len(new) + 4
@@ -0,0 +1,134 @@
+"""
+Thumbnail images of YouTube videos.
+Images are fetched on the shared asyncio loop through the pooled AsyncClient
+and kept in a size-bounded disk cache, so a thumbnail is downloaded once
+and later views read a small local file. Decoding is left to the caller,
+which passes a function run on a worker thread (the UI decodes to QImage).
+"""
+import os
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit
+
+from src.core.cache import cache_dir
+from src.core.errors import error_for_status
+
+log = logging.getLogger(__name__)
+
+MAX_BYTES = 64 * 1024 * 1024  # thumbnails kept on disk, about 4000 of them
+MAX_IMAGE_BYTES = 2 * 1024 * 1024  # larger responses are not images we want
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Small enough for the queue, large enough for the info panel
+VIDEO_THUMBNAIL_URL = "https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"
+
+
+def video_thumbnail_url(video_id):
+    return VIDEO_THUMBNAIL_URL.format(video_id=video_id)
+
+
+class DiskCache:
+    """
+    Files named after the hash of their URL, evicted least recently used
+    first (reads touch the file) once the folder grows past `max_bytes`
+    """
+
+    def __init__(self, root=None, max_bytes=MAX_BYTES):
+        self.root = root or cache_dir("thumbnails")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # bytes in the folder, counted on first write
+
+    def path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode()).hexdigest() + ".img")
+
+    def get(self, url):
+        path = self.path(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime is the last use; atime is often not updated
+            return data
+        except OSError:
+            return None
+
+    def put(self, url, data):
+        path = self.path(url)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total is None:
+                self._total = self._size()
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._trim()
+
+    def _size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.name.endswith(".img"))
+
+    def _trim(self):
+        # Down to 90% so that the next writes do not trim again right away
+        files = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                       for entry in os.scandir(self.root) if entry.name.endswith(".img"))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def disk_cache():
+    global _disk_cache
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            _disk_cache = DiskCache()
+        return _disk_cache
+
+
+async def fetch_async(url):
+    """Download an image with the shared client of the running loop"""
+    from src.core import aio
+
+    async def attempt():
+        async with await aio.client().get(url, HEADERS) as r:
+            if r.status_code >= 400:
+                raise error_for_status(r.status_code, f"{r.status_code} {r.reason} for url: {url}",
+                                       host=urlsplit(url).hostname)
+            if int(r.headers.get("Content-Length") or 0) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Thumbnail too large: {url}")
+            return await r.read()
+
+    return await aio.call(attempt, description="thumbnail")
+
+
+async def load_async(url, decode=None):
+    """
+    The image at `url`, from the disk cache or downloaded into it, passed
+    through `decode` on a worker thread when given
+    """
+    import asyncio
+
+    cache = disk_cache()
+    data = await asyncio.to_thread(cache.get, url)
+    if data is None:
+        data = await fetch_async(url)
+        await asyncio.to_thread(cache.put, url, data)
+    return await asyncio.to_thread(decode, data) if decode else data
+
+
+def load(url, decode=None):
+    """load_async() on the shared loop; returns a concurrent.futures.Future"""
+    from src.core import aio
+    return aio.loop_thread().submit(load_async(url, decode))
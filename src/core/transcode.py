@@ -0,0 +1,240 @@
+"""
+Streaming transcoding through ffmpeg.
+Downloaded chunks are piped straight into an ffmpeg subprocess that writes
+the encoded file, so encoding overlaps with the transfer and the source
+file never touches the disk. The number of encoders running at once is
+bounded (one per CPU by default) so batch jobs use every core without
+oversubscribing them.
+
+Tags are written at encode time: MP3 output is read from ffmpeg's stdout
+into a file that starts with a padded ID3 tag (see src.core.tags), so the
+tags can later be edited in place; other formats get ffmpeg's own tags.
+"""
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+from src.core import metrics, tags
+from src.core.errors import DownloadError
+from src.core.writer import MAX_CHUNK, PART_SUFFIX, iter_body
+
+log = logging.getLogger(__name__)
+
+# Output format -> (ffmpeg codec, ffmpeg muxer, file extension)
+FORMATS = {
+    "mp3": ("libmp3lame", "mp3", "mp3"),
+    "m4a": ("aac", "ipod", "m4a"),
+    "opus": ("libopus", "opus", "opus"),
+    "ogg": ("libvorbis", "ogg", "ogg"),
+    "flac": ("flac", "flac", "flac"),
+    "wav": ("pcm_s16le", "wav", "wav"),
+}
+LOSSLESS = ("flac", "wav")
+
+FORMAT = "mp3"
+BITRATE = "192k"
+ENABLED = True  # transcode when ffmpeg is available
+PROCESSES = os.cpu_count() or 1
+
+_slots = threading.BoundedSemaphore(PROCESSES)
+_ffmpeg = None
+
+
+class TranscodeError(DownloadError):
+    """ffmpeg failed to encode the stream"""
+
+
+def configure(format=None, bitrate=None, enabled=None, processes=None):
+    global FORMAT, BITRATE, ENABLED, PROCESSES, _slots
+    if format:
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported output format: {format}")
+        FORMAT = format
+    if bitrate:
+        BITRATE = bitrate
+    if enabled is not None:
+        ENABLED = enabled
+    if processes:
+        PROCESSES = processes
+        _slots = threading.BoundedSemaphore(processes)
+
+
+def find_ffmpeg():
+    """Path of the ffmpeg executable (EMERGENCY_BEAT_FFMPEG or PATH), or None"""
+    global _ffmpeg
+    if _ffmpeg is None:
+        _ffmpeg = os.environ.get("EMERGENCY_BEAT_FFMPEG") or shutil.which("ffmpeg") or ""
+    return _ffmpeg or None
+
+
+def enabled():
+    """Whether downloads are transcoded (requested and ffmpeg found)"""
+    return ENABLED and find_ffmpeg() is not None
+
+
+def extension(format=None):
+    return FORMATS[format or FORMAT][2]
+
+
+def profile(format=None, bitrate=None):
+    """Short label of an output profile, e.g. 'mp3-192k' (used in store keys)"""
+    format = format or FORMAT
+    if format in LOSSLESS:
+        return format
+    return f"{format}-{bitrate or BITRATE}"
+
+
+class Encoder:
+    """
+    Pipe a byte stream into ffmpeg, which encodes it to `path`.
+
+    Used like a StreamWriter by the download loops: feed it with
+    write_response()/write(), then commit() waits for ffmpeg and moves the
+    output into place; abort() kills it and removes the partial output.
+    `progress` is called with (bytes fed, total) after every chunk.
+    `metadata` holds the tag values (see src.core.tags) of the output.
+    """
+
+    def __init__(self, path, total=0, progress=None, format=None, bitrate=None, metadata=None):
+        self.path = path
+        self.part_path = path + PART_SUFFIX
+        self.total = total or 0
+        self.progress = progress
+        self.format = format or FORMAT
+        self.bitrate = bitrate or BITRATE
+        self.metadata = metadata if tags.ENABLED else None
+        self.header = tags.header(path, metadata) if self.metadata and self.format == "mp3" else b""
+        self.written = 0
+        self._view = None  # read buffer, only allocated for write_response
+        self._process = None
+        self._stderr = None
+        self._output = None  # the part file when ffmpeg writes to stdout
+        self._slot = None
+
+    @property
+    def resume_offset(self):
+        # Encoders cannot seek: the next byte is always the one after the last fed
+        return self.written
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def command(self):
+        codec, muxer, _ = FORMATS[self.format]
+        cmd = [find_ffmpeg(), "-hide_banner", "-loglevel", "error", "-nostdin",
+               "-i", "pipe:0", "-vn", "-map_metadata", "-1", "-c:a", codec]
+        if self.format not in LOSSLESS:
+            cmd += ["-b:a", self.bitrate]
+        if self.header:
+            # Our tag comes first; a Xing header could not be updated on a pipe
+            return cmd + ["-id3v2_version", "0", "-write_xing", "0", "-f", muxer, "pipe:1"]
+        if self.metadata:
+            cmd += tags.ffmpeg_metadata(self.metadata)
+        return cmd + ["-f", muxer, "-y", self.part_path]
+
+    def open(self):
+        if not find_ffmpeg():
+            raise TranscodeError("ffmpeg was not found, cannot convert the audio")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Wait for a free encoder slot before starting the process
+        self._slot = _slots
+        self._slot.acquire()
+        try:
+            self._stderr = tempfile.TemporaryFile()
+            if self.header:
+                self._output = open(self.part_path, "wb")
+                self._output.write(self.header)
+                self._output.flush()
+            self._process = subprocess.Popen(self.command(), stdin=subprocess.PIPE,
+                                             stdout=self._output or subprocess.DEVNULL, stderr=self._stderr)
+        except BaseException:
+            self._release()
+            raise
+        log.debug("Encoding to %s (%s) through ffmpeg", self.format, self.bitrate)
+
+    def _release(self):
+        if self._slot is not None:
+            self._slot.release()
+            self._slot = None
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+
+    def _errors(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf-8", "replace").strip()
+
+    def write(self, data):
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg quit early: report why
+            self._process.wait()
+            raise TranscodeError(f"ffmpeg stopped while encoding: {self._errors() or 'no details'}")
+        self.written += len(data)
+        metrics.add_bytes(len(data))
+        if self.progress:
+            self.progress(self.written, self.total)
+
+    def write_response(self, response):
+        """Feed the body of a streamed requests.Response; returns bytes fed"""
+        if self._view is None:
+            self._view = memoryview(bytearray(MAX_CHUNK))
+        start = self.written
+        for data in iter_body(response, self._view):
+            self.write(data)
+        return self.written - start
+
+    def commit(self):
+        """Close the input, wait for ffmpeg and move the output into place"""
+        try:
+            with metrics.phase(metrics.FINALIZE):
+                try:
+                    self._process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                status = self._process.wait()
+                if self._output is not None:
+                    self._output.close()
+                    self._output = None
+                if status != 0:
+                    self._remove(self.part_path)
+                    raise TranscodeError(f"ffmpeg failed with exit code {self._process.returncode}: "
+                                         f"{self._errors() or 'no details'}")
+                os.replace(self.part_path, self.path)
+        finally:
+            self._release()
+
+    def abort(self):
+        if self._process:
+            if self._process.poll() is None:
+                self._process.kill()
+                self._process.wait()
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+        self._release()
+        self._remove(self.part_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
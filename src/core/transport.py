@@ -0,0 +1,152 @@
+"""
+Shared HTTP transport.
+Every download goes through the same connection pools so that keep-alive
+connections to main.v2.beatstars.com and the CDNs are reused between jobs.
+"""
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from src.core import retry
+
+POOL_CONNECTIONS = 10  # number of hosts kept in the pool manager
+POOL_MAXSIZE = 16      # keep-alive connections kept per host
+CONNECT_TIMEOUT = 15.0  # seconds, like the asyncio engine's
+READ_TIMEOUT = 30.0     # longest wait for the next bytes of a response
+
+_lock = threading.Lock()
+_local = threading.local()
+_adapter = None
+_generation = 0
+_stats = {}
+
+
+def _record(host, reused):
+    with _lock:
+        counters = _stats.setdefault(host, {"hits": 0, "misses": 0})
+        counters["hits" if reused else "misses"] += 1
+
+
+class _CountingPoolMixin:
+    # A connection handed out with an open socket is a pool hit;
+    # a fresh or dropped one needs a new TCP/TLS handshake (miss)
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _record(self.host, getattr(conn, "sock", None) is not None)
+        return conn
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose per-host pools count connection reuse"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def configure(pool_connections=None, pool_maxsize=None):
+    """Change the pool sizes; sessions pick up the new adapter on next use"""
+    global POOL_CONNECTIONS, POOL_MAXSIZE, _adapter, _generation
+    with _lock:
+        if pool_connections:
+            POOL_CONNECTIONS = pool_connections
+        if pool_maxsize:
+            POOL_MAXSIZE = pool_maxsize
+        old, _adapter = _adapter, None
+        _generation += 1
+    if old:
+        old.close()
+
+
+def _get_adapter():
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = PooledAdapter(pool_connections=POOL_CONNECTIONS,
+                                     pool_maxsize=POOL_MAXSIZE,
+                                     pool_block=False)
+        return _adapter, _generation
+
+
+def session():
+    """
+    Return the calling thread's Session.
+    Sessions are per thread (requests.Session is not thread-safe) but all of
+    them share one adapter, hence one set of connection pools.
+    """
+    s = getattr(_local, "session", None)
+    if s is None or _local.generation != _generation:
+        adapter, generation = _get_adapter()
+        s = requests.Session()
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _local.session = s
+        _local.generation = generation
+    return s
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request on this thread's pooled session, guarded by the host's
+    circuit breaker: raises CircuitOpenError while the host is paused.
+    A stalled server raises requests.Timeout (or a ConnectionError while
+    the body is read) instead of blocking the worker.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    host = urlsplit(url).hostname
+    retry.breaker(host).before()
+    try:
+        r = session().request(method, url, **kwargs)
+    except Exception as e:
+        retry.record(host, error=e)
+        raise
+    except BaseException:
+        retry.breaker(host).release()
+        raise
+    retry.record(host, status=r.status_code, headers=r.headers)
+    return r
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+
+def pool_stats():
+    """Return {host: {"hits": n, "misses": n}} with a "total" entry"""
+    with _lock:
+        stats = {host: dict(counters) for host, counters in _stats.items()}
+    stats["total"] = {
+        "hits": sum(c["hits"] for c in stats.values()),
+        "misses": sum(c["misses"] for c in stats.values()),
+    }
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def format_stats():
+    total = pool_stats()["total"]
+    requests_made = total["hits"] + total["misses"]
+    rate = 100.0 * total["hits"] / requests_made if requests_made else 0.0
+    return f"connection reuse: {total['hits']}/{requests_made} ({rate:.0f}%)"
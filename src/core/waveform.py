@@ -0,0 +1,122 @@
+"""
+Waveform previews of downloaded tracks.
+A track is decoded once by ffmpeg into a raw 16-bit mono PCM file in the
+cache. Previews are reduced from a memory map of that file (the minimum
+and maximum sample of each pixel column), so a long track is paged
+through rather than loaded, and the peaks of each width are saved as well:
+redrawing a preview reads a few kilobytes.
+
+Needs NumPy and ffmpeg, like the fingerprints.
+"""
+import os
+import hashlib
+import logging
+import threading
+import subprocess
+
+from src.core import transcode
+from src.core.cache import cache_dir
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000  # enough for peaks, 16 KB per second of audio
+MAX_BYTES = 512 * 1024 * 1024  # decoded PCM kept in the cache
+
+_locks = {}  # cache key -> lock, so a track is decoded once
+_locks_lock = threading.Lock()
+
+
+def available():
+    """Whether previews can be made (NumPy and ffmpeg found)"""
+    from src.core.fingerprint import load_numpy
+    return load_numpy() is not None and transcode.find_ffmpeg() is not None
+
+
+def _key(path):
+    # A changed or replaced file gets a new key
+    st = os.stat(path)
+    name = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(name.encode()).hexdigest()[:20]
+
+
+def _lock(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def pcm_path(path):
+    """Path of the decoded PCM of `path`, decoding it on first use"""
+    key = _key(path)
+    pcm = os.path.join(cache_dir("waveforms"), key + ".pcm")
+    with _lock(key):
+        if not os.path.exists(pcm):
+            log.debug("Decoding %s for its waveform", path)
+            tmp = f"{pcm}.{os.getpid()}.tmp"
+            cmd = [transcode.find_ffmpeg(), "-v", "error", "-nostdin", "-y", "-i", path,
+                   "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", tmp]
+            done = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if done.returncode != 0:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise ValueError(done.stderr.decode(errors="replace").strip() or "ffmpeg could not decode the file")
+            os.replace(tmp, pcm)
+            _trim(os.path.dirname(pcm))
+    return pcm
+
+
+def _trim(directory):
+    # Remove the least recently read decoded tracks (and their peaks) beyond MAX_BYTES
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith(".pcm"):
+            st = os.stat(os.path.join(directory, name))
+            files.append((st.st_atime, st.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= MAX_BYTES:
+            break
+        for stale in os.listdir(directory):
+            if stale.startswith(name[:-len(".pcm")]):
+                os.remove(os.path.join(directory, stale))
+        total -= size
+
+
+def reduce(samples, width):
+    """(width, 2) array of the min/max sample of each of `width` equal slices"""
+    np = _numpy()
+    peaks = np.zeros((width, 2), dtype=np.int16)
+    if len(samples) == 0 or width <= 0:
+        return peaks
+    if len(samples) < width:
+        # Fewer samples than columns: one column each, the rest stay silent
+        edges = np.arange(len(samples))
+    else:
+        edges = np.linspace(0, len(samples), width + 1).astype(np.intp)[:-1]
+    peaks[:len(edges), 0] = np.minimum.reduceat(samples, edges)
+    peaks[:len(edges), 1] = np.maximum.reduceat(samples, edges)
+    return peaks
+
+
+def peaks(path, width):
+    """Min/max peaks of `path` for a preview `width` pixels wide, int16 (width, 2)"""
+    np = _numpy()
+    pcm = pcm_path(path)
+    cached = pcm[:-len(".pcm")] + f".{width}.peaks"
+    if os.path.exists(cached):
+        return np.fromfile(cached, dtype="<i2").reshape(-1, 2)
+    samples = np.memmap(pcm, dtype="<i2", mode="r") if os.path.getsize(pcm) else np.zeros(0, np.int16)
+    result = reduce(samples, width)
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    result.astype("<i2").tofile(tmp)
+    os.replace(tmp, cached)
+    return result
+
+
+def duration(path):
+    """Length in seconds of a decoded track"""
+    return os.path.getsize(pcm_path(path)) / 2 / SAMPLE_RATE
+
+
+def _numpy():
+    from src.core.fingerprint import load_numpy
+    return load_numpy()
@@ -0,0 +1,327 @@
+"""
+High-throughput streaming file writer.
+Response bodies are read straight into one reused buffer, written to a
+preallocated temporary file and renamed into place once complete.
+Interrupted downloads keep their .part file plus a small JSON sidecar so
+the next attempt can continue with a Range request. A header (e.g. a padded
+metadata tag) can be reserved before the body; offsets exclude it.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from src.core import metrics, ratelimit
+
+log = logging.getLogger(__name__)
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".json"
+STATE_INTERVAL = 1.0  # seconds between sidecar updates while writing
+
+
+def parse_content_range(value):
+    """Parse 'bytes start-end/total' into (start, total); total is 0 if unknown"""
+    try:
+        unit, spec = value.split(" ", 1)
+        span, total = spec.split("/", 1)
+        start = int(span.split("-", 1)[0])
+        return start, (0 if total == "*" else int(total))
+    except (AttributeError, ValueError):
+        return None, 0
+
+
+def iter_body(response, view):
+    """
+    Yield the body of a streamed requests.Response as memoryview slices of
+    `view` (reused between chunks), or as bytes when the body has to be
+    decoded. Raises IncompleteRead if the connection drops early.
+    Every chunk is charged to the bandwidth limits of the response's host.
+    """
+    raw = response.raw
+    fp = getattr(raw, "_fp", None)
+    encoded = response.headers.get("content-encoding", "identity") != "identity"
+    host = urlsplit(response.url).hostname
+
+    if isinstance(fp, http.client.HTTPResponse) and not encoded and not raw._fp_bytes_read:
+        # Fast path: read straight into the caller's buffer, no per-chunk allocation.
+        # The read size grows while reads fill it and shrinks when they don't.
+        chunk_size = min(MIN_CHUNK, len(view))
+        while True:
+            n = fp.readinto(view[:min(chunk_size, ratelimit.chunk_size(host, len(view)))])
+            if not n:
+                break
+            yield view[:n]
+            ratelimit.throttle(n, host)
+            if n == chunk_size and chunk_size < len(view):
+                chunk_size = min(chunk_size * 2, len(view))
+            elif n < chunk_size // 4 and chunk_size > MIN_CHUNK:
+                chunk_size //= 2
+        if fp.length:
+            # http.client reports a dropped connection as a short read
+            raise http.client.IncompleteRead(b"", fp.length)
+        # The body was read to the end, the connection can be reused
+        raw.release_conn()
+    else:
+        for data in response.iter_content(ratelimit.chunk_size(host, len(view))):
+            yield data
+            ratelimit.throttle(len(data), host)
+
+
+def _preallocate(fd, size):
+    # Reserve the blocks up front so the file is not extended on every write
+    if size <= 0:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+class StreamWriter:
+    """
+    Write one or more HTTP response bodies to `path`.
+
+    Data goes to `path + ".part"`, preallocated from `total` when known, and
+    is atomically renamed to `path` when the writer is committed (leaving the
+    `with` block without an exception). `progress` is called with
+    (bytes_written, total) after every chunk.
+
+    When `key` (the source identity, e.g. "beatstars:<id>") is given, an
+    aborted download keeps its .part file and a sidecar recording the key,
+    URL, ETag/Last-Modified and bytes written. A later writer with the same
+    key starts at that offset: send `range_headers()` with the request and
+    hand the response to `begin()`, which falls back to a full rewrite if
+    the server does not honour the range.
+
+    `header` bytes are written first and the body follows them: `total`,
+    `written` and every offset count body bytes only. `header` may also be
+    a function of the response handed to begin() returning those bytes
+    (e.g. from its Content-Type); it is called when the body starts at
+    byte 0, and a resumed file keeps the header it was started with.
+    """
+
+    def __init__(self, path, total=0, progress=None, key=None, header=b""):
+        self.path = path
+        self.part_path = path + PART_SUFFIX
+        self.state_path = self.part_path + STATE_SUFFIX
+        self.total = total or 0
+        self.progress = progress
+        self.key = key
+        self._make_header = header if callable(header) else None
+        self.header = b"" if self._make_header else header
+        self.url = None
+        self.validator = None  # ETag or Last-Modified of the partial content
+        self.written = 0
+        self.resumed_from = 0
+        self.segments = None  # missing [start, end) ranges of a segmented download
+        self._seek_lock = threading.Lock()
+        self._view = None  # read buffer, only allocated for write_response
+        self._file = None
+        self._saved_at = 0.0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        state = self._load_state()
+        if state:
+            self._file = open(self.part_path, "r+b", buffering=0)
+            self.written = self.resumed_from = state["written"]
+            self.total = self.total or state.get("total", 0)
+            self.url = state.get("url")
+            self.validator = state.get("validator")
+            self.segments = state.get("segments")
+            self._file.seek(len(self.header) + self.resume_offset)
+        else:
+            self._file = open(self.part_path, "wb", buffering=0)
+            self._start()
+
+    def _start(self):
+        # Empty file: preallocate, then write the header
+        if self.total:
+            _preallocate(self._file.fileno(), len(self.header) + self.total)
+        self._write(self.header)
+
+    def _load_state(self):
+        if not self.key or not os.path.exists(self.part_path):
+            return None
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("key") != self.key or not state.get("written"):
+            return None
+        if self.total and state.get("total") and state["total"] != self.total:
+            return None
+        if self._make_header:
+            # Only its length matters: the bytes are already in the file
+            self.header = bytes(state.get("header", 0))
+        elif state.get("header", 0) != len(self.header):
+            return None
+        if len(self.header) + state["written"] > os.path.getsize(self.part_path):
+            return None
+        return state
+
+    def _save_state(self):
+        if not self.key:
+            return
+        state = {
+            "key": self.key,
+            "url": self.url,
+            "validator": self.validator,
+            "written": self.written,
+            "total": self.total,
+            "segments": self.segments,
+            "header": len(self.header),
+        }
+        try:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        except OSError as e:
+            log.warning("Could not save resume state: %s", e)
+        self._saved_at = time.monotonic()
+
+    @property
+    def resume_offset(self):
+        """First byte that is still missing"""
+        if self.segments:
+            return min(start for start, end in self.segments)
+        return self.written
+
+    def range_headers(self):
+        """Headers asking the server for the missing tail of the file"""
+        if not self.resume_offset:
+            return {}
+        headers = {"Range": f"bytes={self.resume_offset}-"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        return headers
+
+    def restart(self, total=0):
+        """Discard the partial data and start again from byte 0"""
+        self._file.seek(0)
+        self._file.truncate(0)
+        self.written = self.resumed_from = 0
+        self.segments = None
+        self.total = total or 0
+        self._start()
+
+    def begin(self, response):
+        """
+        Adopt the response to a request made with range_headers(): continue
+        on a matching 206, otherwise rewrite from the start.
+        """
+        self.url = response.url
+        self.validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status_code == 206:
+            start, total = parse_content_range(response.headers.get("Content-Range"))
+            if start == self.resume_offset:
+                self.total = total or self.total
+                return
+        elif self.resume_offset:
+            log.debug("Server ignored the range request, restarting download")
+        if self._make_header:
+            self.header = self._make_header(response)
+        self.restart(int(response.headers.get("content-length", 0)))
+
+    def _write(self, data):
+        while data:
+            n = self._file.write(data)
+            data = data[n:]
+
+    def write_at(self, offset, data):
+        """Write bytes at an offset of the body (segmented downloads, thread-safe)"""
+        offset += len(self.header)
+        if hasattr(os, "pwrite"):
+            fd = self._file.fileno()
+            while data:
+                n = os.pwrite(fd, data, offset)
+                data = data[n:]
+                offset += n
+        else:
+            with self._seek_lock:
+                self._file.seek(offset)
+                self._write(data)
+
+    def advance(self, n):
+        """Account for `n` bytes written with write_at (caller serializes calls)"""
+        self._advance(n)
+
+    def _advance(self, n):
+        self.written += n
+        metrics.add_bytes(n)
+        if self.key and time.monotonic() - self._saved_at >= STATE_INTERVAL:
+            self._save_state()
+        if self.progress:
+            self.progress(self.written, self.total)
+
+    def write_response(self, response):
+        """Copy the body of a streamed requests.Response; returns bytes written"""
+        self._sequential()
+        if self._view is None:
+            self._view = memoryview(bytearray(MAX_CHUNK))
+        start = self.written
+        for data in iter_body(response, self._view):
+            self._write(data)
+            self._advance(len(data))
+        return self.written - start
+
+    def _sequential(self):
+        if self.segments:
+            # Continuing a segmented download sequentially: rewrite everything
+            # from the first hole, the ranges after it are simply overwritten
+            self.written = self.resume_offset
+            self.segments = None
+            self._file.seek(len(self.header) + self.written)
+
+    def write(self, data):
+        """Append raw bytes (used for bodies that do not come from requests)"""
+        self._sequential()
+        self._write(data)
+        self._advance(len(data))
+
+    def commit(self):
+        """Trim the preallocation, close and move the file into place"""
+        with metrics.phase(metrics.FINALIZE):
+            self._file.truncate(len(self.header) + self.written)
+            self._file.close()
+            os.replace(self.part_path, self.path)
+            self._remove(self.state_path)
+
+    def abort(self):
+        """Close the temporary file; keep it for resuming if it holds data"""
+        if self._file and not self._file.closed:
+            self._file.close()
+        if self.key and self.written:
+            self._save_state()
+            log.debug("Kept %d bytes in %s for resuming", self.written, self.part_path)
+            return
+        self._remove(self.part_path)
+        self._remove(self.state_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,470 @@
+"""
+YouTube audio download logic, usable without Qt.
+Both the GUI thread and the batch runner call into this module.
+"""
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+from src.core import aio, links, metrics, ratelimit, retry, segmented, streams, tags, transcode, transport
+from src.core.cache import TTLCache
+from src.core.errors import DownloadError, UnavailableError, error_for_status
+from src.core.progress import BUS, new_job_id
+from src.core.store import get_store
+from src.core.writer import StreamWriter
+from src.utils.pytube_fixes import load_pytubefix
+
+log = logging.getLogger(__name__)
+
+# googlevideo throttles unranged requests, fetch 9MB ranges like pytubefix does
+RANGE_SIZE = 9437184
+YOUTUBE_HOST = "www.youtube.com"
+# Extension of the untouched stream when it is not transcoded
+SOURCE_EXTENSIONS = {"audio/webm": ".webm", "audio/mp4": ".m4a"}
+MEDIA_HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+# Title/author/length rarely change; stream URLs are signed and expire
+METADATA_TTL = 7 * 24 * 3600
+MANIFEST_TTL = 3 * 3600
+URL_EXPIRY_MARGIN = 10 * 60
+METADATA_CACHE = TTLCache("youtube_metadata", ttl=METADATA_TTL, max_entries=20000)
+MANIFEST_CACHE = TTLCache("youtube_manifests", ttl=MANIFEST_TTL, max_entries=2000)
+
+
+def extract_video_id(url):
+    """Extract the YouTube video ID from various URL formats"""
+    return links.video_id(url)
+
+
+def open_video(video_id):
+    """Initialize a pytubefix YouTube object for a video ID"""
+    clean_url = f"https://www.youtube.com/watch?v={video_id}"
+    yt = load_pytubefix().YouTube(clean_url)
+    # pytubefix loads the page lazily: fetch it now so failures surface here
+    log.debug("Opened %s: %s", clean_url, yt.title)
+    return yt
+
+
+def stream_manifest(yt):
+    """
+    Parse the stream list of a video into plain dicts (one per stream) that
+    can be cached and used without the pytubefix object.
+    """
+    available = list(yt.streams)
+
+    # Fallback in case the main stream listing comes back empty
+    if not available:
+        log.debug("No streams found, trying alternative approach")
+        # Force stream refresh
+        yt.streams._streams = []
+        yt.streams._fmt_streams = []
+        available = list(yt.streams)
+
+    manifest = []
+    for stream in available:
+        manifest.append({
+            "itag": stream.itag,
+            "abr": stream.abr,
+            "mime_type": stream.mime_type,
+            "audio_codec": stream.audio_codec,
+            # Size from the player response; reading stream.filesize would
+            # send a HEAD request per stream when it is missing
+            "filesize": getattr(stream, "_filesize", 0) or 0,
+            "progressive": stream.is_progressive,
+            "audio": stream.includes_audio_track,
+            "video": stream.includes_video_track,
+            "resolution": stream.resolution,
+            "url": stream.url,
+            "default_filename": stream.default_filename,
+        })
+    return manifest
+
+
+def video_info(meta, ranked):
+    """Build the dict shown in the info panel from metadata and ranked streams"""
+    info = dict(meta)
+    info["streams"] = []
+    for stream in ranked:
+        if stream["audio"] and not stream["video"]:
+            info["streams"].append({
+                "itag": stream["itag"],
+                "abr": stream["abr"],
+                "mime_type": stream["mime_type"],
+                "filesize": stream["filesize"],
+                "type": "audio"
+            })
+    return info
+
+
+def _signed_url_ttl(manifest):
+    # Stream URLs carry their expiry time; drop the manifest a bit before it
+    expiries = []
+    for stream in manifest:
+        expire = parse_qs(urlsplit(stream["url"]).query).get("expire")
+        if expire and expire[0].isdigit():
+            expiries.append(int(expire[0]))
+    if not expiries:
+        return MANIFEST_TTL
+    return max(0, min(min(expiries) - time.time() - URL_EXPIRY_MARGIN, MANIFEST_TTL))
+
+
+def load_video(video_id, refresh=False):
+    """
+    Return (metadata, manifest, from_cache) for a video, from the caches when
+    they are still valid, otherwise from YouTube through pytubefix.
+    """
+    if not refresh:
+        meta = METADATA_CACHE.get(video_id)
+        manifest = MANIFEST_CACHE.get(video_id)
+        if meta and manifest:
+            log.debug("Using cached metadata and stream manifest for %s", video_id)
+            return meta, manifest, True
+
+    # pytubefix does not use the shared transport, guard its requests here
+    with retry.circuit(YOUTUBE_HOST):
+        yt = open_video(video_id)
+        meta = {
+            "title": yt.title,
+            "author": yt.author,
+            "length": yt.length,
+            "views": yt.views,
+            "thumbnail_url": yt.thumbnail_url,
+        }
+        manifest = stream_manifest(yt)
+    METADATA_CACHE.set(video_id, meta)
+    if manifest:
+        MANIFEST_CACHE.set(video_id, manifest, ttl=_signed_url_ttl(manifest))
+    return meta, manifest, False
+
+
+def stream_size(url):
+    """Size of a stream whose manifest entry has none, from a HEAD request"""
+    with transport.head(url, headers=MEDIA_HEADERS, allow_redirects=True) as r:
+        return int(r.headers.get("content-length", 0)) if r.ok else 0
+
+
+def fetch_stream(url, total, path, progress=None, key=None, encoder=None):
+    """
+    Download a googlevideo stream URL to `path` in ranged requests.
+    With a `key`, an interrupted download is continued from its .part file.
+    With an `encoder` (an unopened transcode.Encoder), the bytes are piped
+    into it instead, in order and over a single connection.
+    """
+    if encoder is not None:
+        with encoder:
+            _fetch_ranges(url, total, encoder)
+        return encoder.path
+
+    with StreamWriter(path, total, progress=progress, key=key) as writer:
+        if writer.written:
+            log.debug("Resuming download at byte %d", writer.resume_offset)
+
+        if total and segmented.should_split(total - writer.resume_offset):
+            # googlevideo serves arbitrary ranges through the range parameter
+            def fetch(start, end):
+                with metrics.phase(metrics.TTFB, once=True):
+                    return transport.get(f"{url}&range={start}-{end - 1}", stream=True, headers=MEDIA_HEADERS)
+
+            segmented.SegmentedDownload(writer, fetch, max_request=RANGE_SIZE).run()
+            return path
+
+        _fetch_ranges(url, total, writer)
+    return path
+
+
+def _fetch_ranges(url, total, sink):
+    # Sequential RANGE_SIZE requests from the sink's first missing byte
+    while True:
+        start = sink.resume_offset
+        stop = start + RANGE_SIZE - 1
+        if total:
+            stop = min(stop, total - 1)
+        with metrics.phase(metrics.TTFB, once=True):
+            r = transport.get(f"{url}&range={start}-{stop}", stream=True, headers=MEDIA_HEADERS)
+        with r:
+            r.raise_for_status()
+            n = sink.write_response(r)
+        if not n or (total and sink.written >= total) or (not total and n < RANGE_SIZE):
+            break
+
+
+def output_file(stream, output_path=None, encode=False):
+    """Where a stream is saved: its title with the extension of what is actually written"""
+    base, source_ext = os.path.splitext(stream["default_filename"])
+    if encode:
+        ext = "." + transcode.extension()
+    else:
+        ext = SOURCE_EXTENSIONS.get(stream["mime_type"].split(";")[0].strip(), source_ext)
+    return os.path.join(output_path or os.getcwd(), base + ext)
+
+
+def download_audio(url, output_path=None, info=None, job_id=None, policy=None):
+    """
+    Download the audio of a YouTube video and return the saved file path.
+    Progress is published on the progress bus under `job_id`; `info`
+    receives the video_info dict once metadata is known. `policy` is the
+    streams.StreamPolicy used to pick the stream (default: the configured one).
+    Raises DownloadError on failure.
+    """
+    job_id = job_id or new_job_id("youtube")
+    try:
+        # Transient failures are retried; the caches and .part file make retries cheap
+        with ratelimit.job(job_id):
+            return retry.call(lambda: _download_audio(url, output_path, info, job_id, policy),
+                              description="YouTube download")
+    finally:
+        BUS.finish(job_id)
+
+
+def _download_audio(url, output_path, info, job_id, policy):
+    job = AudioDownload(url, output_path, info, job_id, policy)
+    if job.prepare():
+        return job.out_file
+    job.fetch()
+    return job.finish()
+
+
+class AudioDownload:
+    """
+    The steps of one audio download, shared by the threaded and the asyncio
+    engines: prepare() (metadata, stream choice, store lookup) and finish()
+    (store update) block on pytubefix/SQLite, the transfer in between is
+    fetch() or fetch_async().
+    """
+
+    def __init__(self, url, output_path, info, job_id, policy):
+        self.url = url
+        self.output_path = output_path
+        self.info = info
+        self.job_id = job_id
+        self.policy = policy
+        self.video_id = None
+        self.store = None
+        self.output_profile = None
+        self.audio = None
+        self.from_cache = False
+        self.encode = False
+        self.out_file = None
+        self.store_key = None
+        self.tags = None  # tag values of the output, once metadata is known
+
+    def report(self, value):
+        BUS.report(self.job_id, percent=value)
+
+    # Progress callback: 10-100%
+    def on_chunk(self, downloaded, size):
+        percent = int((downloaded / size) * 90) + 10 if size > 0 else None
+        BUS.report(self.job_id, percent=percent, downloaded=downloaded, total=size)
+
+    def prepare(self):
+        """Choose the stream and output file; returns True if the store already served it"""
+        # Validate URL
+        if not self.url:
+            raise DownloadError("Please enter a valid YouTube URL")
+
+        self.report(10)
+
+        try:
+            # Clean up the URL - extract video ID and create clean URL
+            with metrics.phase(metrics.EXTRACT):
+                video_id = self.video_id = extract_video_id(self.url)
+
+            if not video_id:
+                raise ValueError("Could not extract video ID from URL")
+
+            # Already downloaded: copy it from the store without asking YouTube
+            self.store = get_store()
+            self.output_profile = transcode.profile() if transcode.enabled() else "source"
+            if self.store:
+                found = self.store.lookup(f"youtube:{video_id}:{self.output_profile}")
+                if found:
+                    target = os.path.join(self.output_path or os.getcwd(), found[1])
+                    method = self.store.materialize(f"youtube:{video_id}:{self.output_profile}", target)
+                    if method:
+                        log.debug("Served from the download store (%s)", method)
+                        metrics.note(store=method)
+                        # Tagged from the cached metadata; YouTube is not asked for it
+                        meta = METADATA_CACHE.get(video_id)
+                        if meta:
+                            tags.update(target, tags.for_source("youtube", video_id, title=meta.get("title"),
+                                                                artist=meta.get("author")))
+                        self.report(100)
+                        self.out_file = target
+                        return True
+
+            # Metadata shown right away when cached, even if the manifest expired
+            cached_meta = METADATA_CACHE.get(video_id)
+            if cached_meta and self.info and MANIFEST_CACHE.get(video_id) is None:
+                self.info(video_info(cached_meta, []))
+
+            with metrics.phase(metrics.RESOLVE):
+                meta, manifest, self.from_cache = load_video(video_id)
+                # One ranking of the manifest serves both the info panel and the download
+                audio, alternates = streams.select(manifest, self.policy)
+            metrics.note(resolve_cached=self.from_cache)
+            details = video_info(meta, [audio] + alternates if audio else [])
+            self.tags = tags.for_source("youtube", video_id, title=meta.get("title"), artist=meta.get("author"))
+            self.report(20)
+            if self.info:
+                self.info(details)
+        except Exception as e:
+            log.debug("YouTube download error: %s", e)
+            raise DownloadError(f"YouTube download error: {str(e)}") from e
+
+        if not audio:
+            raise UnavailableError("Error downloading stream: No suitable streams found for this video")
+
+        log.debug("Selected audio stream: itag=%s %s %s", audio["itag"], audio["mime_type"], audio["abr"])
+        self.audio = audio
+
+        # Converted while downloading when ffmpeg is available, otherwise the
+        # stream is saved as is under its real extension
+        self.encode = transcode.enabled()
+        self.out_file = output_file(audio, self.output_path, self.encode)
+        self.store_key = f"youtube:{video_id}:{audio['itag']}:{self.output_profile}"
+        method = self.store.materialize(self.store_key, self.out_file) if self.store else None
+        if method:
+            log.debug("Served from the download store (%s)", method)
+            metrics.note(store=method)
+            tags.update(self.out_file, self.tags)
+            self.report(100)
+            return True
+        return False
+
+    def refresh_stream(self):
+        """Replace a cached stream whose signed URL was rejected with a fresh one"""
+        MANIFEST_CACHE.delete(self.video_id)
+        _, manifest, _ = load_video(self.video_id, refresh=True)
+        fresh = next((s for s in manifest if s["itag"] == self.audio["itag"]), None)
+        fresh = fresh or streams.select(manifest, self.policy)[0]
+        if not fresh:
+            raise UnavailableError("No suitable streams found for this video")
+        self.audio = fresh
+        self.from_cache = False
+
+    def new_encoder(self, size):
+        if not self.encode:
+            return None
+        return transcode.Encoder(self.out_file, size, progress=self.on_chunk, metadata=self.tags)
+
+    def _fetch_once(self):
+        size = self.audio["filesize"] or stream_size(self.audio["url"])
+        log.debug("Downloading audio stream: itag=%s (%d bytes)", self.audio["itag"], size)
+        fetch_stream(self.audio["url"], size, self.out_file, progress=self.on_chunk,
+                     key=self.store_key, encoder=self.new_encoder(size))
+
+    def fetch(self):
+        try:
+            with metrics.phase(metrics.TRANSFER):
+                try:
+                    self._fetch_once()
+                except Exception as e:
+                    if not self.from_cache:
+                        raise
+                    # The cached signed URL was rejected, fetch a fresh manifest
+                    log.debug("Cached stream URL failed (%s), refreshing the manifest", e)
+                    with metrics.phase(metrics.RESOLVE):
+                        self.refresh_stream()
+                    self._fetch_once()
+        except Exception as e:
+            log.debug("Error during stream download: %s", e)
+            raise DownloadError(f"Error downloading stream: {str(e)}") from e
+
+    async def _fetch_once_async(self, client):
+        size = self.audio["filesize"]
+        if not size:
+            async with await client.request("HEAD", self.audio["url"], MEDIA_HEADERS) as r:
+                size = int(r.headers.get("content-length", 0)) if r.ok else 0
+        log.debug("Downloading audio stream: itag=%s (%d bytes)", self.audio["itag"], size)
+        if size and segmented.should_split(size):
+            # Large streams are split over several connections by the threaded fetch
+            await aio.to_thread(fetch_stream, self.audio["url"], size, self.out_file,
+                                self.on_chunk, self.store_key)
+            return
+        await fetch_stream_async(client, self.audio["url"], size, self.out_file,
+                                 progress=self.on_chunk, key=self.store_key)
+
+    async def fetch_async(self, client):
+        if self.encode:
+            # Feeding ffmpeg blocks on its pipe: keep that off the event loop
+            return await aio.to_thread(self.fetch)
+        try:
+            with metrics.phase(metrics.TRANSFER):
+                try:
+                    await self._fetch_once_async(client)
+                except Exception as e:
+                    if not self.from_cache:
+                        raise
+                    log.debug("Cached stream URL failed (%s), refreshing the manifest", e)
+                    with metrics.phase(metrics.RESOLVE):
+                        await aio.to_thread(self.refresh_stream)
+                    await self._fetch_once_async(client)
+        except Exception as e:
+            log.debug("Error during stream download: %s", e)
+            raise DownloadError(f"Error downloading stream: {str(e)}") from e
+
+    def finish(self):
+        if not self.encode:
+            # Saved as is: M4A is tagged in place (WebM tags are not supported)
+            tags.update(self.out_file, self.tags)
+        if self.store:
+            try:
+                # The video ID plus output profile resolves to the last stream chosen for it
+                with metrics.phase(metrics.STORE):
+                    self.store.add(self.out_file, self.store_key, f"youtube:{self.video_id}:{self.output_profile}")
+            except Exception as e:
+                log.warning("Could not add %s to the store: %s", self.store_key, e)
+
+        self.report(100)
+        return self.out_file
+
+
+async def fetch_stream_async(client, url, total, path, progress=None, key=None):
+    """
+    asyncio version of fetch_stream: sequential ranged requests into a
+    StreamWriter. Never segmented; AudioDownload.fetch_async hands large
+    streams to fetch_stream instead.
+    """
+    with StreamWriter(path, total, progress=progress, key=key) as writer:
+        if writer.written:
+            log.debug("Resuming download at byte %d", writer.resume_offset)
+        while True:
+            start = writer.resume_offset
+            stop = start + RANGE_SIZE - 1
+            if total:
+                stop = min(stop, total - 1)
+            with metrics.phase(metrics.TTFB, once=True):
+                r = await client.get(f"{url}&range={start}-{stop}", MEDIA_HEADERS)
+            async with r:
+                if r.status_code >= 400:
+                    raise error_for_status(r.status_code, f"{r.status_code} {r.reason} for stream URL")
+                n = await aio.write_body(r, writer)
+            if not n or (total and writer.written >= total) or (not total and n < RANGE_SIZE):
+                break
+    return path
+
+
+async def download_audio_async(url, output_path=None, info=None, job_id=None, policy=None, client=None):
+    """
+    download_audio on the asyncio engine: pytubefix and the store run in
+    worker threads, the media transfer on the event loop through `client`
+    (default: the aio.AsyncClient of the running loop).
+    """
+    job_id = job_id or new_job_id("youtube")
+    client = client or aio.client()
+
+    async def attempt():
+        job = AudioDownload(url, output_path, info, job_id, policy)
+        if await aio.to_thread(job.prepare):
+            return job.out_file
+        await job.fetch_async(client)
+        return await aio.to_thread(job.finish)
+
+    try:
+        # to_thread copies the context: encoder threads are charged to the job too
+        with ratelimit.job(job_id):
+            return await aio.call(attempt, description="YouTube download")
+    finally:
+        BUS.finish(job_id)
@@ -1 +0,0 @@
-# Downloaders package initialization
@@ -1,17 +1,32 @@
 import os
+import threading
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                            QFileDialog, QProgressBar, QMessageBox, QFrame,
+                            QFileDialog, QMessageBox, QFrame,
                             QGraphicsDropShadowEffect, QComboBox, QRadioButton,
                             QButtonGroup, QTabWidget)
-from PyQt5.QtCore import Qt, QUrl
-from PyQt5.QtGui import QColor, QDesktopServices
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QColor
+
+from src.core import links
+from src.core.batch import BEATSTARS, YOUTUBE, Job, link_jobs, parse_jobs
+from src.core.jobqueue import JobQueue
+from src.ui.jobs import JobsPanel
+from src.ui.library import LibraryPanel
+from src.ui.thumbnails import ThumbnailLoader
+from src.ui.waveform import WaveformView
+
+def _preload():
+    from src.core import aio, beatstars, youtube  # noqa: F401
+    from src.utils.pytube_fixes import load_pytubefix
+    load_pytubefix()
+
 
 class EmergencyBeatApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Emergency Beat Downloader")
-        self.setMinimumSize(600, 400)
+        self.setMinimumSize(700, 750)
         self.setStyleSheet("""
             QMainWindow {
                 background: qlineargradient(x1:0, y1:0, x2:1, y2:1, 
@@ -109,6 +124,8 @@ class EmergencyBeatApp(QMainWindow):
             }
         """)
         
+        # Every download goes through the queue, one or thousands
+        self.queue = JobQueue()
         self.setup_ui()
         
     def setup_ui(self):
@@ -179,7 +196,9 @@ class EmergencyBeatApp(QMainWindow):
         id_layout.addWidget(id_label)
         
         self.id_input = QLineEdit()
-        self.id_input.setPlaceholderText("Enter Beatstars ID or any Beatstars URL")
+        self.id_input.setPlaceholderText("Enter Beatstars ID or any Beatstars URL (or paste one per line)")
+        # Room for thousands of pasted IDs (the default limit is 32767 characters)
+        self.id_input.setMaxLength(16 * 1024 * 1024)
         id_layout.addWidget(self.id_input)
         beats_layout.addLayout(id_layout)
         
@@ -193,13 +212,6 @@ class EmergencyBeatApp(QMainWindow):
         name_layout.addWidget(self.name_input)
         beats_layout.addLayout(name_layout)
         
-        # Progress bar
-        self.progress_bar_beats = QProgressBar()
-        self.progress_bar_beats.setValue(0)
-        self.progress_bar_beats.setTextVisible(True)
-        self.progress_bar_beats.setFormat("%p%")
-        beats_layout.addWidget(self.progress_bar_beats)
-        
         # Download button
         self.download_button_beats = QPushButton("Download Beat")
         self.download_button_beats.setMinimumHeight(50)
@@ -222,6 +234,10 @@ class EmergencyBeatApp(QMainWindow):
         self.download_button_beats.clicked.connect(self.start_beats_download)
         beats_layout.addWidget(self.download_button_beats)
         
+        # Waveform of the latest downloaded beat
+        self.beats_waveform = WaveformView("#ff5555")
+        beats_layout.addWidget(self.beats_waveform)
+        
         # Create YouTube Tab
         yt_tab = QWidget()
         yt_layout = QVBoxLayout(yt_tab)
@@ -234,7 +250,7 @@ class EmergencyBeatApp(QMainWindow):
         yt_url_layout.addWidget(yt_url_label)
         
         self.yt_url_input = QLineEdit()
-        self.yt_url_input.setPlaceholderText("Enter YouTube video URL")
+        self.yt_url_input.setPlaceholderText("Enter YouTube video, playlist or channel URL")
         yt_url_layout.addWidget(self.yt_url_input)
         yt_layout.addLayout(yt_url_layout)
         
@@ -248,13 +264,6 @@ class EmergencyBeatApp(QMainWindow):
         yt_name_layout.addWidget(self.yt_name_input)
         yt_layout.addLayout(yt_name_layout)
         
-        # Progress bar for YouTube
-        self.progress_bar_yt = QProgressBar()
-        self.progress_bar_yt.setValue(0)
-        self.progress_bar_yt.setTextVisible(True)
-        self.progress_bar_yt.setFormat("%p%")
-        yt_layout.addWidget(self.progress_bar_yt)
-        
         # YouTube video info display
         self.yt_info_label = QLabel("Video details will appear here")
         self.yt_info_label.setStyleSheet("""
@@ -266,7 +275,23 @@ class EmergencyBeatApp(QMainWindow):
         """)
         self.yt_info_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
         self.yt_info_label.setWordWrap(True)
-        yt_layout.addWidget(self.yt_info_label)
+        
+        # Thumbnail of the video, left of its details once loaded
+        self.yt_thumbnail_label = QLabel()
+        self.yt_thumbnail_label.setFixedSize(160, 90)
+        self.yt_thumbnail_label.setAlignment(Qt.AlignCenter)
+        self.yt_thumbnail_label.hide()
+        self.yt_thumbnail_url = None
+        self.thumbnails = ThumbnailLoader((160, 90), self)
+        self.thumbnails.loaded_signal.connect(self.on_thumbnail)
+        yt_info_layout = QHBoxLayout()
+        yt_info_layout.addWidget(self.yt_thumbnail_label, 0, Qt.AlignTop)
+        yt_info_layout.addWidget(self.yt_info_label, 1)
+        yt_layout.addLayout(yt_info_layout)
+        
+        # Waveform of the latest downloaded video
+        self.yt_waveform = WaveformView("#F44336")
+        yt_layout.addWidget(self.yt_waveform)
         
         # Download button for YouTube
         self.download_button_yt = QPushButton("Download Audio from YouTube")
@@ -294,6 +319,10 @@ class EmergencyBeatApp(QMainWindow):
         tab_widget.addTab(beats_tab, "Beatstars")
         tab_widget.addTab(yt_tab, "YouTube")
         
+        # Everything downloaded so far, searchable
+        self.library_panel = LibraryPanel()
+        tab_widget.addTab(self.library_panel, "Library")
+        
         shadow = QGraphicsDropShadowEffect()
         shadow.setBlurRadius(30)
         shadow.setColor(QColor(0, 0, 0, 100))
@@ -302,6 +331,15 @@ class EmergencyBeatApp(QMainWindow):
         
         main_layout.addWidget(tab_widget)
         
+        # Download queue
+        self.jobs_panel = JobsPanel(self.queue)
+        self.jobs_panel.model.info_signal.connect(self.update_youtube_info)
+        self.jobs_panel.model.done_signal.connect(self.show_waveform)
+        self.jobs_panel.model.done_signal.connect(lambda _: self.library_panel.search())
+        self.jobs_panel.table.clicked.connect(
+            lambda index: self.show_waveform(self.jobs_panel.model.entry(index.row())))
+        main_layout.addWidget(self.jobs_panel, 1)
+        
         # Footer
         footer_label = QLabel("Emergency Music Downloader by HIBOBO - 2025")
         footer_label.setAlignment(Qt.AlignCenter)
@@ -329,62 +367,84 @@ class EmergencyBeatApp(QMainWindow):
             name_input.setText(filename)
     
     def start_beats_download(self):
-        from src.downloaders.beatstars import DownloaderThread
-        
-        song_id = self.id_input.text().strip()
+        text = self.id_input.text().strip()
         name = self.name_input.text().strip()
         
         # Validate input
-        if not song_id:
+        if not text:
             self.show_error("Please enter a Beat ID or Beatstars URL")
             return
         
-        # Disable UI during download
-        self.download_button_beats.setEnabled(False)
-        self.download_button_beats.setText("Downloading...")
-        
-        # Create and start the downloader thread
-        self.downloader = DownloaderThread(song_id, name)
-        self.downloader.progress_signal.connect(self.update_beats_progress)
-        self.downloader.finished_signal.connect(self.download_finished)
-        self.downloader.error_signal.connect(self.show_error)
-        self.downloader.start()
+        # Several lines are queued like a jobs file: `<id or url> [name]`
+        lines = text.splitlines()
+        found = links.extract(text) if len(lines) == 1 else []
+        if len(lines) > 1:
+            jobs = parse_jobs(lines)
+        elif len(found) > 1:
+            # Several links pasted on one line (beats and YouTube alike)
+            jobs = link_jobs(found)
+        elif found and found[0].collection:
+            # Playlists and channels are listed by the queue, video by video
+            jobs = [Job(YOUTUBE, found[0].url)]
+        else:
+            # A single YouTube video link is queued as a YouTube download
+            source, target = BEATSTARS, text
+            if found and found[0].kind != links.BEAT:
+                source, target = YOUTUBE, found[0].url
+            if not self.confirm_download(target):
+                return
+            jobs = [Job(source, target, name or None)]
+        self.queue.add_many(jobs)
+        
+        self.id_input.clear()
+        self.name_input.clear()
     
     def start_youtube_download(self):
-        from src.downloaders.youtube import YouTubeDownloaderThread
-        
         url = self.yt_url_input.text().strip()
-        output_path = os.getcwd()  # Current directory
+        name = self.yt_name_input.text().strip()
         
         # Validate input
         if not url:
             self.show_error("Please enter a YouTube URL")
             return
             
+        found = links.extract(url, bare_ids=False)
+        if len(found) > 1:
+            # Several links pasted at once: queue them all
+            self.queue.add_many(link_jobs(found))
+            self.yt_url_input.clear()
+            return
+
         # Verify it's a valid YouTube URL
-        import re
-        youtube_regex = r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-        if not re.match(youtube_regex, url):
-            self.show_error("Invalid YouTube URL. Please enter a valid YouTube video URL.")
+        link = found[0] if found else None
+        if link is None or link.kind == links.BEAT:
+            self.show_error("Invalid YouTube URL. Please enter a valid YouTube video, playlist or channel URL.")
             return
-        
-        # Disable UI during download
-        self.download_button_yt.setEnabled(False)
-        self.download_button_yt.setText("Downloading...")
-        
-        # Create and start the YouTube downloader thread
-        self.yt_downloader = YouTubeDownloaderThread(url, output_path)
-        self.yt_downloader.progress_signal.connect(self.update_youtube_progress)
-        self.yt_downloader.finished_signal.connect(self.youtube_download_finished)
-        self.yt_downloader.error_signal.connect(self.show_error)
-        self.yt_downloader.info_signal.connect(self.update_youtube_info)
-        self.yt_downloader.start()
+
+        # Playlists and channels are listed by the queue, video by video
+        if link.collection:
+            self.queue.add(Job(YOUTUBE, link.url))
+            self.yt_url_input.clear()
+            return
+
+        if not self.confirm_download(link.url):
+            return
+
+        # The file is renamed to the custom name once downloaded
+        self.queue.add(Job(YOUTUBE, link.url, name or None))
+        self.yt_url_input.clear()
+        self.yt_name_input.clear()
     
-    def update_beats_progress(self, value):
-        self.progress_bar_beats.setValue(value)
-        
-    def update_youtube_progress(self, value):
-        self.progress_bar_yt.setValue(value)
+    def confirm_download(self, target):
+        # One lookup in the library index before downloading a track again
+        from src.core import library
+        path = library.have(target)
+        if path is None:
+            return True
+        answer = QMessageBox.question(
+            self, "Already Downloaded",
+            f"This track is already in your library:\n{path}\n\nDownload it again?")
+        return answer == QMessageBox.Yes
     
     def update_youtube_info(self, info):
         # Format video info
@@ -400,66 +460,27 @@ class EmergencyBeatApp(QMainWindow):
         
         self.yt_info_label.setText(info_text)
         
-    def youtube_download_finished(self, file_path):
-        # Rename file if needed
-        custom_name = self.yt_name_input.text().strip()
-        if custom_name:
-            directory = os.path.dirname(file_path)
-            new_file_path = os.path.join(directory, f"{custom_name}.mp3")
-            
-            try:
-                os.rename(file_path, new_file_path)
-                file_path = new_file_path
-            except Exception as e:
-                print(f"[WARNING] Failed to rename file: {str(e)}")
-        
-        self.progress_bar_yt.setValue(100)
-        self.download_button_yt.setEnabled(True)
-        self.download_button_yt.setText("Download Audio from YouTube")
-        
-        msg_box = QMessageBox()
-        msg_box.setWindowTitle("Download Complete")
-        msg_box.setIcon(QMessageBox.Information)
-        msg_box.setText(f"Your audio has been successfully downloaded to:\n{file_path}")
-        
-        open_folder_button = msg_box.addButton("Open Folder", QMessageBox.ActionRole)
-        msg_box.addButton(QMessageBox.Ok)
-        
-        msg_box.exec_()
-        
-        if msg_box.clickedButton() == open_folder_button:
-            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(file_path)))
+        # Shown now when cached, otherwise once loaded
+        self.yt_thumbnail_url = info.get("thumbnail_url")
+        self.on_thumbnail(self.yt_thumbnail_url)
     
-    def download_finished(self, file_path):
-        self.progress_bar_beats.setValue(100)
-        self.download_button_beats.setEnabled(True)
-        self.download_button_beats.setText("Download Beat")
-        
-        msg_box = QMessageBox()
-        msg_box.setWindowTitle("Download Complete")
-        msg_box.setIcon(QMessageBox.Information)
-        msg_box.setText(f"Your beat has been successfully downloaded to:\n{file_path}")
-        
-        open_folder_button = msg_box.addButton("Open Folder", QMessageBox.ActionRole)
-        msg_box.addButton(QMessageBox.Ok)
-        
-        msg_box.exec_()
-        
-        if msg_box.clickedButton() == open_folder_button:
-            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(file_path)))
+    def on_thumbnail(self, url):
+        if url != self.yt_thumbnail_url:
+            return
+        pixmap = self.thumbnails.get(url) if url else None
+        if pixmap is not None:
+            self.yt_thumbnail_label.setPixmap(pixmap)
+        self.yt_thumbnail_label.setVisible(pixmap is not None)
+    
+    def show_waveform(self, entry):
+        # Finished downloads only; the view of the job's tab shows it
+        if entry.result is None or not entry.result.ok:
+            return
+        view = self.yt_waveform if entry.job.source == YOUTUBE else self.beats_waveform
+        view.show_file(entry.result.path)
     
     def show_error(self, error_message):
-        # Reset both progress bars
-        self.progress_bar_beats.setValue(0)
-        self.progress_bar_yt.setValue(0)
-        
-        # Reset both buttons
-        self.download_button_beats.setEnabled(True)
-        self.download_button_beats.setText("Download Beat")
-        
-        self.download_button_yt.setEnabled(True)
-        self.download_button_yt.setText("Download Audio from YouTube")
-        
+        # Download failures are shown in the queue; this is for input errors
         msg_box = QMessageBox()
         msg_box.setWindowTitle("Error")
         msg_box.setIcon(QMessageBox.Critical)
@@ -511,3 +532,15 @@ class EmergencyBeatApp(QMainWindow):
             }
         """)
         msg_box.exec_()
+
+    def preload(self):
+        # Once the window is up, load the download modules in the background
+        # so the first download does not wait for them
+        QTimer.singleShot(0, lambda: threading.Thread(target=_preload, name="preload",
+                                                      daemon=True).start())
+        # Folders are only scanned on request ("Scan folder..."): list what is indexed
+        QTimer.singleShot(0, self.library_panel.search)
+
+    def closeEvent(self, event):
+        self.queue.close()
+        super().closeEvent(event)
@@ -0,0 +1,271 @@
+"""
+Download queue view.
+JobTableModel exposes a JobQueue to a QTableView. The model polls the
+queue's changes() on a timer and applies them as one row insertion and one
+dataChanged range per tick, and the view only paints the visible rows, so
+thousands of queued jobs stay cheap to show and update. Thumbnails of
+YouTube videos are only requested for the rows being painted.
+"""
+import os
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                            QTableView, QHeaderView, QAbstractItemView, QSpinBox, QDoubleSpinBox,
+                            QStyledItemDelegate, QStyleOptionProgressBar, QApplication, QStyle,
+                            QFileDialog, QMessageBox)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSize, QTimer, QUrl, pyqtSignal
+from PyQt5.QtGui import QDesktopServices
+
+from src.core import jobqueue, links, ratelimit
+from src.core.batch import YOUTUBE, link_jobs
+from src.ui.thumbnails import ThumbnailLoader
+
+REFRESH_MS = 100
+THUMBNAIL_SIZE = (40, 22)
+
+STATE_LABELS = {
+    jobqueue.QUEUED: "Queued",
+    jobqueue.RUNNING: "Downloading",
+    jobqueue.PAUSED: "Paused",
+    jobqueue.LISTING: "Listing videos",
+    jobqueue.DONE: "Done",
+    jobqueue.FAILED: "Failed",
+    jobqueue.CANCELLED: "Cancelled",
+}
+PRIORITY_LABELS = {jobqueue.LOW: "Low", jobqueue.NORMAL: "Normal", jobqueue.HIGH: "High"}
+
+
+class JobTableModel(QAbstractTableModel):
+    COLUMNS = ("Source", "Name", "Priority", "Status", "Speed", "Progress")
+    PROGRESS_COLUMN = 5
+
+    info_signal = pyqtSignal(dict)  # video_info of the latest YouTube job
+    counts_signal = pyqtSignal(dict)  # jobs per state, after every change
+    done_signal = pyqtSignal(object)  # entry of the latest finished download
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.entries = []
+        self.thumbnail_urls = {}  # row -> thumbnail URL ("" for none)
+        self.thumbnail_rows = {}  # thumbnail URL -> rows showing it
+        self.thumbnails = ThumbnailLoader(THUMBNAIL_SIZE, self)
+        self.thumbnails.loaded_signal.connect(self.on_thumbnail)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_MS)
+
+    def refresh(self):
+        added, changed = self.queue.changes()
+        if added:
+            first = len(self.entries)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            self.entries.extend(added)
+            self.endInsertRows()
+        if changed:
+            rows = [entry.row for entry in changed if entry.row < len(self.entries)]
+            if rows:
+                self.dataChanged.emit(self.index(min(rows), 0),
+                                      self.index(max(rows), len(self.COLUMNS) - 1))
+            latest = max((e for e in changed if e.info), key=lambda e: e.row, default=None)
+            if latest is not None:
+                self.info_signal.emit(latest.info)
+            done = max((e for e in changed if e.state == jobqueue.DONE), key=lambda e: e.row, default=None)
+            if done is not None:
+                self.done_signal.emit(done)
+        if added or changed:
+            self.counts_signal.emit(self.queue.counts())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return "YouTube" if entry.job.source == YOUTUBE else "Beatstars"
+            if column == 1:
+                return entry.job.name or entry.title or entry.job.target
+            if column == 2:
+                return PRIORITY_LABELS.get(entry.priority, str(entry.priority))
+            if column == 3:
+                label = STATE_LABELS[entry.state]
+                if entry.collection and entry.listed:
+                    label += f" ({entry.listed} videos)"
+                if entry.state == jobqueue.FAILED and entry.error:
+                    label += f": {entry.error}"
+                return label
+            if column == 4:
+                return ratelimit.format_rate(entry.rate) if entry.state == jobqueue.RUNNING else ""
+            if column == self.PROGRESS_COLUMN:
+                return entry.percent
+        elif role == Qt.DecorationRole and column == 1:
+            # Only called for painted rows: scrolling fetches what comes into view
+            url = self.thumbnail_url(entry)
+            return self.thumbnails.get(url) if url else None
+        elif role == Qt.ToolTipRole:
+            if entry.result and entry.result.ok:
+                return entry.result.path
+            return entry.error or entry.job.target
+        return None
+
+    def entry(self, row):
+        return self.entries[row]
+
+    def thumbnail_url(self, entry):
+        url = self.thumbnail_urls.get(entry.row)
+        if url is None:
+            from src.core.thumbnails import video_thumbnail_url
+            video_id = links.video_id(entry.job.target) if entry.job.source == YOUTUBE else None
+            url = self.thumbnail_urls[entry.row] = video_thumbnail_url(video_id) if video_id else ""
+            if url:
+                self.thumbnail_rows.setdefault(url, set()).add(entry.row)
+        return url
+
+    def on_thumbnail(self, url):
+        rows = self.thumbnail_rows.get(url)
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 1), self.index(max(rows), 1), [Qt.DecorationRole])
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    """Paint the progress column as a progress bar"""
+
+    def paint(self, painter, option, index):
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 4, -2, -4)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = index.data() or 0
+        bar.text = f"{bar.progress}%"
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+
+
+class JobsPanel(QWidget):
+    """The queue table with its controls"""
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.model = JobTableModel(queue, self)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(8)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegateForColumn(JobTableModel.PROGRESS_COLUMN, ProgressDelegate(self.table))
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setShowGrid(False)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().hide()
+        # Fixed row heights and column modes that never measure every row
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(26)
+        self.table.setIconSize(QSize(*THUMBNAIL_SIZE))
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(1, QHeaderView.Stretch)
+        header.resizeSection(0, 80)
+        header.resizeSection(2, 70)
+        header.resizeSection(3, 160)
+        header.resizeSection(4, 90)
+        header.resizeSection(JobTableModel.PROGRESS_COLUMN, 110)
+        self.table.doubleClicked.connect(self.open_folder)
+        self.table.setStyleSheet("""
+            QTableView {
+                background-color: rgba(20, 20, 20, 0.5);
+                color: #f8f8f2;
+                border: 1px solid rgba(255, 255, 255, 0.1);
+                border-radius: 6px;
+                selection-background-color: #2196F3;
+                font-size: 13px;
+            }
+            QHeaderView::section {
+                background-color: rgba(30, 30, 30, 0.9);
+                color: #aaaaaa;
+                border: none;
+                padding: 4px;
+            }
+        """)
+        layout.addWidget(self.table)
+
+        controls = QHBoxLayout()
+        for text, slot in (("Pause", self.queue.pause), ("Resume", self.queue.resume),
+                           ("Cancel", self.queue.cancel), ("Retry", self.queue.retry)):
+            controls.addWidget(self.control_button(text, lambda _, slot=slot: slot(self.selected())))
+        controls.addWidget(self.control_button(
+            "Top priority", lambda _: self.queue.set_priority(self.selected(), jobqueue.HIGH)))
+        controls.addWidget(self.control_button("Import links...", lambda _: self.import_links()))
+        controls.addStretch()
+
+        controls.addWidget(QLabel("Limit:"))
+        self.limit_input = QDoubleSpinBox()
+        self.limit_input.setRange(0, 1000)
+        self.limit_input.setSingleStep(0.5)
+        self.limit_input.setSuffix(" MB/s")
+        self.limit_input.setSpecialValueText("Unlimited")
+        self.limit_input.setValue(ratelimit.LIMIT / (1024 * 1024))
+        self.limit_input.valueChanged.connect(lambda value: ratelimit.set_limit(value * 1024 * 1024))
+        controls.addWidget(self.limit_input)
+
+        controls.addWidget(QLabel("Parallel downloads:"))
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 64)
+        self.concurrency_input.setValue(self.queue.concurrency)
+        self.concurrency_input.valueChanged.connect(self.queue.set_concurrency)
+        controls.addWidget(self.concurrency_input)
+        layout.addLayout(controls)
+
+        self.summary_label = QLabel("No downloads yet")
+        self.summary_label.setStyleSheet("color: #bbbbbb; font-size: 12px;")
+        self.model.counts_signal.connect(self.update_summary)
+        layout.addWidget(self.summary_label)
+
+    def control_button(self, text, slot):
+        button = QPushButton(text)
+        button.setStyleSheet("padding: 6px 12px; font-size: 13px;")
+        button.clicked.connect(slot)
+        return button
+
+    def import_links(self):
+        """Queue every Beatstars/YouTube link of a text file or exported bookmarks"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Links", os.getcwd(),
+            "Text or bookmarks (*.txt *.html *.htm *.csv *.md);;All Files (*)")
+        if not path:
+            return
+        found = links.read(path)
+        if not found:
+            QMessageBox.information(self, "Import Links", "No Beatstars or YouTube links found.")
+            return
+        self.queue.add_many(link_jobs(found))
+
+    def selected(self):
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        return [self.model.entry(row) for row in sorted(rows)]
+
+    def update_summary(self, counts):
+        parts = [f"{counts[jobqueue.RUNNING]} downloading", f"{counts[jobqueue.QUEUED]} queued",
+                 f"{counts[jobqueue.DONE]} done"]
+        for state in (jobqueue.PAUSED, jobqueue.FAILED, jobqueue.CANCELLED):
+            if counts[state]:
+                parts.append(f"{counts[state]} {STATE_LABELS[state].lower()}")
+        self.summary_label.setText(", ".join(parts))
+
+    def open_folder(self, index):
+        result = self.model.entry(index.row()).result
+        if result and result.ok:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(result.path)))
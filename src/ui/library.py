@@ -0,0 +1,124 @@
+"""
+Library tab: search of everything downloaded so far.
+Queries run against the FTS5 index of src.core.library as the user types
+(debounced), which takes milliseconds even for 100k tracks. Downloads are
+added as they finish; "Scan folder..." indexes a folder of earlier files in
+the background, so those show up too.
+"""
+import os
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
+                             QFileDialog)
+from PyQt5.QtCore import QTimer, QUrl, pyqtSignal
+from PyQt5.QtGui import QDesktopServices
+
+SEARCH_DELAY_MS = 150
+SOURCE_LABELS = {"youtube": "YouTube", "beatstars": "Beatstars"}
+
+
+class LibraryPanel(QWidget):
+    COLUMNS = ("Title", "Channel", "Length", "Source", "File")
+
+    scanned_signal = pyqtSignal(list)  # totals of a background scan
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search downloads by title, channel, file name or link")
+        self.scan_button = QPushButton("Scan folder...")
+        self.scan_button.clicked.connect(self.choose_folder)
+        search_row = QHBoxLayout()
+        search_row.addWidget(self.search_input, 1)
+        search_row.addWidget(self.scan_button)
+        layout.addLayout(search_row)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setShowGrid(False)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setDefaultSectionSize(26)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        header.resizeSection(1, 120)
+        header.resizeSection(2, 70)
+        header.resizeSection(3, 90)
+        header.resizeSection(4, 140)
+        self.table.setStyleSheet("""
+            QTableWidget {
+                background-color: rgba(20, 20, 20, 0.5);
+                color: #f8f8f2;
+                border: 1px solid rgba(255, 255, 255, 0.1);
+                border-radius: 6px;
+                selection-background-color: #2196F3;
+                font-size: 13px;
+            }
+            QHeaderView::section {
+                background-color: rgba(30, 30, 30, 0.9);
+                color: #aaaaaa;
+                border: none;
+                padding: 4px;
+            }
+        """)
+        self.table.doubleClicked.connect(self.open_folder)
+        layout.addWidget(self.table, 1)
+
+        self.status_label = QLabel("")
+        self.status_label.setStyleSheet("color: #bbbbbb; font-size: 12px;")
+        layout.addWidget(self.status_label)
+
+        # One query once typing pauses, not one per key
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.search)
+        self.search_input.textChanged.connect(lambda _: self.search_timer.start())
+        self.scanned_signal.connect(self.on_scanned)
+
+    def choose_folder(self):
+        directory = QFileDialog.getExistingDirectory(self, "Scan folder", os.getcwd())
+        if directory:
+            self.scan(directory)
+
+    def scan(self, directory):
+        """Index the audio files of `directory` and its subfolders on a background thread"""
+        from src.core import library
+        if library.get_library() is None:
+            self.status_label.setText("The library is disabled")
+            return
+        self.status_label.setText("Scanning " + directory + "...")
+        # Emitted from the scanning thread, delivered on the UI thread
+        library.scan_in_background([directory], done=self.scanned_signal.emit)
+
+    def on_scanned(self, totals):
+        self.search()
+
+    def search(self):
+        from src.core import library
+        index = library.get_library()
+        if index is None:
+            return
+        self.entries = index.search(self.search_input.text().strip())
+        self.table.setRowCount(len(self.entries))
+        for row, entry in enumerate(self.entries):
+            values = (entry.title or "", entry.author or "", library.format_length(entry.length),
+                      SOURCE_LABELS.get((entry.key or "").split(":")[0], ""), os.path.basename(entry.path))
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(entry.path)
+                self.table.setItem(row, column, item)
+        total = index.count()
+        shown = f"{len(self.entries)} of {total}" if self.search_input.text().strip() else f"{total}"
+        self.status_label.setText(f"{shown} tracks in the library")
+
+    def open_folder(self, index):
+        path = self.entries[index.row()].path
+        QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(path)))
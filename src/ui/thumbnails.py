@@ -0,0 +1,75 @@
+"""
+Thumbnail loader for the views.
+get() answers from an in-memory LRU of QPixmaps, or starts loading the image
+and returns None; loaded_signal tells the view to ask again. Images come
+from src.core.thumbnails (disk cache, else the pooled client on the shared
+loop) and are decoded and scaled to a QImage on a worker thread; only the
+QPixmap conversion, which Qt requires on the GUI thread, happens here.
+
+Views only ask for what they paint, so a table asks for its visible rows.
+At most MAX_IN_FLIGHT loads run at once and the most recent requests are
+served first: rows scrolled past quickly are dropped from the backlog
+rather than fetched.
+"""
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QObject, QSize, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+MAX_PIXMAPS = 500
+MAX_IN_FLIGHT = 8
+MAX_PENDING = 64
+
+
+class ThumbnailLoader(QObject):
+    loaded_signal = pyqtSignal(str)  # url, now in memory
+    _decoded_signal = pyqtSignal(str, object)  # url, QImage or None; from the loop thread
+
+    def __init__(self, size, parent=None):
+        super().__init__(parent)
+        self.size = size if isinstance(size, QSize) else QSize(*size)
+        self.pixmaps = OrderedDict()  # url -> QPixmap, least recently used first
+        self.pending = OrderedDict()  # url -> None, oldest request first
+        self.in_flight = set()
+        self.failed = set()  # not retried while the application runs
+        self._decoded_signal.connect(self.on_decoded)
+
+    def get(self, url):
+        """The thumbnail at `url` if it is in memory, otherwise None (and load it)"""
+        pixmap = self.pixmaps.get(url)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(url)
+            return pixmap
+        if url and url not in self.in_flight and url not in self.failed:
+            self.pending[url] = None
+            self.pending.move_to_end(url)
+            while len(self.pending) > MAX_PENDING:
+                self.pending.popitem(last=False)
+            self.start_next()
+        return None
+
+    def start_next(self):
+        from src.core import thumbnails
+        while self.pending and len(self.in_flight) < MAX_IN_FLIGHT:
+            url, _ = self.pending.popitem()  # newest first: what is on screen now
+            self.in_flight.add(url)
+            future = thumbnails.load(url, self.decode)
+            future.add_done_callback(lambda future, url=url: self._decoded_signal.emit(
+                url, None if future.cancelled() or future.exception() else future.result()))
+
+    def decode(self, data):
+        # Worker thread: QImage, unlike QPixmap, can be used off the GUI thread
+        image = QImage.fromData(data)
+        if image.isNull():
+            return None
+        return image.scaled(self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    def on_decoded(self, url, image):
+        self.in_flight.discard(url)
+        if image is None:
+            self.failed.add(url)
+        else:
+            self.pixmaps[url] = QPixmap.fromImage(image)
+            while len(self.pixmaps) > MAX_PIXMAPS:
+                self.pixmaps.popitem(last=False)
+            self.loaded_signal.emit(url)
+        self.start_next()
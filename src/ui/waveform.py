@@ -0,0 +1,102 @@
+"""
+Waveform preview widget.
+Peaks are computed by src.core.waveform on a worker thread (the first
+preview of a track decodes it) and painted as one vertical line per pixel
+column. Resizing asks for the peaks of the new width, which are cached
+after the first time.
+"""
+import os
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QThread, QTimer, QLineF, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QPen
+
+RESIZE_DELAY_MS = 100
+
+
+class PeaksThread(QThread):
+    done_signal = pyqtSignal(str, int, object)  # path, width, peaks
+    error_signal = pyqtSignal(str, str)  # path, message
+
+    def __init__(self, path, width):
+        super().__init__()
+        self.path = path
+        self.width = width
+
+    def run(self):
+        from src.core import waveform
+        try:
+            self.done_signal.emit(self.path, self.width, waveform.peaks(self.path, self.width))
+        except Exception as e:
+            self.error_signal.emit(self.path, str(e))
+
+
+class WaveformView(QWidget):
+    """Min/max waveform of a downloaded file; hidden until one is shown"""
+
+    def __init__(self, color="#2196F3", parent=None):
+        super().__init__(parent)
+        self.color = QColor(color)
+        self.path = None
+        self.peaks = None
+        self.message = ""
+        self.threads = set()  # running workers, kept alive until they finish
+        # One request once a resize settles, not one per intermediate width
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_DELAY_MS)
+        self.resize_timer.timeout.connect(self.request)
+        self.setMinimumHeight(60)
+        self.setMaximumHeight(80)
+        self.hide()
+
+    def show_file(self, path):
+        """Show the waveform of `path` (no-op without NumPy or ffmpeg)"""
+        # Loaded on first use, not with the window
+        from src.core import waveform
+        if not path or not os.path.exists(path) or not waveform.available():
+            return
+        self.path = path
+        self.peaks = None
+        self.message = "Loading waveform..."
+        self.setToolTip(os.path.basename(path))
+        self.show()
+        self.request()
+
+    def request(self):
+        width = max(1, self.width())
+        thread = PeaksThread(self.path, width)
+        thread.done_signal.connect(self.on_peaks)
+        thread.error_signal.connect(self.on_error)
+        thread.finished.connect(lambda: self.threads.discard(thread))
+        self.threads.add(thread)
+        thread.start()
+
+    def on_peaks(self, path, width, peaks):
+        # Results for an earlier file or width are dropped
+        if path == self.path and width == max(1, self.width()):
+            self.peaks = peaks
+            self.message = ""
+            self.update()
+
+    def on_error(self, path, message):
+        if path == self.path:
+            self.message = "No waveform: " + (message.splitlines() or ["decoding failed"])[-1]
+            self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.path and event.size().width() != event.oldSize().width():
+            self.resize_timer.start()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(20, 20, 20, 128))
+        if self.peaks is None:
+            painter.setPen(QColor("#bbbbbb"))
+            painter.drawText(self.rect(), Qt.AlignCenter, self.message)
+            return
+        middle = self.height() / 2
+        scale = middle / 32768
+        painter.setPen(QPen(self.color, 1))
+        painter.drawLines([QLineF(x + 0.5, middle - high * scale, x + 0.5, middle - low * scale)
+                           for x, (low, high) in enumerate(self.peaks.tolist())])
@@ -1,14 +1,32 @@
 # Simple fixes for the pytubefix library
-import pytubefix
-import re
+# pytubefix is imported on first use (load_pytubefix), not when this module
+# is imported, so startup and Beatstars-only runs never pay for it.
 import logging
+import threading
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_applied = False
+
+def load_pytubefix():
+    """Import pytubefix with the fixes applied and return the module"""
+    import pytubefix
+    apply_pytube_fix()
+    return pytubefix
 
 def apply_pytube_fix():
-    """Apply fixes for pytubefix to handle YouTube's API changes"""
-    print("[DEBUG] Applying pytubefix fixes")
+    """Apply fixes for pytubefix to handle YouTube's API changes (once)"""
+    global _applied
+    with _lock:
+        if not _applied:
+            _patch()
+            _applied = True
+
+def _patch():
+    import pytubefix
+
+    log.debug("Applying pytubefix fixes")
     
     # Set modern User-Agent
     orig_get = pytubefix.request.get
@@ -25,23 +43,4 @@ def apply_pytube_fix():
     # Apply the patched request function
     pytubefix.request.get = new_get
     
-    # Make YouTube initialization more robust
-    original_init = pytubefix.YouTube.__init__
-    def patched_init(self, url, *args, **kwargs):
-        print(f"[DEBUG] Initializing YouTube with URL: {url}")
-        try:
-            original_init(self, url, *args, **kwargs)
-        except Exception as e:
-            print(f"[DEBUG] Initialization error: {str(e)}")
-            # Set minimal required attributes to prevent crashes
-            self.js = ""
-            self.js_url = ""
-            self.vid_info = {}
-            self.watch_html = ""
-            self.embed_html = ""
-            self.title = "Unknown Title"
-    
-    # Apply the patched init function
-    pytubefix.YouTube.__init__ = patched_init
-    
-    print("[DEBUG] Applied all pytubefix fixes")
\ No newline at end of file
+    log.debug("Applied all pytubefix fixes")
@@ -0,0 +1,192 @@
+"""
+Shared fixtures: an isolated cache folder and a local stub of the Beatstars
+stream redirect and CDN, and of the YouTube playlist pages.
+
+    /stream/<id>?size=N  302 to /file/<id> with the same query
+    /file/<id>?size=N    N bytes of payload(N), with Range support
+    /playlist            recorded first page of a 150-video playlist
+    /youtubei/v1/browse  (POST) its recorded continuation page
+
+Query options: ranges=0 (the file ignores Range and always sends 200),
+body=id3|wav (payload(N, body) instead of bare MPEG audio), type=MIME
+(Content-Type of the file, default audio/mpeg),
+stream_status/file_status=CODE (answer with that status instead),
+fail=K (the first K requests of that path answer 500),
+stall=S (wait S seconds before answering).
+"""
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+sys.path.insert(0, ROOT)
+
+# Read when the modules are imported: no store, library or user cache in tests
+os.environ["EMERGENCY_BEAT_CACHE"] = tempfile.mkdtemp(prefix="emergency-beat-tests-")
+os.environ["EMERGENCY_BEAT_STORE"] = "0"
+os.environ["EMERGENCY_BEAT_LIBRARY"] = "0"
+
+import pytest
+
+
+SIZE = 300 * 1024  # default beat size in the tests
+
+
+def use_stub(monkeypatch, stub, **options):
+    """Point Beatstars at the stub server; `options` go in the query (see above)"""
+    from src.core import beatstars
+    query = "&".join(f"{key}={value}" for key, value in dict(size=SIZE, **options).items())
+    monkeypatch.setattr(beatstars, "STREAM_URL", f"{stub.url}/stream/{{song_id}}?{query}")
+
+
+def audio(path):
+    """The body of a downloaded beat, after the tag reserved in front of it"""
+    from src.core import tags
+    with open(path, "rb") as f:
+        f.seek(tags.audio_offset(path))
+        return f.read()
+
+
+MPEG_FRAME = b"\xff\xfb\x90\x64"  # start of an MPEG-1 Layer III frame
+PRODUCER = "Producer"
+
+
+def producer_tag():
+    """An ID3v2.3 tag the beat came with: the producer as artist, 100 bytes of padding"""
+    data = b"\0" + PRODUCER.encode()
+    body = b"TPE1" + struct.pack(">I", len(data)) + b"\0\0" + data
+    size = len(body) + 100
+    return b"ID3\3\0\0" + bytes((size >> 21 & 0x7F, size >> 14 & 0x7F, size >> 7 & 0x7F, size & 0x7F)) \
+        + body + bytes(100)
+
+
+def payload(size, body="mp3"):
+    """The deterministic body of /file/<id>?size=`size`&body=`body`"""
+    prefix = {"mp3": MPEG_FRAME, "id3": producer_tag() + MPEG_FRAME, "wav": b"RIFF"}[body]
+    return (prefix + bytes(range(256)) * (size // 256 + 1))[:size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, url):
+        self.server.requests.append((url.path, self.headers.get("Range")))
+        with self.server.lock:
+            self.server.hits[url.path] += 1
+            return self.server.hits[url.path]
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        self.count(url)
+        self.server.posts.append((url.path, self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        if url.path == "/youtubei/v1/browse":
+            self.send_fixture("playlist_continuation.json", "application/json")
+        else:
+            self.send_empty(404)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        hits = self.count(url)
+        time.sleep(float(query.get("stall", 0)))
+        if hits <= int(query.get("fail", 0)):
+            return self.send_empty(500)
+        if url.path.startswith("/stream/"):
+            if "stream_status" in query:
+                return self.send_empty(int(query["stream_status"]))
+            location = "/file/" + url.path[len("/stream/"):]
+            self.send_empty(302, Location=location + ("?" + url.query if url.query else ""))
+        elif url.path.startswith("/file/"):
+            if "file_status" in query:
+                return self.send_empty(int(query["file_status"]))
+            self.send_file(payload(int(query.get("size", 1024)), query.get("body", "mp3")),
+                           query.get("ranges") != "0", query.get("type", "audio/mpeg"))
+        elif url.path == "/playlist":
+            self.send_fixture("playlist.html", "text/html; charset=utf-8")
+        else:
+            self.send_empty(404)
+
+    def send_empty(self, status, **headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_fixture(self, name, content_type):
+        with open(os.path.join(FIXTURES, name), "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_file(self, data, ranges, content_type):
+        start = 0
+        ranged = self.headers.get("Range")
+        if ranges and ranged and ranged.startswith("bytes="):
+            start = int(ranged[len("bytes="):].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        if ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{len(data)}"')
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.posts = []
+    server.hits = Counter()
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def stub(stub_server):
+    """The stub server with a fresh request log, and fresh circuit breakers and retry delays"""
+    from src.core import retry
+    stub_server.requests.clear()
+    stub_server.posts.clear()
+    stub_server.hits.clear()
+    retry._breakers.clear()
+    policy = retry.DEFAULT_POLICY
+    retry.configure(max_delay=0)
+    stub_server.url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    yield stub_server
+    retry.DEFAULT_POLICY = policy
+
+
+@pytest.fixture
+def youtube_stub(stub, monkeypatch):
+    """The stub server standing in for www.youtube.com in pytubefix's requests"""
+    from src.utils.pytube_fixes import load_pytubefix
+    request = load_pytubefix().request
+    execute = request._execute_request
+
+    def redirected(url, *args, **kwargs):
+        return execute(url.replace("https://www.youtube.com", stub.url, 1), *args, **kwargs)
+
+    monkeypatch.setattr(request, "_execute_request", redirected)
+    return stub
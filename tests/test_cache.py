@@ -0,0 +1,20 @@
+"""TTLCache saves: batched, and merged with what other processes wrote"""
+from src.core.cache import TTLCache
+
+
+def test_saves_are_batched_and_merged(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMERGENCY_BEAT_CACHE", str(tmp_path))
+    # Two processes sharing one cache file
+    first = TTLCache("shared", ttl=60)
+    second = TTLCache("shared", ttl=60)
+    first.set("a", 1)
+    first.set("gone", 0)
+    assert not (tmp_path / "shared.json").exists()
+    first.flush()
+    second.set("b", 2)
+    second.flush()
+    first.delete("gone")
+    first.flush()
+    fresh = TTLCache("shared", ttl=60)
+    assert (fresh.get("a"), fresh.get("b"), fresh.get("gone")) == (1, 2, None)
+    assert not [path for path in tmp_path.iterdir() if path.suffix == ".tmp"]
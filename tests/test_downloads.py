@@ -0,0 +1,50 @@
+"""Beatstars downloads against the stub server"""
+import pytest
+
+from conftest import SIZE, audio, payload, use_stub
+from src.core import beatstars, tags
+
+
+def test_download_beat(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub)
+    path = beatstars.download_beat("102", "beat", str(tmp_path))
+    assert audio(path) == payload(SIZE)
+    assert tags.read(path)[tags.BEAT_ID] == "102"
+
+
+def test_stalled_server_times_out(monkeypatch, stub):
+    import requests
+    from src.core import transport
+    monkeypatch.setattr(transport, "READ_TIMEOUT", 0.2)
+    with pytest.raises(requests.Timeout):
+        transport.get(f"{stub.url}/file/108?stall=2")
+
+
+def test_async_engine_segments_large_beats(monkeypatch, stub, tmp_path):
+    import asyncio
+    from src.core import segmented
+    size = 4 * 1024 * 1024
+    monkeypatch.setattr(beatstars, "STREAM_URL", f"{stub.url}/stream/{{song_id}}?size={size}")
+    monkeypatch.setattr(segmented, "THRESHOLD", 0)
+    path = asyncio.run(beatstars.download_beat_async("109", "beat", str(tmp_path)))
+    assert audio(path) == payload(size)
+    # The probe, then one request per connection at least
+    assert stub.hits["/file/109"] >= 1 + segmented.CONNECTIONS
+
+
+@pytest.mark.parametrize("content_type", ["audio/wav", "audio/mpeg"])
+def test_beat_that_is_not_mp3_is_not_tagged(monkeypatch, stub, tmp_path, content_type):
+    use_stub(monkeypatch, stub, body="wav", type=content_type)
+    path = beatstars.download_beat("110", "beat", str(tmp_path))
+    # Declared as WAV: no tag reserved; mislabelled: the tag is removed again
+    with open(path, "rb") as f:
+        assert f.read() == payload(SIZE, "wav")
+
+
+def test_beat_with_its_own_tag_keeps_one_tag(monkeypatch, stub, tmp_path):
+    from conftest import PRODUCER, producer_tag
+    use_stub(monkeypatch, stub, body="id3")
+    path = beatstars.download_beat("111", "beat", str(tmp_path))
+    assert audio(path) == payload(SIZE, "id3")[len(producer_tag()):]
+    values = tags.read(path)
+    assert (values[tags.BEAT_ID], values[tags.TITLE], values[tags.ARTIST]) == ("111", "beat", PRODUCER)
@@ -0,0 +1,66 @@
+"""Duplicate detection on synthetic audio (NumPy only, no ffmpeg)"""
+import pytest
+
+from src.core import fingerprint
+
+# Optional dependency: without NumPy downloads are not fingerprinted
+np = pytest.importorskip("numpy")
+
+SECONDS = 30
+
+
+def track(seed):
+    # Two random tones every quarter second over a little noise
+    rng = np.random.default_rng(seed)
+    n = fingerprint.SAMPLE_RATE * SECONDS
+    t = np.arange(n) / fingerprint.SAMPLE_RATE
+    samples = rng.normal(0, 0.01, n)
+    note = fingerprint.SAMPLE_RATE // 4
+    for start in range(0, n, note):
+        low, high = rng.uniform(fingerprint.LOW_HZ, fingerprint.HIGH_HZ, 2)
+        part = slice(start, start + note)
+        samples[part] += 0.3 * np.sin(2 * np.pi * low * t[part]) + 0.2 * np.sin(2 * np.pi * high * t[part])
+    return samples.astype(np.float32)
+
+
+def noisy(samples, level):
+    return samples + np.random.default_rng(0).normal(0, level, len(samples)).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = fingerprint.Index(str(tmp_path))
+    index.add("video:first", "first.mp3", fingerprint.compute(track(1)))
+    return index
+
+
+def test_same_audio_matches_at_its_offset(index):
+    # The second copy starts 20 frames into the first one
+    match = index.match(fingerprint.compute(track(1)[20 * fingerprint.HOP:]))
+    assert (match.key, match.offset) == ("video:first", 20)
+    assert match.ber < 0.05
+
+
+def test_other_audio_does_not_match(index):
+    assert index.match(fingerprint.compute(track(2))) is None
+
+
+def test_match_is_excluded_by_its_key(index):
+    assert index.match(fingerprint.compute(track(1)), exclude="video:first") is None
+
+
+def test_bit_errors_decide_the_match(index, monkeypatch):
+    # A noisier encoding shares the peaks but differs in many bits
+    copy = fingerprint.compute(noisy(track(1), 0.05))
+    match = index.match(copy)
+    assert match is not None and 0.1 < match.ber <= fingerprint.MAX_BER
+    monkeypatch.setattr(fingerprint, "MAX_BER", match.ber - 0.01)
+    assert index.match(copy) is None
+
+
+def test_unrelated_fingerprints_differ_in_half_the_bits():
+    a, b = fingerprint.compute(track(1)), fingerprint.compute(track(2))
+    assert fingerprint.bit_error_rate(a.prints, b.prints, 0) == pytest.approx(0.5, abs=0.05)
+    assert fingerprint.bit_error_rate(a.prints, a.prints, 0) == 0.0
+    # Too little overlap to compare
+    assert fingerprint.bit_error_rate(a.prints, a.prints, len(a.prints) - 10) == 1.0
@@ -0,0 +1,18 @@
+"""Library search"""
+from src.core import library
+
+
+def test_search_ranks_every_match(tmp_path):
+    index = library.Library(str(tmp_path / "index"))
+    old, new = tmp_path / "old", tmp_path / "new"
+    old.mkdir()
+    new.mkdir()
+    # The best match is indexed before thousands of weaker ones
+    (old / "night night night.mp3").write_bytes(b"0")
+    for i in range(3000):
+        (new / f"night rain {i}.mp3").write_bytes(str(i).encode())
+    index.scan(str(old))
+    index.scan(str(new))
+    found = index.search("night", limit=5)
+    assert len(found) == 5
+    assert found[0].path.endswith("night night night.mp3")
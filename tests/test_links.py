@@ -0,0 +1,109 @@
+"""Link classification and bulk extraction"""
+import pytest
+
+from src.core import links
+from src.core.links import BEAT, CHANNEL, PLAYLIST, VIDEO
+
+VIDEO_ID = "dQw4w9WgXcQ"
+LIST_ID = "PLstubPlaylist01"
+CHANNEL_ID = "UC" + "a1B2c3D4e5F6g7H8i9J0k-"
+
+
+@pytest.mark.parametrize("text, kind, id", [
+    # YouTube videos
+    (f"https://www.youtube.com/watch?v={VIDEO_ID}", VIDEO, VIDEO_ID),
+    (f"https://youtube.com/watch?feature=share&v={VIDEO_ID}&t=42", VIDEO, VIDEO_ID),
+    (f"https://m.youtube.com/watch?v={VIDEO_ID}", VIDEO, VIDEO_ID),
+    (f"https://music.youtube.com/watch?v={VIDEO_ID}&list={LIST_ID}", VIDEO, VIDEO_ID),
+    (f"https://youtu.be/{VIDEO_ID}?si=abc", VIDEO, VIDEO_ID),
+    (f"https://www.youtube.com/shorts/{VIDEO_ID}", VIDEO, VIDEO_ID),
+    (f"https://www.youtube.com/live/{VIDEO_ID}", VIDEO, VIDEO_ID),
+    (f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}", VIDEO, VIDEO_ID),
+    (f"  youtube.com/watch?v={VIDEO_ID}  ", VIDEO, VIDEO_ID),
+    # Collections
+    (f"https://www.youtube.com/playlist?list={LIST_ID}", PLAYLIST, LIST_ID),
+    (f"https://www.youtube.com/embed/videoseries?list={LIST_ID}", PLAYLIST, LIST_ID),
+    ("https://www.youtube.com/@Some.Producer", CHANNEL, "@Some.Producer"),
+    (f"https://www.youtube.com/channel/{CHANNEL_ID}", CHANNEL, f"channel/{CHANNEL_ID}"),
+    ("https://www.youtube.com/c/SomeProducer/videos", CHANNEL, "c/SomeProducer"),
+    ("https://www.youtube.com/user/someproducer", CHANNEL, "user/someproducer"),
+    # Beatstars
+    ("https://www.beatstars.com/beat/dark-trap-beat-12345678", BEAT, "12345678"),
+    ("https://producer.beatstars.com/beat/12345678?ref=home", BEAT, "12345678"),
+    ("https://main.v2.beatstars.com/stream?id=12345678&return=audio", BEAT, "12345678"),
+    ("12345678", BEAT, "12345678"),
+])
+def test_classify(text, kind, id):
+    link = links.classify(text)
+    assert (link.kind, link.id) == (kind, id)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "hello world",
+    "12345",  # too short for a bare beat ID
+    "track 12345678",  # an ID only counts at the start of a line
+    f"https://notyoutube.com/watch?v={VIDEO_ID}",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}x",  # 12 characters
+    f"https://www.youtube.com/watch?vv={VIDEO_ID}",
+    f"https://notyoutu.be/{VIDEO_ID}",
+    "https://www.beatstars.com/beat/no-id-here",
+    "https://fakebeatstars.com/beat/12345678",
+    "https://www.youtube.com/playlist?list=short",
+    "https://www.youtube.com/feed/subscriptions",
+])
+def test_not_a_link(text):
+    assert links.classify(text) is None
+
+
+@pytest.mark.parametrize("text, ids", [
+    # Duplicates are dropped, in order of first appearance
+    (f"youtu.be/{VIDEO_ID}\nhttps://www.youtube.com/watch?v={VIDEO_ID}\n12345678\n12345678",
+     [VIDEO_ID, "12345678"]),
+    # The same beat through its page and its stream URL
+    ("beatstars.com/beat/name-12345678 beatstars.com/stream?id=12345678", ["12345678"]),
+    # Channel handles are case-insensitive, video IDs are not
+    (f"youtube.com/@Prod youtube.com/@prod youtu.be/{VIDEO_ID} youtu.be/{VIDEO_ID.lower()}",
+     ["@Prod", VIDEO_ID, VIDEO_ID.lower()]),
+    # Markdown and prose around the links
+    (f"[beat](https://youtu.be/{VIDEO_ID}), (see beatstars.com/beat/87654321).",
+     [VIDEO_ID, "87654321"]),
+    ("nothing to see here", []),
+])
+def test_extract(text, ids):
+    assert [link.id for link in links.extract(text)] == ids
+
+
+@pytest.mark.parametrize("amp", ["&amp;", "&#38;", "&#x26;"])
+def test_escaped_hrefs(amp):
+    html = f'<a href="https://www.youtube.com/watch?feature=share{amp}v={VIDEO_ID}">x</a>'
+    assert links.extract(html) == [links.Link(VIDEO, VIDEO_ID)]
+
+
+def test_iter_links_keeps_duplicates():
+    text = f"youtu.be/{VIDEO_ID} youtu.be/{VIDEO_ID}"
+    assert len(list(links.iter_links(text))) == 2
+
+
+@pytest.mark.parametrize("name, content, ids", [
+    ("jobs.txt", "12345678\n# a comment\nyoutu.be/" + VIDEO_ID + "\n", ["12345678", VIDEO_ID]),
+    # Numbers starting a line of HTML are page content, not beat IDs
+    ("bookmarks.html", '<DL>\n12345678\n<DT><A HREF="https://youtu.be/' + VIDEO_ID + '">x</A>\n',
+     [VIDEO_ID]),
+    ("export.txt", '<!DOCTYPE NETSCAPE-Bookmark-file-1>\n12345678\n', []),
+])
+def test_read(tmp_path, name, content, ids):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    assert [link.id for link in links.read(str(path))] == ids
+
+
+@pytest.mark.parametrize("text, beat, video", [
+    ("https://www.beatstars.com/beat/12345678", "12345678", None),
+    ("1234", "1234", None),  # short IDs alone are accepted
+    (f"https://youtu.be/{VIDEO_ID}", None, VIDEO_ID),
+    ("not a link", None, None),
+])
+def test_ids(text, beat, video):
+    assert links.beat_id(text) == beat
+    assert links.video_id(text) == video
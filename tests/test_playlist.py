@@ -0,0 +1,62 @@
+"""Playlist expansion: recorded YouTube pages served by the stub server"""
+import itertools
+import json
+import threading
+
+from src.core import batch, playlist, youtube
+
+PLAYLIST = "https://www.youtube.com/playlist?list=PLstubPlaylist01"
+VIDEO_IDS = [f"v{n:010d}" for n in range(150)]
+
+
+def cached(video_ids):
+    # Metadata and manifest already known: resolving a video needs no watch page
+    for video_id in video_ids:
+        youtube.METADATA_CACHE.set(video_id, {"title": f"Beat {video_id}"})
+        youtube.MANIFEST_CACHE.set(video_id, [{"itag": 251, "url": f"https://example.invalid/{video_id}"}])
+
+
+def test_listing_follows_the_continuation(youtube_stub):
+    assert list(playlist.iter_video_ids(PLAYLIST)) == VIDEO_IDS
+    assert youtube_stub.hits["/playlist"] == 1
+    [(path, body)] = youtube_stub.posts
+    assert path == "/youtubei/v1/browse"
+    assert json.loads(body)["continuation"] == "4qmFsgPAGE2"
+
+
+def test_jobs_start_before_the_listing_ends(youtube_stub):
+    cached(VIDEO_IDS)
+    jobs = batch.expand_jobs([batch.Job(batch.YOUTUBE, PLAYLIST)], workers=2)
+    first = next(jobs)
+    # One video is out while the second page has not even been requested
+    assert first.source == batch.YOUTUBE and first.error is None
+    assert youtube_stub.hits["/youtubei/v1/browse"] == 0
+    rest = list(jobs)
+    assert sorted(job.target for job in [first] + rest) == sorted(map(playlist.video_url, VIDEO_IDS))
+    assert youtube_stub.hits["/youtubei/v1/browse"] == 1
+
+
+def test_videos_resolve_while_listing(monkeypatch):
+    listed = []
+    lock = threading.Lock()
+
+    def video_ids():
+        for n in itertools.count():
+            with lock:
+                listed.append(n)
+            yield f"video{n}"
+
+    def load_video(video_id):
+        if video_id == "video1":
+            raise youtube.UnavailableError("Private video")
+        return {"title": video_id}, [], False
+
+    monkeypatch.setattr(youtube, "load_video", load_video)
+    results = playlist.resolve(video_ids(), workers=2)
+    first = list(itertools.islice(results, 4))
+    results.close()
+    # Results arrive before the (endless) listing ends, and only a few IDs ahead are taken
+    assert len(listed) <= 4 + 2 * 2
+    errors = {video_id: error for video_id, _, error in first if error is not None}
+    assert all(isinstance(error, youtube.UnavailableError) for error in errors.values())
+    assert all(meta == {"title": video_id} for video_id, meta, error in first if error is None)
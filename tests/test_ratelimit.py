@@ -0,0 +1,122 @@
+"""Fair sharing of bandwidth caps, on explicit clocks"""
+import collections
+
+import pytest
+
+from src.core import ratelimit
+
+RATE = 1000 * 1000
+
+
+def test_token_bucket_goes_into_debt():
+    bucket = ratelimit.TokenBucket(RATE, now=0.0)
+    # The burst is free, what goes over it is paid back at the rate
+    assert bucket.take(bucket.capacity, 0.0) == 0.0
+    assert bucket.take(RATE // 2, 0.0) == pytest.approx(0.5)
+    assert bucket.take(RATE // 2, 0.5) == pytest.approx(0.5)
+
+
+def test_new_jobs_get_equal_shares():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    for job_id in ("a", "b", "c", "d"):
+        limit.take(job_id, 1000, now=0.0)
+    assert [share.bucket.rate for share in limit.shares.values()] == [RATE / 4] * 4
+    assert limit.chunk_rate() == RATE / 4
+
+
+def test_job_capped_by_a_slow_server_leaves_the_rest_to_the_others():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    limit.take("slow", 1000, now=0.0)
+    limit.take("fast", 1000, now=0.0)
+    # "slow" reads 100 KB/s and never waits; "fast" runs into its share
+    assert limit.take("fast", 100 * 1000, now=0.1) == 0.0
+    assert limit.take("fast", 100 * 1000, now=0.2) > 0.0
+    assert limit.take("slow", 49 * 1000, now=0.25) == 0.0
+    limit.take("fast", 1000, now=0.5)  # rebalances
+    slow, fast = limit.shares["slow"], limit.shares["fast"]
+    assert slow.measured == pytest.approx(100 * 1000)
+    assert fast.measured is None
+    assert slow.bucket.rate == pytest.approx(100 * 1000 * ratelimit.GROWTH)
+    assert fast.bucket.rate == pytest.approx(RATE - slow.bucket.rate)
+
+
+def test_small_jobs_keep_the_minimum_share():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    limit.take("idle", 10, now=0.0)
+    limit.take("busy", 10, now=0.0)
+    limit.take("busy", 100 * 1000, now=0.1)
+    limit.take("idle", 10, now=0.4)
+    limit.take("busy", 10, now=0.5)
+    assert limit.shares["idle"].bucket.rate == ratelimit.MIN_SHARE
+    assert limit.shares["busy"].bucket.rate == pytest.approx(200 * 1000 * ratelimit.GROWTH, rel=1e-3)
+
+
+def test_idle_job_loses_its_share():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    limit.take("gone", 1000, now=0.0)
+    limit.take("left", 1000, now=0.0)
+    limit.take("left", 1000, now=ratelimit.IDLE_AFTER)
+    # Seen IDLE_AFTER ago: kept, one instant later it is dropped
+    assert set(limit.shares) == {"gone", "left"}
+    limit.take("left", 1000, now=ratelimit.IDLE_AFTER + 1.0)
+    assert set(limit.shares) == {"left"}
+    assert limit.chunk_rate() == RATE
+
+
+def test_waiting_job_is_not_idle():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    wait = limit.take("late", 2 * RATE, now=0.0)
+    # Still sleeping off its debt when the others rebalance
+    limit.take("other", 1000, now=wait + ratelimit.IDLE_AFTER - 0.5)
+    assert "late" in limit.shares
+
+
+def test_set_rate_reassigns_the_shares():
+    limit = ratelimit.SharedLimit(RATE, now=0.0)
+    limit.take("a", 1000, now=0.0)
+    limit.take("b", 1000, now=0.0)
+    limit.set_rate(RATE // 2, now=0.1)
+    assert [share.bucket.rate for share in limit.shares.values()] == [RATE / 4] * 2
+
+
+@pytest.fixture
+def transfers(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_transfers", {})
+    monkeypatch.setattr(ratelimit, "_rates", collections.deque(maxlen=ratelimit.STATS_JOBS))
+    return ratelimit._transfers
+
+
+@pytest.mark.parametrize("rates, fairness", [
+    ([100, 100, 100], "1.00"),
+    ([100, 300], "0.80"),
+    ([100, 0.0001, 0.0001, 0.0001], "0.25"),
+])
+def test_fairness_is_jain_index(transfers, rates, fairness):
+    ratelimit._rates.extend(rate * 1024 for rate in rates)
+    text = ratelimit.format_stats()
+    assert f"{len(rates)} jobs" in text
+    assert text.split("fairness ")[1].startswith(fairness)
+
+
+def test_no_stats_without_transfers(transfers):
+    assert ratelimit.format_stats() == "per-job throughput: no data"
+
+
+def test_finished_job_moves_to_the_stats(transfers):
+    with ratelimit.job("j1"):
+        ratelimit.delay(1000, "example.com")
+        with ratelimit.job("j1"):
+            pass
+        # Leaving a nested block of the same job does not end its transfer
+        assert "j1" in transfers
+        transfers["j1"][2] = transfers["j1"][1] + 0.5
+        assert ratelimit.stats() == [2000]
+    assert transfers == {}
+    assert list(ratelimit._rates) == [2000]
+
+
+def test_job_that_never_waited_leaves_no_rate(transfers):
+    with ratelimit.job("j2"):
+        ratelimit.delay(1000, "example.com")
+    assert transfers == {}
+    assert len(ratelimit._rates) == 0
@@ -0,0 +1,29 @@
+"""Redirect-only resolution of Beatstars stream URLs and the resolved URL cache"""
+from conftest import SIZE, audio, payload, use_stub
+from src.core import beatstars
+
+
+def test_resolve_follows_the_redirect(monkeypatch, stub):
+    use_stub(monkeypatch, stub)
+    url = beatstars.resolve(beatstars.STREAM_URL.format(song_id="101"))
+    assert url.startswith(f"{stub.url}/file/101?")
+    # Only the redirect was requested, not the media
+    assert [path for path, _ in stub.requests] == ["/stream/101"]
+
+
+def test_resolved_urls_are_cached(monkeypatch, stub):
+    use_stub(monkeypatch, stub)
+    url, from_cache = beatstars.resolve_beat("121")
+    assert not from_cache
+    assert beatstars.resolve_beat("121") == (url, True)
+    assert stub.hits["/stream/121"] == 1
+
+
+def test_rejected_cached_url_is_resolved_again(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub)
+    # An expired signed URL from an earlier run
+    beatstars.RESOLVE_CACHE.set("122", {"url": f"{stub.url}/file/122?size={SIZE}&file_status=403",
+                                        "seconds": 0.1})
+    path = beatstars.download_beat("122", "beat", str(tmp_path))
+    assert audio(path) == payload(SIZE)
+    assert stub.hits["/stream/122"] == 1
@@ -0,0 +1,31 @@
+"""Resuming interrupted downloads from their .part file with a Range request"""
+from conftest import SIZE, audio, payload, use_stub
+from src.core import beatstars, tags
+from src.core.writer import StreamWriter
+
+
+def partial(tmp_path, song_id, data):
+    # An interrupted earlier attempt: .part file plus its resume sidecar
+    name = str(tmp_path / f"{song_id}.mp3")
+    writer = StreamWriter(name, SIZE, key=f"beatstars:{song_id}",
+                          header=tags.header(name, beatstars.beat_tags(song_id, name)))
+    writer.open()
+    writer.write(data)
+    writer.abort()
+
+
+def test_resume_with_a_range_request(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub)
+    partial(tmp_path, "103", payload(SIZE)[:SIZE // 2])
+    path = beatstars.download_beat("103", "103", str(tmp_path))
+    assert ("/file/103", f"bytes={SIZE // 2}-") in stub.requests
+    assert audio(path) == payload(SIZE)
+
+
+def test_restart_when_the_server_ignores_the_range(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub, ranges=0)
+    # Garbage that must not survive: the 200 answer replaces it from byte 0
+    partial(tmp_path, "104", b"x" * (SIZE // 2))
+    path = beatstars.download_beat("104", "104", str(tmp_path))
+    assert ("/file/104", f"bytes={SIZE // 2}-") in stub.requests
+    assert audio(path) == payload(SIZE)
@@ -0,0 +1,90 @@
+"""Retries of transient failures and per-host circuit breakers"""
+import time
+
+import pytest
+
+from conftest import SIZE, audio, payload, use_stub
+from src.core import beatstars, retry
+from src.core.errors import CircuitOpenError, ForbiddenError, NotFoundError, TransientError, UnavailableError
+
+
+def test_server_errors_are_retried(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub, fail=2)
+    path = beatstars.download_beat("105", "beat", str(tmp_path))
+    assert audio(path) == payload(SIZE)
+    # Both the redirect and the file failed twice before answering
+    assert stub.hits["/file/105"] == 3
+    assert stub.hits["/stream/105"] >= 3
+
+
+def test_missing_beat(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub, stream_status=404)
+    with pytest.raises(NotFoundError):
+        beatstars.download_beat("106", "beat", str(tmp_path))
+    # Not retried: a 404 will not go away
+    assert stub.hits["/stream/106"] == 1
+
+
+def test_protected_beat(monkeypatch, stub, tmp_path):
+    use_stub(monkeypatch, stub, file_status=403)
+    with pytest.raises(ForbiddenError):
+        beatstars.download_beat("107", "beat", str(tmp_path))
+    assert not list(tmp_path.iterdir())
+
+
+def open_circuit(monkeypatch, host):
+    # A circuit whose cool-down just ended: the next request is its trial
+    monkeypatch.setattr(retry, "_breakers", {})
+    breaker = retry.breaker(host)
+    for _ in range(breaker.threshold):
+        breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.open_until = time.monotonic() - 1
+    return breaker
+
+
+def test_trial_answered_by_the_host_closes_the_circuit(monkeypatch):
+    breaker = open_circuit(monkeypatch, "trial.example")
+    with pytest.raises(UnavailableError):
+        with retry.circuit("trial.example"):
+            raise UnavailableError("Private video")
+    assert not breaker.trial and not breaker.open_until
+    retry.breaker("trial.example").before()
+
+
+def test_cancelled_trial_lets_the_next_one_through(monkeypatch):
+    class Cancelled(BaseException):
+        pass
+
+    breaker = open_circuit(monkeypatch, "cancel.example")
+    with pytest.raises(Cancelled):
+        with retry.circuit("cancel.example"):
+            raise Cancelled()
+    assert not breaker.trial
+    breaker.before()
+    assert breaker.trial
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_empty_budget_is_counted(engine):
+    import asyncio
+    from src.core import aio
+    # No token to spend (the first attempt earns only a fraction of one)
+    policy = retry.RetryPolicy(base_delay=0, budget=retry.RetryBudget(minimum=0))
+
+    def fail():
+        raise TransientError("503 Service Unavailable")
+
+    async def fail_async():
+        fail()
+
+    before = retry.stats()
+    with pytest.raises(TransientError):
+        if engine == "threads":
+            retry.call(fail, policy)
+        else:
+            asyncio.run(aio.call(fail_async, policy))
+    after = retry.stats()
+    assert after["budget_exhausted"] == before["budget_exhausted"] + 1
+    assert after["retries"] == before["retries"]
@@ -0,0 +1,108 @@
+"""Segmented downloads: range splitting and work stealing"""
+import threading
+import time
+
+import pytest
+
+from src.core import segmented
+from src.core.writer import StreamWriter
+
+MB = 1024 * 1024
+CHUNK = 64 * 1024
+
+
+def body(size):
+    return bytes(i % 251 for i in range(size))
+
+
+class Response:
+    """Streamed response of bytes [start, end) of `data`, `delay` seconds per chunk"""
+
+    def __init__(self, data, start, end, delay=0.0):
+        self.data = data
+        self.start = start
+        self.end = end
+        self.delay = delay
+        self.sent = 0
+        self.status_code = 206
+        self.url = "http://example.com/file"
+        self.raw = None
+        self.headers = {"Content-Range": f"bytes {start}-{end - 1}/{len(data)}"}
+
+    def iter_content(self, chunk_size):
+        for pos in range(self.start, self.end, CHUNK):
+            time.sleep(self.delay)
+            chunk = self.data[pos:min(pos + CHUNK, self.end)]
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Server:
+    """fetch() of a file; the connection reading from byte 0 is slow"""
+
+    def __init__(self, size, delay=0.0):
+        self.data = body(size)
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def fetch(self, start, end):
+        response = Response(self.data, start, end, self.delay if start == 0 else 0.0)
+        with self._lock:
+            self.requests.append(response)
+        return response
+
+
+def download(tmp_path, server, connections):
+    path = str(tmp_path / "out.bin")
+    with StreamWriter(path, len(server.data)) as writer:
+        segmented.SegmentedDownload(writer, server.fetch, connections=connections).run()
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_ranges_are_split_per_connection(tmp_path):
+    server = Server(8 * MB)
+    assert download(tmp_path, server, 4) == server.data
+    assert sorted(r.start for r in server.requests) == [0, 2 * MB, 4 * MB, 6 * MB]
+
+
+def test_idle_connection_steals_from_the_slow_one(tmp_path):
+    # Two connections: [0, 4M) is slow, [4M, 8M) is done at once
+    server = Server(8 * MB, delay=0.005)
+    assert download(tmp_path, server, 2) == server.data
+    slow, fast = sorted(server.requests[:2], key=lambda r: r.start)
+    stolen = server.requests[2:]
+    assert (slow.start, fast.start) == (0, 4 * MB)
+    assert stolen, "the idle connection never stole a range"
+    # The slow connection stopped (within a chunk) where the stolen range starts
+    assert stolen[0].start < 4 * MB
+    assert slow.sent - CHUNK < stolen[0].start <= slow.sent + CHUNK
+    # Only the chunk in flight when the range was stolen is read twice
+    assert sum(r.sent for r in server.requests) <= 8 * MB + CHUNK
+
+
+def test_small_ranges_are_not_stolen(tmp_path):
+    server = Server(3 * MB, delay=0.001)
+    assert download(tmp_path, server, 2) == server.data
+    # Each half is under 2 * MIN_SEGMENT: nothing left worth splitting
+    assert len(server.requests) == 2
+
+
+@pytest.mark.parametrize("remaining, accept_ranges, connections, split", [
+    (segmented.THRESHOLD, True, None, True),
+    (segmented.THRESHOLD - 1, True, None, False),
+    (segmented.THRESHOLD, False, None, False),
+    (segmented.THRESHOLD, True, 1, False),
+])
+def test_should_split(remaining, accept_ranges, connections, split):
+    assert segmented.should_split(remaining, accept_ranges, connections) == split
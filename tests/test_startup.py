@@ -0,0 +1,22 @@
+"""Startup budgets of benchmarks/bench_startup.py, checked on every test run"""
+import pytest
+
+from benchmarks import bench_startup
+
+RUNS = 3
+
+
+@pytest.fixture(scope="module")
+def jobs_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("startup") / "jobs.txt"
+    path.write_text("# no jobs: measures startup only\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("scenario", list(bench_startup.SCENARIOS))
+def test_startup(scenario, jobs_file):
+    budget, forbidden = bench_startup.SCENARIOS[scenario]
+    result = bench_startup.run(scenario, jobs_file, RUNS)
+    # Headless runs never load Qt; the window shows before the download modules load
+    assert [module for module in forbidden if module in result["loaded"]] == []
+    assert result["median_ms"] <= budget
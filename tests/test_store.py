@@ -0,0 +1,70 @@
+"""Content-addressed download store: cloning and eviction"""
+import os
+
+import pytest
+
+from src.core import store
+
+KB = 1024
+
+
+def download(tmp_path, name, size, fill=b"a"):
+    path = tmp_path / "downloads" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(fill * size)
+    return str(path)
+
+
+@pytest.fixture
+def local(tmp_path):
+    return store.Store(root=str(tmp_path / "store"), max_bytes=25 * KB)
+
+
+def test_materialize_clones_an_independent_copy(local, tmp_path):
+    local.add(download(tmp_path, "beat.mp3", KB), "beatstars:1")
+    target = tmp_path / "elsewhere" / "copy.mp3"
+    assert local.materialize("beatstars:1", str(target)) in ("reflink", "copy")
+    assert target.read_bytes() == b"a" * KB
+    # Editing the copy (tags) leaves the stored object alone
+    target.write_bytes(b"b" * KB)
+    path, name = local.lookup("beatstars:1")
+    assert (open(path, "rb").read(), name) == (b"a" * KB, "beat.mp3")
+
+
+def test_same_content_is_stored_once(local, tmp_path):
+    first = local.add(download(tmp_path, "one.mp3", KB), "beatstars:1")
+    second = local.add(download(tmp_path, "two.mp3", KB), "youtube:x:source")
+    assert first == second
+    assert local.size() == KB
+    assert local.lookup("youtube:x:source")[1] == "two.mp3"
+
+
+def test_unknown_key_is_not_served(local, tmp_path):
+    assert local.materialize("beatstars:404", str(tmp_path / "missing.mp3")) is None
+    assert not (tmp_path / "missing.mp3").exists()
+
+
+def test_least_recently_used_object_is_evicted(local, tmp_path):
+    local.add(download(tmp_path, "old.mp3", 10 * KB, b"o"), "old")
+    local.add(download(tmp_path, "used.mp3", 10 * KB, b"u"), "used")
+    # "old" was added first but used last: "used" is the eviction candidate now
+    assert local.lookup("old")
+    local.add(download(tmp_path, "new.mp3", 10 * KB, b"n"), "new")
+    assert local.lookup("used") is None
+    assert local.lookup("old") and local.lookup("new")
+    assert local.size() == 20 * KB
+
+
+def test_object_removed_behind_our_back(local, tmp_path):
+    local.add(download(tmp_path, "beat.mp3", KB), "beatstars:1")
+    path, _ = local.lookup("beatstars:1")
+    os.remove(path)
+    assert local.lookup("beatstars:1") is None
+    assert local.size() == 0
+
+
+def test_hardlink_shares_the_stored_data(local, tmp_path):
+    local.add(download(tmp_path, "beat.mp3", KB), "beatstars:1")
+    target = tmp_path / "linked.mp3"
+    assert store.clone_file(local.lookup("beatstars:1")[0], str(target), hardlink=True) == "hardlink"
+    assert os.stat(target).st_nlink == 2
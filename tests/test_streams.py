@@ -0,0 +1,36 @@
+"""Stream selection from a cached manifest"""
+import pytest
+
+from src.core import streams
+
+
+def stream(itag, abr=None, mime="audio/webm", codec="opus", filesize=0, resolution=None, video=False):
+    return {"itag": itag, "abr": abr, "mime_type": mime, "audio_codec": codec, "filesize": filesize,
+            "progressive": video, "audio": True, "video": video, "resolution": resolution}
+
+
+MANIFEST = [
+    stream(18, mime="video/mp4", codec="mp4a.40.2", resolution="360p", video=True),
+    stream(140, "128kbps", "audio/mp4", "mp4a.40.2", filesize=4_000_000),
+    stream(249, "50kbps", filesize=1_500_000),
+    stream(251, "160kbps", filesize=5_000_000),
+    stream(139, "48kbps", "audio/mp4", "mp4a.40.5", filesize=1_400_000),
+]
+
+
+@pytest.mark.parametrize("options, itags", [
+    ({}, [251, 249, 140, 139, 18]),
+    # The preferred format wins over a higher bitrate of the next one
+    ({"prefer": ("m4a", "opus")}, [140, 139, 251, 249, 18]),
+    ({"prefer": ("m4a",)}, [140, 139, 251, 249, 18]),
+    ({"target_abr": 64}, [249, 251, 139, 140, 18]),
+    ({"max_abr": 130}, [249, 140, 139, 18]),
+    ({"max_filesize": 4_500_000, "allow_progressive": False}, [249, 140, 139]),
+])
+def test_rank(options, itags):
+    assert [s["itag"] for s in streams.rank(MANIFEST, streams.StreamPolicy(**options))] == itags
+
+
+def test_select_without_a_qualifying_stream():
+    policy = streams.StreamPolicy(max_abr=10, allow_progressive=False)
+    assert streams.select(MANIFEST, policy) == (None, [])